@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+import streamlit as st
+
+logger = logging.getLogger("async_runtime")
+
+class BackgroundLoop:
+    """
+    One asyncio event loop running forever in a daemon thread.
+    Script reruns submit coroutines to it instead of creating a loop per run, so
+    loop-bound state (aiohttp sessions, limiters) survives across reruns and sessions.
+    """
+
+    def __init__(self, name: str = "profiler-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        """Submit a coroutine and block the calling thread until it finishes (cancelled on timeout)."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def call(self, func, *args):
+        """Run a plain callable on the loop thread (for objects that must be created there)."""
+        async def wrapper():
+            return func(*args)
+        return self.run(wrapper())
+
+@st.cache_resource
+def get_background_loop() -> BackgroundLoop:
+    """Single background event loop per process."""
+    return BackgroundLoop()
+
+def run_async(coro, timeout: float = None):
+    """Shortcut for get_background_loop().run(...)."""
+    return get_background_loop().run(coro, timeout)
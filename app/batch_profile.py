@@ -0,0 +1,397 @@
+"""
+Headless batch profiling: run the profile pipeline over a CSV of organization names.
+
+    python app/batch_profile.py orgs.csv -o profiles.jsonl --workers 8
+    python app/batch_profile.py orgs.csv -o profiles/ --format parquet
+
+Records are written as each org finishes, so the output doubles as the checkpoint:
+re-running the same command skips rows already in it and carries on where a crashed
+or interrupted run stopped.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import concurrent.futures
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from config import settings
+from data_sources.cms_utils import load_cms_general_info
+from async_runtime import get_background_loop
+from profile_engine import profile_org, profile_record
+from source_ledger import SourceLedger, get_source_ledger
+from profile_store import ProfileStore, get_profile_store
+from review_store import ReviewStore, get_review_store
+
+logger = logging.getLogger("batch_profile")
+
+# Input columns recognised (lower-cased, first match wins)
+NAME_COLUMNS = ("org_name", "organization", "name", "facility name", "hospital name", "hospital")
+OPTIONAL_COLUMNS = {
+    "city": ("city", "citytown", "city/town"),
+    "state": ("state",),
+    "yelp_url": ("yelp_url", "yelp"),
+}
+
+# -------------------------
+# Input
+# -------------------------
+def _find_column(df: pd.DataFrame, candidates, required_name: str = None):
+    cols = {c.strip().lower(): c for c in df.columns}
+    for cand in candidates:
+        if cand in cols:
+            return cols[cand]
+    if required_name:
+        raise ValueError(f"No {required_name} column in input (looked for: {', '.join(candidates)})")
+    return None
+
+def read_orgs(path: str, name_column: str = None) -> list[dict]:
+    """
+    Rows to profile: {"row_id", "org_name", "city", "state", "yelp_url"}. row_id is the
+    row position plus the name, so a resumed run never confuses rows of an edited file.
+    """
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    name_col = name_column or _find_column(df, NAME_COLUMNS, "organization name")
+    extra = {key: _find_column(df, cands) for key, cands in OPTIONAL_COLUMNS.items()}
+    rows = []
+    for i, values in enumerate(df.to_dict("records")):
+        name = values[name_col].strip()
+        if not name:
+            continue
+        rows.append({
+            "row_id": f"{i}:{name}",
+            "org_name": name,
+            **{key: (values[col].strip() or None) if col else None for key, col in extra.items()},
+        })
+    return rows
+
+# -------------------------
+# Writers (output == checkpoint)
+# -------------------------
+def finished(results: dict) -> set:
+    """
+    Row ids whose latest record ({row_id: result}, in write order) is "ok". Failed and
+    partial rows are profiled again on resume; their new record supersedes the old one
+    (readers and merge keep the last record per row_id).
+    """
+    return {row_id for row_id, result in results.items() if result == "ok"}
+
+class JsonlWriter:
+    """One JSON record per line, flushed per record; a torn last line is dropped on resume."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._truncate_partial_line()
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def _truncate_partial_line(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as fh:
+            data = fh.read()
+            if data and not data.endswith(b"\n"):
+                fh.truncate(data.rfind(b"\n") + 1)
+
+    def completed(self) -> set:
+        results = {}
+        with open(self.path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                    results[record["row_id"]] = record.get("result")
+                except (ValueError, KeyError):
+                    continue
+        return finished(results)
+
+    def write(self, record: dict):
+        self._fh.write(json.dumps(record, default=str) + "\n")
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+# Fixed Parquet schema so every part file (and every machine's output) concatenates;
+# nested fields are JSON strings
+PARQUET_FLOATS = ("match_score", "cms_score", "google_score", "combined_score", "elapsed_s", "profiled_at")
+PARQUET_STRINGS = ("row_id", "org_name", "result", "ccn", "cms_name", "city", "state")
+PARQUET_JSON = ("cms", "place", "google_reviews", "about", "site", "news", "usnews", "yelp_reviews",
+                "sources", "status", "errors")
+PARQUET_SCHEMA = pa.schema(
+    [(c, pa.string()) for c in PARQUET_STRINGS]
+    + [(c, pa.float64()) for c in PARQUET_FLOATS]
+    + [(c, pa.string()) for c in PARQUET_JSON]
+)
+
+class ParquetWriter:
+    """
+    Buffered Parquet part files (part-00000.parquet, ...) in one directory, all with
+    PARQUET_SCHEMA. Parts are written to a temp name and renamed, so a crash loses at
+    most the unflushed buffer.
+    """
+
+    def __init__(self, directory: str, rows_per_part: int = None):
+        self.directory = directory
+        self.rows_per_part = rows_per_part or settings.BATCH_PARQUET_ROWS
+        os.makedirs(directory, exist_ok=True)
+        self._buffer = []
+        self._part = len(self._parts())
+
+    def _parts(self) -> list[str]:
+        return sorted(
+            os.path.join(self.directory, f) for f in os.listdir(self.directory)
+            if f.startswith("part-") and f.endswith(".parquet")
+        )
+
+    def completed(self) -> set:
+        results = {}
+        for part in self._parts():
+            table = pq.read_table(part, columns=["row_id", "result"])
+            results.update(zip(table.column("row_id").to_pylist(), table.column("result").to_pylist()))
+        return finished(results)
+
+    @staticmethod
+    def flatten(record: dict) -> dict:
+        row = {}
+        for c in PARQUET_STRINGS:
+            row[c] = None if record.get(c) is None else str(record[c])
+        for c in PARQUET_FLOATS:
+            row[c] = None if record.get(c) is None else float(record[c])
+        for c in PARQUET_JSON:
+            row[c] = None if record.get(c) is None else json.dumps(record[c], default=str)
+        return row
+
+    def write(self, record: dict):
+        self._buffer.append(self.flatten(record))
+        if len(self._buffer) >= self.rows_per_part:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        path = os.path.join(self.directory, f"part-{self._part:05d}.parquet")
+        table = pa.Table.from_pylist(self._buffer, schema=PARQUET_SCHEMA)
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self._part += 1
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+def open_writer(path: str, fmt: str = None):
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "parquet")
+    return JsonlWriter(path) if fmt == "jsonl" else ParquetWriter(path)
+
+# -------------------------
+# Progress
+# -------------------------
+class Progress:
+    """Completed/failed counts with throughput and ETA, logged at most every `every` seconds."""
+
+    def __init__(self, total: int, skipped: int = 0, every: float = None, label: str = ""):
+        self.total = total
+        self.label = label
+        self.skipped = skipped
+        self.every = every if every is not None else settings.BATCH_REPORT_EVERY
+        self.done = 0
+        self.partial = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last = 0.0
+
+    def tick(self, status: str):
+        self.done += 1
+        if status == "failed":
+            self.failed += 1
+        elif status == "partial":
+            self.partial += 1
+        if time.monotonic() - self._last >= self.every:
+            self.report()
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate else float("inf")
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        pct = 100.0 * self.done / self.total if self.total else 100.0
+        return (
+            f"{self.done}/{self.total} ({pct:.1f}%) · {rate * 60:.1f} orgs/min · ETA {eta_text} · "
+            f"partial {self.partial} · failed {self.failed} · up to date {self.skipped}"
+        )
+
+    def report(self):
+        self._last = time.monotonic()
+        logger.info(f"{self.label}{self.line()}")
+
+# -------------------------
+# Run
+# -------------------------
+def profile_key(row: dict) -> str:
+    """Source-ledger key: the CCN when known, else the name + state."""
+    return row.get("ccn") or f"org:{row['org_name']}|{row.get('state') or ''}"
+
+async def run_batch(rows: list[dict], df_cms: pd.DataFrame, writer, progress: Progress,
+                    workers: int, api_key: str = None, yelp_api_key: str = None, budget: float = None,
+                    ledger: SourceLedger = None, store: ProfileStore = None, reviews: ReviewStore = None,
+                    force: bool = False):
+    """
+    N workers pull rows from a shared queue; each record is written as soon as it finishes
+    (and saved to the profile store and review history, when given). Sources still fresh in the ledger are
+    reused rather than fetched, unless force.
+    """
+    queue = asyncio.Queue()
+    for row in rows:
+        queue.put_nowait(row)
+
+    async def worker():
+        while not queue.empty():
+            row = queue.get_nowait()
+            try:
+                run = await profile_org(
+                    row["org_name"], api_key, df_cms, budget=budget,
+                    city=row["city"], state=row["state"], yelp_url=row["yelp_url"], yelp_api_key=yelp_api_key,
+                    ccn=row.get("ccn"), ledger=ledger, profile_key=profile_key(row), force=force,
+                )
+                record = profile_record(row["org_name"], run, df_cms)
+                ok = all(s == "ok" for s in run["status"].values())
+                status = "ok" if ok else "partial"
+            except Exception as e:
+                logger.warning(f"[Batch] {row['org_name']}: {e}")
+                record = {"org_name": row["org_name"], "status": {}, "errors": {"profile": str(e)}}
+                status = "failed"
+            writer.write(dict(record, row_id=row["row_id"], result=status))
+            progress.tick(status)
+            if status != "failed":
+                await save(record, profile_key(row))
+
+    async def save(record, key):
+        # SQLite / Parquet I/O off the loop; a store error never marks the profile as failed
+        try:
+            if store is not None:
+                await asyncio.to_thread(store.save_record, record, key)
+            if reviews is not None:
+                await asyncio.to_thread(reviews.append_record, record, key)
+        except Exception as e:
+            logger.warning(f"[Batch] {record['org_name']}: not saved to the store: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(min(workers, len(rows)) or 1)))
+
+_stage_executor = None
+
+def size_stage_executor(background_loop, workers: int):
+    """
+    Sync stages run in the loop's default executor: size it for the worker count. Installed
+    once per process (bulk shards reuse it) and only replaced, never leaked, when too small.
+    """
+    global _stage_executor
+    needed = workers * 4
+    if _stage_executor is not None and _stage_executor._max_workers >= needed:
+        return
+    previous = _stage_executor
+    _stage_executor = concurrent.futures.ThreadPoolExecutor(max_workers=needed, thread_name_prefix="batch-stage")
+    background_loop.call(background_loop.loop.set_default_executor, _stage_executor)
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+def execute(pending: list[dict], df_cms: pd.DataFrame, writer, workers: int, budget: float = None,
+            skipped: int = 0, label: str = "", ledger: SourceLedger = None, store: ProfileStore = None,
+            reviews: ReviewStore = None, force: bool = False) -> int:
+    """Profile pending rows on the background loop into writer; returns a process exit code."""
+    ledger = ledger or get_source_ledger()
+    before = ledger.counters()
+    background_loop = get_background_loop()
+    size_stage_executor(background_loop, workers)
+    progress = Progress(len(pending), skipped, label=label)
+    future = background_loop.submit(run_batch(
+        pending, df_cms, writer, progress, workers,
+        api_key=os.getenv("GOOGLE_API_KEY") or None, yelp_api_key=os.getenv("YELP_API_KEY") or None,
+        budget=budget, ledger=ledger, store=store, reviews=reviews, force=force,
+    ))
+    try:
+        future.result()
+    except KeyboardInterrupt:
+        future.cancel()
+        logger.warning(f"{label}Interrupted; re-run the same command to resume")
+        return 130
+    finally:
+        # Records are written on the loop thread, so close there too (after any cancelled workers unwind)
+        background_loop.call(writer.close)
+        if reviews is not None:
+            reviews.flush()
+        progress.report()
+        counters = {k: v - before[k] for k, v in ledger.counters().items()}
+        logger.info(f"{label}Sources reused {counters['reused']}, fetched {counters['fetched']} "
+                    f"({counters['changed']} changed)")
+    return 0
+
+def select_pending(rows: list[dict], done: set, ledger: SourceLedger, refresh: bool = False, cms_hashes: dict = None):
+    """
+    Rows to profile: those not yet in the output, or with refresh, every row with a
+    source due in the ledger (or a changed CMS row). Returns (pending, up-to-date count).
+    """
+    if not refresh:
+        pending = [row for row in rows if row["row_id"] not in done]
+    else:
+        cms_hashes = cms_hashes or {}
+        pending = [
+            row for row in rows
+            if row["row_id"] not in done or ledger.due(profile_key(row), cms_hashes.get(row["row_id"]))
+        ]
+    return pending, len(rows) - len(pending)
+
+def setup_logging():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    logging.getLogger("orchestrator").setLevel(logging.ERROR)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile every organization in a CSV.")
+    parser.add_argument("input", help="CSV with an organization name column (optional city, state, yelp_url)")
+    parser.add_argument("-o", "--out", required=True, help="output .jsonl file or Parquet directory")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), help="default: from the --out suffix")
+    parser.add_argument("--name-column", help="input column holding the organization name")
+    parser.add_argument("--workers", type=int, default=settings.BATCH_WORKERS, help="orgs profiled concurrently")
+    parser.add_argument("--limit", type=int, help="profile at most this many pending rows")
+    parser.add_argument("--budget", type=float, default=settings.PROFILE_BUDGET, help="seconds per org")
+    parser.add_argument("--cms-csv", default=settings.CMS_GENERAL_INFO_CSV, help="CMS general info CSV")
+    parser.add_argument("--refresh", action="store_true",
+                        help="re-profile finished rows whose sources are past their TTL")
+    parser.add_argument("--full", action="store_true", help="fetch every source (ignore stored sources)")
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not save records to the profile store and review history")
+    args = parser.parse_args(argv)
+    setup_logging()
+    # --full only bypasses reuse; the real TTLs still pick what --refresh re-profiles
+    ledger = get_source_ledger()
+
+    rows = read_orgs(args.input, args.name_column)
+    writer = open_writer(args.out, args.format)
+    done = writer.completed()
+    pending, skipped = select_pending(rows, done, ledger, args.refresh)
+    if args.limit:
+        pending = pending[: args.limit]
+    logger.info(f"{len(rows)} orgs in {args.input}: {skipped} up to date in {args.out}, {len(pending)} to profile")
+    if not pending:
+        writer.close()
+        return 0
+
+    df_cms = load_cms_general_info(args.cms_csv, show_ui_messages=False)
+    if df_cms.empty:
+        logger.error("CMS general info could not be loaded; aborting")
+        writer.close()
+        return 1
+    store, reviews = (None, None) if args.no_store else (get_profile_store(), get_review_store())
+    return execute(pending, df_cms, writer, args.workers, args.budget, skipped, ledger=ledger,
+                   store=store, reviews=reviews, force=args.full)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import streamlit as st
+from playwright.async_api import async_playwright
+
+from config import settings
+
+logger = logging.getLogger("browser_pool")
+
+class BrowserPool:
+    """
+    One headless Chromium per process, shared by every scrape.
+    Each request gets a fresh browser context (isolated cookies/storage) with images,
+    fonts and media blocked; at most max_pages contexts are open at once.
+    Bound to the event loop it is first used on -- use it from the background loop
+    (async_runtime.run_async) only.
+    """
+
+    def __init__(self, max_pages: int = None, blocked_resources=None):
+        self.max_pages = max_pages or settings.BROWSER_MAX_PAGES
+        self.blocked_resources = set(blocked_resources or settings.BROWSER_BLOCKED_RESOURCES)
+        self._playwright = None
+        self._browser = None
+        self._lock = None
+        self._slots = None
+
+    async def browser(self):
+        """Launch Chromium on first use (or after it crashed/disconnected)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.max_pages)
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+                logger.info("Launched pooled Chromium")
+            return self._browser
+
+    async def _block(self, route):
+        if route.request.resource_type in self.blocked_resources:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    @asynccontextmanager
+    async def page(self, **context_kwargs):
+        """Page in a fresh context; the context is closed on exit."""
+        browser = await self.browser()
+        async with self._slots:
+            context = await browser.new_context(user_agent="Mozilla/5.0", **context_kwargs)
+            try:
+                await context.route("**/*", self._block)
+                yield await context.new_page()
+            finally:
+                await context.close()
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+@st.cache_resource
+def get_browser_pool() -> BrowserPool:
+    """Single BrowserPool per process."""
+    return BrowserPool()
@@ -0,0 +1,245 @@
+"""
+Nationwide bulk profiling driven by the CMS frame itself (CCN known, so no name matching).
+
+Facilities are split into a fixed number of shards by a hash of their CCN. Each shard
+writes its own Parquet parts under the output directory, so shards can run in a local
+process pool or on several machines sharing that directory:
+
+    python app/bulk_profile.py run --processes 8                        # one machine
+    python app/bulk_profile.py run --node-index 0 --node-count 4 --out /shared/profiles
+    python app/bulk_profile.py merge --out /shared/profiles             # -> profiles.parquet
+
+Every shard resumes from its own parts, so an interrupted night just re-runs the command.
+Daily refreshes use `run --refresh`: only facilities with a source past its TTL or a changed
+CMS row are re-profiled, and only their stale sources are fetched (see source_ledger.py).
+The ledger is local to each machine, so keep a node's --node-index stable between runs.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import logging
+import argparse
+import multiprocessing
+import concurrent.futures
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import settings
+from data_sources.cms_utils import load_cms_general_info
+from data_sources.org_matcher import matcher_for
+from profile_engine import cms_row_hash
+from source_ledger import get_source_ledger
+from profile_store import get_profile_store
+from review_store import get_review_store
+from batch_profile import ParquetWriter, PARQUET_SCHEMA, execute, select_pending, setup_logging
+
+logger = logging.getLogger("bulk_profile")
+
+# -------------------------
+# Sharding
+# -------------------------
+def shard_of(ccn, shards: int) -> int:
+    """Stable shard for a CCN (same answer on every machine and Python process)."""
+    return int(hashlib.md5(str(ccn).encode()).hexdigest()[:8], 16) % shards
+
+def shard_dir(out_dir: str, shard: int, shards: int) -> str:
+    return os.path.join(out_dir, f"shard-{shard:04d}-of-{shards:04d}")
+
+def node_shards(shards: int, node_index: int = 0, node_count: int = 1) -> list[int]:
+    """Shards owned by one node: every node_count-th shard starting at node_index."""
+    return [s for s in range(shards) if s % node_count == node_index]
+
+def facility_rows(df_cms: pd.DataFrame, states=None) -> list[dict]:
+    """One batch row per CMS facility, keyed by CCN."""
+    matcher = matcher_for(df_cms)
+    states = {s.upper() for s in states} if states else None
+    rows = []
+    for entry, ccn in enumerate(matcher.ccns):
+        if ccn is None or pd.isna(ccn):
+            continue
+        state = matcher.entry_states[entry]
+        if states and (not isinstance(state, str) or state.upper() not in states):
+            continue
+        rows.append({
+            "row_id": str(ccn),
+            "ccn": str(ccn),
+            "org_name": matcher.names[entry],
+            "city": matcher.entry_cities[entry],
+            "state": state,
+            "yelp_url": None,
+        })
+    return rows
+
+_configured_host_limits = None
+
+def share_host_limits(processes: int):
+    """
+    Divide settings.HOST_LIMITS between the processes hitting the same hosts, so the
+    fleet as a whole stays within each host's configured rate. Idempotent: pool workers
+    run several shards, and each division starts from the configured limits. The dict
+    is updated in place so an existing HostPolicies registry sees it too.
+    """
+    global _configured_host_limits
+    if _configured_host_limits is None:
+        _configured_host_limits = dict(settings.HOST_LIMITS)
+    settings.HOST_LIMITS.clear()
+    settings.HOST_LIMITS.update({
+        host: (rate / processes, max(1, burst // processes))
+        for host, (rate, burst) in _configured_host_limits.items()
+    } if processes > 1 else _configured_host_limits)
+
+# -------------------------
+# Run
+# -------------------------
+def run_shard(shard: int, shards: int, out_dir: str, workers: int, budget: float = None,
+              cms_csv: str = None, states=None, host_share: int = 1, limit: int = None,
+              refresh: bool = False, full: bool = False) -> dict:
+    """
+    Profile one shard (in its own process); resumable from the shard's Parquet parts.
+    With refresh, finished facilities are re-profiled when a source is past its TTL or
+    their CMS row changed in this snapshot; fresh sources are reused from the ledger.
+    """
+    setup_logging()
+    share_host_limits(host_share)
+    df_cms = load_cms_general_info(cms_csv or settings.CMS_GENERAL_INFO_CSV, show_ui_messages=False)
+    rows = [row for row in facility_rows(df_cms, states) if shard_of(row["ccn"], shards) == shard]
+    directory = shard_dir(out_dir, shard, shards)
+    writer = ParquetWriter(directory, settings.BULK_PARQUET_ROWS)
+    ledger = get_source_ledger()
+    cms_hashes = None
+    if refresh:
+        matcher = matcher_for(df_cms)
+        cms_hashes = {row["row_id"]: cms_row_hash(matcher.row_for_ccn(row["ccn"])) for row in rows}
+    pending, up_to_date = select_pending(rows, writer.completed(), ledger, refresh, cms_hashes)
+    if limit:
+        pending = pending[:limit]
+    label = f"[shard {shard}/{shards}] "
+    logger.info(f"{label}{len(rows)} facilities, {up_to_date} up to date, {len(pending)} to profile")
+    if pending:
+        code = execute(pending, df_cms, writer, workers, budget, skipped=up_to_date, label=label, ledger=ledger,
+                       force=full)
+    else:
+        code = 0
+        writer.close()
+    complete = code == 0 and len(writer.completed()) >= len(rows)
+    summary = {"shard": shard, "facilities": len(rows), "profiled": len(pending), "complete": complete}
+    with open(os.path.join(directory, "_status.json"), "w") as fh:
+        json.dump(dict(summary, finished_at=time.time()), fh)
+    return summary
+
+def run_nationwide(out_dir: str, shards: int, processes: int, workers: int, node_index: int = 0,
+                   node_count: int = 1, budget: float = None, cms_csv: str = None, states=None,
+                   limit: int = None, refresh: bool = False, full: bool = False) -> list[dict]:
+    """Run this node's shards across a process pool (spawned, so each gets a clean loop and caches)."""
+    mine = node_shards(shards, node_index, node_count)
+    processes = max(1, min(processes, len(mine)))
+    logger.info(f"Node {node_index}/{node_count}: {len(mine)} of {shards} shards on {processes} processes")
+    summaries = []
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as pool:
+        futures = [
+            pool.submit(run_shard, shard, shards, out_dir, workers, budget, cms_csv, states,
+                        processes * node_count, limit, refresh, full)
+            for shard in mine
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            logger.info(f"Shard {summary['shard']} finished: {summary['profiled']} profiled, "
+                        f"complete={summary['complete']} ({len(summaries)}/{len(mine)} shards)")
+    return summaries
+
+# -------------------------
+# Merge
+# -------------------------
+def merge_shards(out_dir: str, dest: str = None, shards: int = None) -> dict:
+    """
+    Concatenate every shard's parts into one Parquet file (latest record per CCN wins)
+    and report shards that are missing or unfinished.
+    """
+    dest = dest or os.path.join(out_dir, "profiles.parquet")
+    parts = sorted(glob.glob(os.path.join(out_dir, "shard-*", "part-*.parquet")))
+    if not parts:
+        raise FileNotFoundError(f"No shard parts under {out_dir}")
+    table = pa.concat_tables(pq.read_table(part, schema=PARQUET_SCHEMA) for part in parts)
+    df = table.to_pandas().drop_duplicates("row_id", keep="last").sort_values("row_id")
+
+    incomplete = []
+    shard_dirs = sorted(glob.glob(os.path.join(out_dir, "shard-*")))
+    for directory in shard_dirs:
+        try:
+            with open(os.path.join(directory, "_status.json")) as fh:
+                if not json.load(fh)["complete"]:
+                    incomplete.append(os.path.basename(directory))
+        except (OSError, ValueError, KeyError):
+            incomplete.append(os.path.basename(directory))
+    missing = (shards or 0) - len(shard_dirs)
+
+    tmp = dest + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, schema=PARQUET_SCHEMA, preserve_index=False), tmp)
+    os.replace(tmp, dest)
+    return {"rows": len(df), "parts": len(parts), "dest": dest, "incomplete": incomplete,
+            "missing_shards": max(missing, 0)}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile every CMS facility, sharded by CCN.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="profile this node's shards")
+    run.add_argument("--out", default=settings.BULK_OUTPUT_DIR, help="shared output directory")
+    run.add_argument("--shards", type=int, default=settings.BULK_SHARDS, help="total shards (same on every node)")
+    run.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="shard processes on this node")
+    run.add_argument("--workers", type=int, default=settings.BATCH_WORKERS, help="concurrent orgs per process")
+    run.add_argument("--node-index", type=int, default=0)
+    run.add_argument("--node-count", type=int, default=1)
+    run.add_argument("--state", action="append", help="only facilities in this state (repeatable)")
+    run.add_argument("--limit", type=int, help="profile at most this many facilities per shard")
+    run.add_argument("--budget", type=float, default=settings.PROFILE_BUDGET, help="seconds per org")
+    run.add_argument("--cms-csv", default=settings.CMS_GENERAL_INFO_CSV, help="CMS general info CSV")
+    run.add_argument("--refresh", action="store_true",
+                     help="incremental: re-profile facilities with expired sources or a changed CMS row")
+    run.add_argument("--full", action="store_true", help="fetch every source (ignore stored sources)")
+    merge = sub.add_parser("merge", help="merge shard outputs into one Parquet file")
+    merge.add_argument("--out", default=settings.BULK_OUTPUT_DIR, help="shared output directory")
+    merge.add_argument("--dest", help="merged file (default: <out>/profiles.parquet)")
+    merge.add_argument("--shards", type=int, default=settings.BULK_SHARDS, help="expected shard count")
+    merge.add_argument("--no-store", action="store_true",
+                       help="do not load the merged file into the profile store and review history")
+    merge.add_argument("--cms-csv", default=settings.CMS_GENERAL_INFO_CSV, help="CMS general info CSV")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.command == "merge":
+        summary = merge_shards(args.out, args.dest, args.shards)
+        logger.info(f"Merged {summary['rows']} profiles from {summary['parts']} parts into {summary['dest']}")
+        if not args.no_store:
+            store = get_profile_store()
+            store.load_facilities(load_cms_general_info(args.cms_csv, show_ui_messages=False))
+            logger.info(f"Loaded {store.load_parquet(summary['dest'])} profiles into {store.path}")
+            reviews = get_review_store()
+            added = reviews.load_parquet(summary["dest"])
+            logger.info(f"Added {added} new reviews to {reviews.root} ({reviews.compact()} partitions compacted)")
+        if summary["incomplete"] or summary["missing_shards"]:
+            logger.warning(f"Incomplete shards: {summary['incomplete']}; missing: {summary['missing_shards']}")
+            return 2
+        return 0
+
+    if not 0 <= args.node_index < args.node_count:
+        parser.error("--node-index must be in [0, --node-count)")
+    started = time.monotonic()
+    summaries = run_nationwide(
+        args.out, args.shards, args.processes, args.workers, args.node_index, args.node_count,
+        args.budget, args.cms_csv, args.state, args.limit, args.refresh, args.full,
+    )
+    profiled = sum(s["profiled"] for s in summaries)
+    elapsed = time.monotonic() - started
+    logger.info(f"Profiled {profiled} facilities in {elapsed:.0f}s ({profiled / max(elapsed, 1) * 60:.1f}/min); "
+                f"{sum(s['complete'] for s in summaries)}/{len(summaries)} shards complete")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,7 +18,135 @@ class Settings:
     # Local CSV paths
     CMS_GENERAL_INFO_CSV = os.path.join(DATA_DIR, "Hospital_General_Information.csv")
     CMS_PATIENT_SURVEYS_CSV = os.path.join(DATA_DIR, "Hospital_Patient_Surveys.csv")
+
+    # Dated CMS snapshots kept by data_sources/cms_refresh.py
+    CMS_SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+    CMS_SNAPSHOT_KEEP = 14
+    CMS_DATASETS = {
+        "general_info": CMS_GENERAL_URL,
+        "patient_surveys": CMS_SURVEY_URL,
+    }
     
+    # Shared HTTP client (http_client.py)
+    HTTP_TIMEOUT = 15
+    HTTP_CONNECT_TIMEOUT = 5
+    HTTP_POOL_SIZE = 100
+    HTTP_POOL_PER_HOST = 10
+    HTTP_DNS_TTL = 300
+    HTTP_MAX_RETRIES = 3
+    ABOUT_MAX_BYTES = 256 * 1024  # website_scraper stops reading homepages here
+
+    # Website crawler (site_crawler.py)
+    CRAWL_MAX_DEPTH = 1           # homepage -> linked About/Mission/Leadership/Locations pages
+    CRAWL_MAX_PAGES = 9           # including the homepage
+    CRAWL_PAGES_PER_KIND = 2
+    CRAWL_PER_DOMAIN = 4          # concurrent requests per domain
+    CRAWL_MAX_BYTES = 1024 * 1024
+    CRAWL_USER_AGENT = "HealthcareProfiler/2.0"  # sent with every crawl request and matched against robots.txt
+    CRAWL_ROBOTS_CACHE = 2048     # parsed robots.txt files kept in memory (least recently used dropped)
+
+    # News (news_utils.py)
+    NEWS_MAX_BYTES = 512 * 1024
+    NEWS_DB_PATH = os.path.join(DATA_DIR, "news.sqlite")
+
+    # US News rankings index (usnews_index.py)
+    USNEWS_INDEX_PATH = os.path.join(DATA_DIR, "usnews_index.sqlite")
+    USNEWS_AREA_URL = "https://health.usnews.com/best-hospitals/area/{state}"
+    USNEWS_PAGES_PER_STATE = 3
+    USNEWS_MIN_SCORE = 88         # fuzzy score needed to key an entry by a CMS CCN
+
+    # Queryable profile store (profile_store.py)
+    PROFILE_STORE_PATH = os.path.join(DATA_DIR, "profiles.sqlite")
+
+    # Review history (review_store.py): Parquet partitioned by source and month
+    REVIEW_STORE_DIR = os.path.join(DATA_DIR, "reviews")
+    REVIEW_FLUSH_ROWS = 5000      # pending reviews written per flush
+    REVIEW_COMPACT_FILES = 8      # part files in a partition before compact() rewrites it
+
+    # Pooled headless browser (browser_pool.py)
+    BROWSER_MAX_PAGES = 4         # concurrent browser contexts per process
+    BROWSER_BLOCKED_RESOURCES = ("image", "font", "media")
+
+    # Per-host politeness (host_policy.py): (requests/second, burst)
+    HOST_LIMITS = {
+        "maps.googleapis.com": (10, 10),
+        "www.google.com": (0.5, 2),
+        "news.google.com": (2, 4),
+        "api.yelp.com": (5, 5),
+        "www.yelp.com": (1, 10),      # burst covers one 100-review paginated fetch
+        "health.usnews.com": (1, 2),
+        "default": (4, 8),
+    }
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 20
+    CIRCUIT_FAILURE_THRESHOLD = 5
+    CIRCUIT_COOLDOWN = 60
+
+    # On-disk HTTP response cache (response_cache.py), TTLs in seconds per source
+    RESPONSE_CACHE_PATH = os.path.join(DATA_DIR, "cache", "responses.sqlite")
+    CACHE_TTLS = {
+        "places_search": 7 * 86400,
+        "places_details": 86400,
+        "google_search": 6 * 3600,
+        "website_about": 7 * 86400,
+        "website_pages": 7 * 86400,
+        "robots": 86400,
+        "yelp": 86400,
+        "yelp_api": 86400,
+        "usnews": 7 * 86400,
+        "usnews_lists": 30 * 86400,
+        "news": 3600,
+        "default": 3600,
+    }
+    # Expired entries younger than TTL + this are served stale while revalidating
+    CACHE_MAX_STALE = 7 * 86400
+    # Replay mode: serve only cached responses, never hit the network
+    OFFLINE_MODE = os.getenv("PROFILER_OFFLINE", "") == "1"
+
+    # CCN -> Google place_id mappings (place_id_cache.py)
+    PLACE_ID_CACHE_PATH = os.path.join(DATA_DIR, "cache", "place_ids.sqlite")
+    PLACE_ID_TTL = 30 * 86400
+    PLACE_ID_MIN_SCORE = 60
+
+    # Profile orchestrator (orchestrator.py): per-stage deadlines and overall budget, seconds
+    STAGE_TIMEOUTS = {
+        "prevalidate": 10,
+        "cms_match": 5,
+        "places": 15,
+        "about": 12,
+        "site": 15,
+        "news": 10,
+        "usnews": 15,
+        "yelp": 20,
+        "score": 5,
+    }
+    PROFILE_BUDGET = 30
+
+    # Batch profiling (app/batch_profile.py)
+    BATCH_WORKERS = 8
+    BATCH_YELP_LIMIT = 20
+    BATCH_PARQUET_ROWS = 200      # records per Parquet part file
+    BATCH_REPORT_EVERY = 10       # seconds between progress lines
+    BULK_OUTPUT_DIR = os.path.join(DATA_DIR, "bulk_profiles")
+    BULK_SHARDS = 64              # fixed across nodes; a shard is the unit of resume and scheduling
+    BULK_PARQUET_ROWS = 25
+    # Incremental re-profiling: a source is re-fetched once older than its TTL or when
+    # its inputs (CMS row, website URL, US News index refresh) change
+    SOURCE_LEDGER_PATH = os.path.join(DATA_DIR, "profile_sources.sqlite")
+    SOURCE_TTLS = {
+        "prevalidate": 7 * 86400,
+        "places": 7 * 86400,
+        "about": 30 * 86400,
+        "site": 30 * 86400,
+        "news": 86400,
+        "usnews": 30 * 86400,
+        "yelp": 7 * 86400,
+    }
+    # Short-TTL sources that never make a profile due by themselves; they are re-fetched
+    # when the profile is re-profiled for another source (so a daily news TTL does not
+    # re-profile the whole portfolio every day)
+    SOURCE_AUXILIARY = ("news",)
+
     # Limits / defaults
     GOOGLE_SEARCH_PREVALIDATION_RESULTS = 5
     DEFAULT_REVIEW_LIMIT = 25
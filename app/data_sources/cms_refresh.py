@@ -0,0 +1,185 @@
+import os
+import json
+import glob
+import hashlib
+import logging
+from datetime import datetime, timezone
+
+import pandas as pd
+from config import settings
+from http_client import http_get
+
+logger = logging.getLogger("cms_loader")
+
+STATE_FILE = "state.json"
+
+# -------------------------
+# Paths / state
+# -------------------------
+def dataset_dir(name: str, snapshot_dir: str = None) -> str:
+    """Folder holding the dated snapshots and refresh state for one dataset."""
+    path = os.path.join(snapshot_dir or settings.CMS_SNAPSHOT_DIR, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def load_state(name: str, snapshot_dir: str = None) -> dict:
+    path = os.path.join(dataset_dir(name, snapshot_dir), STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_state(name: str, state: dict, snapshot_dir: str = None):
+    path = os.path.join(dataset_dir(name, snapshot_dir), STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+def latest_snapshot(name: str, snapshot_dir: str = None):
+    """Path of the most recent dated CSV snapshot for a dataset, or None."""
+    latest = load_state(name, snapshot_dir).get("latest")
+    if latest and os.path.exists(latest):
+        return latest
+    files = sorted(glob.glob(os.path.join(dataset_dir(name, snapshot_dir), f"{name}_*.csv")))
+    return files[-1] if files else None
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _prune(name: str, keep: int, snapshot_dir: str = None):
+    files = sorted(glob.glob(os.path.join(dataset_dir(name, snapshot_dir), f"{name}_*.csv")))
+    for old in files[:-keep] if keep > 0 else []:
+        for path in glob.glob(os.path.splitext(old)[0] + ".*"):
+            os.remove(path)
+
+# -------------------------
+# Per-CCN diff
+# -------------------------
+def ccn_hashes(df: pd.DataFrame, ccn_col: str) -> pd.Series:
+    """
+    One content hash per CCN over a canonical serialization of its rows: columns in name
+    order, values stripped, missing values empty. Both snapshots of a diff hash the same
+    way (whatever their column order or rows per CCN), so only real changes differ.
+    Files with several rows per facility (e.g. HCAHPS measures) are combined
+    order-independently, so a facility only counts as changed if its rows changed.
+    """
+    columns = sorted(c for c in df.columns if c != ccn_col)
+    values = df[columns].fillna("").astype(str).apply(lambda col: col.str.strip())
+    row_hash = pd.util.hash_pandas_object(values, index=False)
+    row_hash.index = df[ccn_col].astype(str).str.strip().values
+    return row_hash.groupby(level=0).agg(
+        lambda h: hashlib.sha1(h.sort_values().values.tobytes()).hexdigest()
+    )
+
+def diff_by_ccn(old_df: pd.DataFrame, new_df: pd.DataFrame, ccn_col: str) -> dict:
+    """Return {"added", "removed", "changed"} lists of CCNs between two snapshots."""
+    old_h = ccn_hashes(old_df, ccn_col)
+    new_h = ccn_hashes(new_df, ccn_col)
+    common = old_h.index.intersection(new_h.index)
+    changed = common[old_h.loc[common].values != new_h.loc[common].values]
+    return {
+        "added": sorted(new_h.index.difference(old_h.index)),
+        "removed": sorted(old_h.index.difference(new_h.index)),
+        "changed": sorted(changed),
+    }
+
+def affected_ccns(diff: dict) -> set:
+    """All CCNs whose cached data should be invalidated after a refresh."""
+    if not diff:
+        return set()
+    return set(diff.get("added", [])) | set(diff.get("removed", [])) | set(diff.get("changed", []))
+
+# -------------------------
+# Conditional refresh
+# -------------------------
+def refresh_dataset(name: str, url: str, snapshot_dir: str = None, timeout: int = 30) -> dict:
+    """
+    Revalidate a CMS dataset with ETag / If-Modified-Since and keep dated snapshots.
+    Returns a dict with:
+      - status: "not_modified", "unchanged", "updated" or "error"
+      - path: latest local snapshot (may be None if nothing was ever downloaded)
+      - diff: per-CCN diff vs the previous snapshot (only for "updated")
+    """
+    from data_sources.cms_utils import find_ccn_column
+
+    state = load_state(name, snapshot_dir)
+    previous = latest_snapshot(name, snapshot_dir)
+    now = datetime.now(timezone.utc)
+
+    headers = {}
+    if previous:
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    folder = dataset_dir(name, snapshot_dir)
+    tmp_path = os.path.join(folder, f".{name}.download")
+    try:
+        with http_get(url, headers=headers, timeout=timeout, stream=True) as r:
+            if r.status_code == 304:
+                state["checked_at"] = now.isoformat()
+                save_state(name, state, snapshot_dir)
+                return {"status": "not_modified", "path": previous, "diff": None}
+            r.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+            state["etag"] = r.headers.get("ETag")
+            state["last_modified"] = r.headers.get("Last-Modified")
+    except Exception as e:
+        logger.warning(f"CMS refresh failed for {name}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return {"status": "error", "path": previous, "diff": None, "error": str(e)}
+
+    state["checked_at"] = now.isoformat()
+    sha = _file_sha256(tmp_path)
+    if previous and sha == state.get("sha256"):
+        # Server ignored the conditional headers but content is identical
+        os.remove(tmp_path)
+        save_state(name, state, snapshot_dir)
+        return {"status": "unchanged", "path": previous, "diff": None}
+
+    new_path = os.path.join(folder, f"{name}_{now.strftime('%Y%m%d_%H%M%S')}.csv")
+    os.replace(tmp_path, new_path)
+
+    diff = None
+    if previous:
+        try:
+            old_df = pd.read_csv(previous, dtype=str, on_bad_lines="skip")
+            new_df = pd.read_csv(new_path, dtype=str, on_bad_lines="skip")
+            ccn_col = find_ccn_column(new_df)
+            if ccn_col and ccn_col in old_df.columns:
+                diff = diff_by_ccn(old_df, new_df, ccn_col)
+                with open(os.path.splitext(new_path)[0] + ".diff.json", "w") as f:
+                    json.dump(diff, f)
+        except Exception as e:
+            logger.warning(f"Could not diff {name} snapshots: {e}")
+
+    state.update({"latest": new_path, "sha256": sha, "updated_at": now.isoformat()})
+    save_state(name, state, snapshot_dir)
+    _prune(name, settings.CMS_SNAPSHOT_KEEP, snapshot_dir)
+    logger.info(f"CMS {name} updated -> {os.path.basename(new_path)}")
+    return {"status": "updated", "path": new_path, "diff": diff}
+
+def refresh_all(snapshot_dir: str = None) -> dict:
+    """Refresh every configured CMS dataset."""
+    return {
+        name: refresh_dataset(name, url, snapshot_dir)
+        for name, url in settings.CMS_DATASETS.items()
+    }
+
+if __name__ == "__main__":
+    for name, result in refresh_all().items():
+        diff = result.get("diff") or {}
+        print(name, result["status"], result.get("path"),
+              {k: len(v) for k, v in diff.items()})
@@ -0,0 +1,99 @@
+import os
+import re
+import hashlib
+import logging
+import pandas as pd
+
+logger = logging.getLogger("cms_loader")
+
+SNAPSHOT_EXT = ".parquet"
+FINGERPRINT_KEY = b"source_fingerprint"
+
+# Low-cardinality text columns stored as categoricals
+CATEGORY_COLUMNS = ["State", "Hospital Type", "Hospital Ownership"]
+
+# Ratings and measure counts stored as nullable ints ("Not Available" -> <NA>)
+INT_COLUMN_PATTERN = re.compile(r"overall rating$|measure count$|^count of ", re.I)
+
+# -------------------------
+# Fingerprint / paths
+# -------------------------
+def source_fingerprint(path: str) -> str:
+    """Content hash of the source file, used to decide whether a snapshot is still valid."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def snapshot_path(csv_path: str) -> str:
+    """Snapshot file that lives next to the CSV (same name, .parquet extension)."""
+    return os.path.splitext(csv_path)[0] + SNAPSHOT_EXT
+
+# -------------------------
+# Typing
+# -------------------------
+def coerce_general_info(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a dtype=str CMS General Information frame to compact types:
+    ratings/measure counts -> Int16, State/Hospital Type/Ownership -> category.
+    Unknown columns are left as-is.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if INT_COLUMN_PATTERN.search(col):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int16")
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+# -------------------------
+# Read / write snapshot
+# -------------------------
+def read_snapshot(csv_path: str, fingerprint: str):
+    """Return the snapshot frame if it exists and was built from the same source, else None."""
+    path = snapshot_path(csv_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        import pyarrow.parquet as pq
+        meta = pq.read_schema(path).metadata or {}
+        if meta.get(FINGERPRINT_KEY, b"").decode() != fingerprint:
+            return None
+        return pq.read_table(path).to_pandas()
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable CMS snapshot {path}: {e}")
+        return None
+
+def write_snapshot(df: pd.DataFrame, csv_path: str, fingerprint: str) -> bool:
+    """Write df as Parquet next to csv_path, tagging it with the source fingerprint."""
+    path = snapshot_path(csv_path)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[FINGERPRINT_KEY] = fingerprint.encode()
+        table = table.replace_schema_metadata(meta)
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not write CMS snapshot {path}: {e}")
+        return False
+
+def load_general_info_snapshot(csv_path: str) -> pd.DataFrame:
+    """
+    Load CMS General Information from its typed snapshot when the CSV is unchanged,
+    otherwise parse the CSV, type it, and (re)write the snapshot.
+    """
+    fingerprint = source_fingerprint(csv_path)
+    df = read_snapshot(csv_path, fingerprint)
+    if df is None:
+        df = coerce_general_info(pd.read_csv(csv_path, dtype=str, on_bad_lines="skip"))
+        write_snapshot(df, csv_path, fingerprint)
+    # Lets per-snapshot structures (e.g. org_matcher.matcher_for) key off the source file
+    df.attrs["source_fingerprint"] = fingerprint
+    return df
@@ -1,11 +1,11 @@
 import os
-import io
 import re
 import pandas as pd
-import requests
 import streamlit as st
 import logging
 from config import settings
+from data_sources.cms_snapshot import load_general_info_snapshot, source_fingerprint
+from data_sources.cms_refresh import refresh_dataset
 
 # -------------------------
 # Setup Logger
@@ -42,7 +42,7 @@ def load_cms_general_info(csv_path=None, show_ui_messages=True):
 
     if csv_path:
         try:
-            df = pd.read_csv(csv_path, dtype=str, on_bad_lines="skip")
+            df = load_general_info_snapshot(csv_path)
             log_st(f"Loaded CMS general info from CSV path ({len(df)} records)", "success", show_ui_messages)
             return df
         except Exception as e:
@@ -50,15 +50,18 @@ def load_cms_general_info(csv_path=None, show_ui_messages=True):
             return pd.DataFrame()
 
     try:
-        r = requests.get(settings.CMS_GENERAL_URL, timeout=15)
-        df = pd.read_csv(io.BytesIO(r.content), dtype=str, on_bad_lines="skip")
-        log_st(f"Loaded CMS general info ({len(df)} records)", "success", show_ui_messages)
+        result = refresh_dataset("general_info", settings.CMS_GENERAL_URL)
+        if not result["path"]:
+            raise RuntimeError(result.get("error", "no CMS general info snapshot"))
+        df = load_general_info_snapshot(result["path"])
+        log_st(f"Loaded CMS general info ({len(df)} records, {result['status']})", "success", show_ui_messages)
         return df
     except Exception:
         if os.path.exists(backup_path):
             for enc in ["utf-8", "latin1", "utf-16"]:
                 try:
                     df = pd.read_csv(backup_path, dtype=str, encoding=enc, on_bad_lines="skip")
+                    df.attrs["source_fingerprint"] = source_fingerprint(backup_path)
                     log_st(f"Loaded CMS general info from backup ({enc})", "success", show_ui_messages)
                     return df
                 except Exception:
@@ -83,9 +86,11 @@ def load_cms_patient_surveys(csv_path=None, show_ui_messages=True):
             return pd.DataFrame()
 
     try:
-        r = requests.get(settings.CMS_SURVEY_URL, timeout=15)
-        df = pd.read_csv(io.BytesIO(r.content), dtype=str, on_bad_lines="skip")
-        log_st(f"Loaded CMS patient surveys ({len(df)} records)", "success", show_ui_messages)
+        result = refresh_dataset("patient_surveys", settings.CMS_SURVEY_URL)
+        if not result["path"]:
+            raise RuntimeError(result.get("error", "no CMS patient survey snapshot"))
+        df = pd.read_csv(result["path"], dtype=str, on_bad_lines="skip")
+        log_st(f"Loaded CMS patient surveys ({len(df)} records, {result['status']})", "success", show_ui_messages)
         return df
     except Exception:
         if os.path.exists(backup_path):
@@ -105,13 +110,21 @@ def load_cms_patient_surveys(csv_path=None, show_ui_messages=True):
 def find_ccn_column(df):
     """Attempt to identify the CCN column in a CMS DataFrame"""
     for col in df.columns:
-        if re.search(r'ccn|cms_certification_number', col, re.I):
+        if re.search(r'ccn|cms_certification_number|facility[ _]id', col, re.I):
             return col
     return None
 
 # -------------------------
 # Calculate CMS Score
 # -------------------------
+def _as_int(value):
+    """Rating as int whether it comes from the typed snapshot (Int16) or a raw string column"""
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, str):
+        return int(value) if value.isdigit() else None
+    return int(value)
+
 def calculate_cms_score(hospital_row):
     """
     Example scoring function based on available CMS fields.
@@ -119,12 +132,12 @@ def calculate_cms_score(hospital_row):
     """
     score = 0
     try:
-        rating = hospital_row.get("Hospital overall rating")
-        if rating and rating.isdigit():
-            score += int(rating) * 10  # Example multiplier
-        survey_score = hospital_row.get("Patient survey star rating")
-        if survey_score and survey_score.isdigit():
-            score += int(survey_score) * 5
+        rating = _as_int(hospital_row.get("Hospital overall rating"))
+        if rating is not None:
+            score += rating * 10  # Example multiplier
+        survey_score = _as_int(hospital_row.get("Patient survey star rating"))
+        if survey_score is not None:
+            score += survey_score * 5
     except Exception as e:
         log_st(f"Error calculating CMS score: {e}", "error")
     return score
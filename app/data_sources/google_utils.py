@@ -1,20 +1,8 @@
 import requests
+from response_cache import cached_get
+import pandas as pd
 from bs4 import BeautifulSoup
-from rapidfuzz import process, fuzz
-import re
-
-# -------------------------
-# Normalize organization name
-# -------------------------
-def normalize_name(name: str) -> str:
-    """
-    Lowercase, remove punctuation, and remove common words like 'hospital' or 'clinic'.
-    """
-    name = name.lower()
-    name = re.sub(r'[^\w\s]', '', name)
-    for word in ['hospital', 'medical center', 'center', 'clinic']:
-        name = name.replace(word, '')
-    return name.strip()
+from data_sources.org_matcher import normalize_name, matcher_for, BULK_COLUMNS, RANK_COLUMNS
 
 # -------------------------
 # Google search pre-validation
@@ -27,7 +15,7 @@ def google_search_name(name: str, limit: int = 3) -> list[dict]:
     url = f"https://www.google.com/search?q={query}"
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        r = requests.get(url, headers=headers, timeout=10)
+        r = cached_get(url, "google_search", headers=headers, timeout=10)
         soup = BeautifulSoup(r.text, "html.parser")
         results = []
         for g in soup.find_all('div', class_='tF2Cxc')[:limit]:
@@ -45,36 +33,39 @@ def google_search_name(name: str, limit: int = 3) -> list[dict]:
 def match_org(name: str, df, state: str = None, city: str = None):
     """
     Matches a given organization name to the best candidate in the provided dataframe.
+    Uses the precomputed OrgMatcher for this CMS snapshot (built on first use).
     Returns: matched row, column used, and match message.
     """
     if df.empty:
         return None, None, "No CMS data loaded"
 
-    df_filtered = df.copy()
-    if state:
-        df_filtered = df_filtered[df_filtered['State'].str.upper() == state.upper()]
-    if city:
-        df_filtered = df_filtered[df_filtered['City'].str.upper() == city.upper()]
-    if df_filtered.empty:
-        return None, None, "No facilities found with specified state/city"
-
-    name_cols = [c for c in df.columns if "name" in c.lower()]
-    if not name_cols:
-        return None, None, "No name column found in dataframe"
+    return matcher_for(df).match(name, state=state, city=city)
 
-    col = name_cols[0]
-    choices = df_filtered[col].dropna().tolist()
-    choices_norm = [normalize_name(c) for c in choices]
-    name_norm = normalize_name(name)
+# -------------------------
+# Ranked match with alternates
+# -------------------------
+def match_org_ranked(name: str, df, state: str = None, city: str = None, top_k: int = 5):
+    """
+    Like match_org, but also returns the ranked top_k candidates (WRatio, token_set,
+    partial and match score per candidate) from the same scoring pass.
+    Returns: matched row, column used, match message, ranked DataFrame.
+    """
+    if df.empty:
+        return None, None, "No CMS data loaded", pd.DataFrame(columns=RANK_COLUMNS)
 
-    match = process.extractOne(name_norm, choices_norm, scorer=fuzz.WRatio, score_cutoff=90)
-    if match:
-        _, score, idx = match
-        return df_filtered.iloc[idx], col, f"Matched '{choices[idx]}' (score {score})"
+    return matcher_for(df).match_ranked(name, state=state, city=city, top_k=top_k)
 
-    # Fallback: substring match
-    subs = df_filtered[df_filtered[col].str.contains(name, case=False, na=False)]
-    if not subs.empty:
-        return subs.iloc[0], col, f"Substring fallback: '{subs.iloc[0][col]}'"
+# -------------------------
+# Bulk match organizations to CMS dataset
+# -------------------------
+def match_orgs_bulk(names, df, state=None, city=None, top_k: int = 3, score_cutoff: float = 90):
+    """
+    Match a list/Series of organization names in one vectorized pass.
+    state/city may be a single value or one per name.
+    Returns a DataFrame with the top_k candidates per name, their scores, CCNs and
+    the match method ("fuzzy", "substring" or None).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=BULK_COLUMNS)
 
-    return None, col, "No match found"
+    return matcher_for(df).match_many(names, states=state, cities=city, top_k=top_k, score_cutoff=score_cutoff)
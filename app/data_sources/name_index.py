@@ -0,0 +1,64 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+# -------------------------
+# Grams
+# -------------------------
+def name_grams(name_norm: str) -> set:
+    """Word tokens and padded character trigrams of an already-normalized name."""
+    grams = {f"t:{tok}" for tok in name_norm.split()}
+    padded = f"  {' '.join(name_norm.split())} "
+    grams.update(f"g:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return grams
+
+# -------------------------
+# Inverted index
+# -------------------------
+class GramIndex:
+    """
+    Inverted index from name tokens / character trigrams to entry ids.
+    Used as a blocking step: only entries sharing enough (IDF-weighted) grams with the
+    query are passed on to rapidfuzz, so match cost tracks the candidate count rather
+    than the size of the reference set.
+    """
+
+    def __init__(self, names_norm: list[str], max_df: float = 0.1):
+        self.size = len(names_norm)
+        postings = defaultdict(list)
+        for entry, name in enumerate(names_norm):
+            for gram in name_grams(name):
+                postings[gram].append(entry)
+
+        self.postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+        n = max(self.size, 1)
+        self.idf = {g: math.log(n / len(ids)) + 1.0 for g, ids in self.postings.items()}
+        # Grams present in more than max_df of names carry almost no signal
+        self.stop_grams = {g for g, ids in self.postings.items() if len(ids) > max_df * n}
+
+    def candidates(self, query_norm: str, max_candidates: int = 256, min_overlap: float = 0.2, restrict=None):
+        """
+        Entry ids (sorted) sharing at least min_overlap of the query's gram weight,
+        capped to the max_candidates best-overlapping ones.
+        restrict: optional sorted array of entry ids to limit the search to (e.g. a state slice).
+        """
+        grams = [g for g in name_grams(query_norm) if g in self.postings]
+        useful = [g for g in grams if g not in self.stop_grams] or grams
+        if not useful:
+            return np.empty(0, dtype=np.int64)
+
+        weights = np.array([self.idf[g] for g in useful])
+        hits = [self.postings[g] for g in useful]
+        entries = np.concatenate(hits)
+        overlap = np.bincount(entries, weights=np.repeat(weights, [len(h) for h in hits]), minlength=self.size)
+        if restrict is not None:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[restrict] = True
+            overlap[~mask] = 0
+
+        selected = np.flatnonzero(overlap >= min_overlap * weights.sum())
+        if len(selected) > max_candidates:
+            best = np.argpartition(-overlap[selected], max_candidates - 1)[:max_candidates]
+            selected = selected[best]
+        return np.sort(selected).astype(np.int64)
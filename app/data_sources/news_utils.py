@@ -1,15 +1,243 @@
-import requests
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
 import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit
 
-def fetch_news(name, limit=5):
-    url = f"https://news.google.com/rss/search?q={requests.utils.quote(name)}"
+import requests
+import streamlit as st
+
+from config import settings
+from response_cache import get_response_cache
+from async_runtime import run_async
+
+logger = logging.getLogger("news_utils")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS news_items (
+    key TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    link TEXT,
+    source TEXT,
+    date TEXT,
+    published REAL,
+    first_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS news_orgs (
+    key TEXT NOT NULL,
+    org TEXT NOT NULL,
+    PRIMARY KEY (key, org)
+);
+CREATE TABLE IF NOT EXISTS news_polls (
+    org TEXT PRIMARY KEY,
+    last_polled REAL NOT NULL,
+    last_published REAL
+);
+CREATE INDEX IF NOT EXISTS idx_news_orgs_org ON news_orgs(org);
+"""
+
+def news_url(name: str) -> str:
+    return f"https://news.google.com/rss/search?q={requests.utils.quote(name)}"
+
+# -------------------------
+# Feed parsing
+# -------------------------
+def _published(date: str):
     try:
-        r = requests.get(url, timeout=10)
-        root = ET.fromstring(r.content)
-        items = root.findall(".//item")[:limit]
-        return [
-            {"title": i.find("title").text, "link": i.find("link").text, "date": i.find("pubDate").text}
-            for i in items
-        ]
+        return parsedate_to_datetime(date).timestamp()
     except Exception:
+        return None
+
+class FeedReader:
+    """
+    Incremental RSS parser. Called with each body chunk as it downloads (the stop hook of
+    HttpClient.fetch / get_prefix); returns True once limit <item>s are complete, so the
+    rest of the feed is never read. str() names the limit for the response-cache key.
+    """
+
+    def __init__(self, limit: int = None):
+        self.limit = limit
+        self.items = []
+        self.done = False
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    def __str__(self):
+        return f"rss_items={self.limit or ''}"
+
+    def __call__(self, chunk: bytes) -> bool:
+        if self.done:
+            return True
+        try:
+            self._parser.feed(chunk)
+            for _, elem in self._parser.read_events():
+                if elem.tag != "item":
+                    continue
+                date = elem.findtext("pubDate")
+                self.items.append({
+                    "title": (elem.findtext("title") or "").strip(),
+                    "link": (elem.findtext("link") or "").strip(),
+                    "date": date,
+                    "published": _published(date),
+                    "source": (elem.findtext("source") or "").strip(),
+                })
+                elem.clear()
+                if self.limit and len(self.items) >= self.limit:
+                    self.done = True
+                    break
+        except ET.ParseError:
+            self.done = True  # nothing after a syntax error is usable
+        return self.done
+
+def parse_feed(content: bytes, limit: int = None) -> list[dict]:
+    """
+    <item>s of an RSS document (or of the prefix read by FeedReader), at most limit.
+    A truncated document yields the items completed before the cut.
+    """
+    reader = FeedReader(limit)
+    reader(content)
+    return reader.items
+
+# -------------------------
+# Dedup keys
+# -------------------------
+def canonical_link(link: str) -> str:
+    """Link without scheme differences, www., query, fragment or trailing slash."""
+    parts = urlsplit(link or "")
+    host = (parts.hostname or "").lower()
+    host = host[4:] if host.startswith("www.") else host
+    return urlunsplit(("https", host, parts.path.rstrip("/"), "", ""))
+
+def title_key(title: str, source: str = "") -> str:
+    """Hash of the headline with the ' - Publisher' suffix removed (syndicated copies collide)."""
+    if source and title.endswith(f" - {source}"):
+        title = title[: -len(source) - 3]
+    title = re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", title.lower())).strip()
+    return hashlib.sha1(title.encode()).hexdigest()
+
+def dedupe_items(items: list[dict]) -> list[dict]:
+    """
+    Merge items that share a canonical link or a title hash, keeping the first copy
+    (feed order) and the union of the orgs it was found for.
+    """
+    merged, by_link, by_title = [], {}, {}
+    for item in items:
+        link, key = canonical_link(item["link"]), title_key(item["title"], item.get("source", ""))
+        existing = by_link.get(link) if item["link"] else None
+        existing = existing or by_title.get(key)
+        if existing is not None:
+            for org in item.get("orgs", []):
+                if org not in existing["orgs"]:
+                    existing["orgs"].append(org)
+            continue
+        item = dict(item, key=key, orgs=list(item.get("orgs", [])))
+        merged.append(item)
+        by_title[key] = item
+        if item["link"]:
+            by_link[link] = item
+    return merged
+
+# -------------------------
+# Fetching
+# -------------------------
+async def afetch_news(name: str, limit: int = 5) -> list[dict]:
+    """
+    Google News RSS items for one org name, at most limit. The feed is parsed as it
+    streams in and the download stops once limit items are complete (or at NEWS_MAX_BYTES).
+    """
+    try:
+        reader = FeedReader(limit)
+        resp = await get_response_cache().aget(news_url(name), "news", max_bytes=settings.NEWS_MAX_BYTES,
+                                               stop=reader)
+        if not resp.ok:
+            return []
+        # Fresh fetches were parsed on the way in; cache hits (and shared fetches) hold the prefix
+        items = reader.items if reader.done and not resp.from_cache else parse_feed(resp.content, limit)
+        return [dict(item, orgs=[name]) for item in items]
+    except Exception as e:
+        logger.info(f"[News] {name}: {e}")
         return []
+
+async def afetch_news_many(names: list[str], limit: int = 5) -> list[dict]:
+    """Feeds for many org names fetched concurrently; syndicated stories merged across orgs."""
+    feeds = await asyncio.gather(*(afetch_news(name, limit) for name in names))
+    return dedupe_items([item for feed in feeds for item in feed])
+
+def fetch_news(name, limit=5):
+    """Blocking wrapper for afetch_news (runs on the shared background loop)."""
+    return dedupe_items(run_async(afetch_news(name, limit)))
+
+# -------------------------
+# Store
+# -------------------------
+class NewsStore:
+    """
+    SQLite store of seen news items (keyed by title hash) per org, with each org's
+    newest pubDate so later polls only surface items published after it.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.NEWS_DB_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, items: list[dict]) -> dict:
+        """
+        Store deduped items and return {org: [new items]} -- items not seen before for
+        that org and published after its previous newest item.
+        """
+        now = time.time()
+        new = {}
+        conn = self._conn()
+        with conn:
+            for org in {org for item in items for org in item["orgs"]}:
+                row = conn.execute("SELECT last_published FROM news_polls WHERE org = ?", (org,)).fetchone()
+                watermark = row[0] if row else None
+                fresh = []
+                for item in (i for i in items if org in i["orgs"]):
+                    seen = conn.execute("SELECT 1 FROM news_orgs WHERE key = ? AND org = ?", (item["key"], org)).fetchone()
+                    if seen or (watermark and item["published"] and item["published"] <= watermark):
+                        continue
+                    fresh.append(item)
+                    conn.execute(
+                        "INSERT OR IGNORE INTO news_items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (item["key"], item["title"], item["link"], item["source"], item["date"], item["published"], now),
+                    )
+                    conn.execute("INSERT OR IGNORE INTO news_orgs VALUES (?, ?)", (item["key"], org))
+                latest = max([i["published"] for i in items if org in i["orgs"] and i["published"]] + [watermark or 0])
+                conn.execute("INSERT OR REPLACE INTO news_polls VALUES (?, ?, ?)", (org, now, latest or None))
+                new[org] = fresh
+        return new
+
+    def latest(self, org: str, limit: int = 20) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT i.title, i.link, i.source, i.date, i.published, i.first_seen FROM news_items i "
+            "JOIN news_orgs o ON o.key = i.key WHERE o.org = ? ORDER BY i.published DESC LIMIT ?",
+            (org, limit),
+        ).fetchall()
+        keys = ("title", "link", "source", "date", "published", "first_seen")
+        return [dict(zip(keys, row)) for row in rows]
+
+@st.cache_resource
+def get_news_store() -> NewsStore:
+    """Single NewsStore per process."""
+    return NewsStore()
+
+def poll_news(names: list[str], limit: int = 20) -> dict:
+    """Fetch feeds for many orgs at once and return only the items new since the last poll, per org."""
+    return get_news_store().record(run_async(afetch_news_many(names, limit)))
@@ -0,0 +1,396 @@
+import re
+import time
+import hashlib
+import threading
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import process, fuzz
+from data_sources.cms_utils import find_ccn_column
+from data_sources.name_index import GramIndex
+
+# -------------------------
+# Normalize organization name
+# -------------------------
+def normalize_name(name: str) -> str:
+    """
+    Lowercase, remove punctuation, and remove common words like 'hospital' or 'clinic'.
+    """
+    name = name.lower()
+    name = re.sub(r'[^\w\s]', '', name)
+    for word in ['hospital', 'medical center', 'center', 'clinic']:
+        name = name.replace(word, '')
+    return name.strip()
+
+# -------------------------
+# Column resolution
+# -------------------------
+NAME_COLUMNS = ["Facility Name", "Hospital Name"]
+CITY_COLUMNS = ["City/Town", "City"]
+STATE_COLUMNS = ["State"]
+
+# Slices larger than this go through the gram index before fuzzy scoring
+BLOCKING_MIN_CANDIDATES = 2000
+
+def _resolve_column(df, preferred, keyword=None):
+    for col in preferred:
+        if col in df.columns:
+            return col
+    if keyword:
+        for col in df.columns:
+            if keyword in col.lower():
+                return col
+    return None
+
+def _key(value) -> str:
+    return str(value).strip().upper() if value is not None else ""
+
+# -------------------------
+# Precomputed matcher
+# -------------------------
+class OrgMatcher:
+    """
+    Name matcher built once per CMS snapshot.
+    Holds normalized facility names as one list plus positional indexes by state
+    and (state, city), so a query is a single fuzzy scan over a precomputed slice.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.index = df.index
+        self.name_col = _resolve_column(df, NAME_COLUMNS, "name")
+        self.city_col = _resolve_column(df, CITY_COLUMNS, "city")
+        self.state_col = _resolve_column(df, STATE_COLUMNS)
+        self.ccn_col = find_ccn_column(df)
+
+        self.names, self.names_norm, self.names_lower = [], [], []
+        positions = []
+        if self.name_col:
+            for pos, raw in enumerate(df[self.name_col].tolist()):
+                if not isinstance(raw, str) or not raw:
+                    continue
+                positions.append(pos)
+                self.names.append(raw)
+                self.names_norm.append(normalize_name(raw))
+                self.names_lower.append(raw.lower())
+        # Row position in df for each entry of names/names_norm
+        self.positions = np.asarray(positions, dtype=np.int64)
+        ccn_values = df[self.ccn_col].tolist() if self.ccn_col else []
+        self.ccns = [ccn_values[pos] for pos in positions] if ccn_values else [None] * len(positions)
+        self.by_ccn = {str(c): i for i, c in enumerate(self.ccns) if c is not None and pd.notna(c)}
+
+        states = df[self.state_col].tolist() if self.state_col else []
+        cities = df[self.city_col].tolist() if self.city_col else []
+        self.entry_states = [states[pos] for pos in positions] if states else [None] * len(positions)
+        self.entry_cities = [cities[pos] for pos in positions] if cities else [None] * len(positions)
+        by_state, by_city, by_state_city = defaultdict(list), defaultdict(list), defaultdict(list)
+        for i, pos in enumerate(positions):
+            st_key = _key(states[pos]) if states else ""
+            ct_key = _key(cities[pos]) if cities else ""
+            by_state[st_key].append(i)
+            by_city[ct_key].append(i)
+            by_state_city[(st_key, ct_key)].append(i)
+
+        # Each slice keeps its own contiguous list of normalized names
+        self._slices = {}
+        for prefix, groups in (("state", by_state), ("city", by_city), ("state_city", by_state_city)):
+            for k, ids in groups.items():
+                ids = np.asarray(ids, dtype=np.int64)
+                self._slices[(prefix, k)] = (ids, [self.names_norm[i] for i in ids])
+
+        self.gram_index = GramIndex(self.names_norm)
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, state: str = None, city: str = None):
+        """(entry ids, normalized names) for the optional state/city filter."""
+        if state and city:
+            key = ("state_city", (_key(state), _key(city)))
+        elif state:
+            key = ("state", _key(state))
+        elif city:
+            key = ("city", _key(city))
+        else:
+            return np.arange(len(self.names)), self.names_norm
+        return self._slices.get(key, (np.empty(0, dtype=np.int64), []))
+
+    def scan_set(self, query_norm: str, ids, choices_norm, blocking: bool = True):
+        """
+        Narrow a candidate slice with the gram index when it is large enough to matter.
+        Returns (entry ids, normalized names) to hand to rapidfuzz.
+        """
+        if not blocking or len(ids) < BLOCKING_MIN_CANDIDATES:
+            return ids, choices_norm
+        restrict = ids if len(ids) < len(self.names) else None
+        blocked = self.gram_index.candidates(query_norm, restrict=restrict)
+        return blocked, [self.names_norm[i] for i in blocked]
+
+    def row(self, entry_id: int):
+        """CMS row (Series) for a matcher entry id."""
+        return self.df.iloc[int(self.positions[entry_id])]
+
+    def row_for_ccn(self, ccn):
+        """CMS row for an exact CCN, or None (bulk runs already know the facility)."""
+        entry = self.by_ccn.get(str(ccn))
+        return self.row(entry) if entry is not None else None
+
+    def _score(self, name: str, state: str = None, city: str = None, top_k: int = 5, blocking: bool = True):
+        """
+        Score a name against the candidate slice. WRatio is computed in one cdist pass over
+        the precomputed names; token_set and partial only over the best RANK_POOL of those.
+        Returns (entry ids, 3 x k score matrix, match scores), best blended score first.
+        """
+        ids, choices_norm = self.candidates(state, city)
+        name_norm = normalize_name(name)
+        scan_ids, scan_choices = self.scan_set(name_norm, ids, choices_norm, blocking)
+        if len(scan_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty((len(RANK_SCORERS), 0)), np.empty(0)
+
+        wratio = process.cdist([name_norm], scan_choices, scorer=fuzz.WRatio, dtype=np.float32, workers=1)[0]
+        pool_size = min(max(RANK_POOL, top_k), len(scan_ids))
+        pool = np.argpartition(-wratio, pool_size - 1)[:pool_size]
+        pool_choices = [scan_choices[i] for i in pool]
+        scores = np.vstack([wratio[pool]] + [
+            process.cdist([name_norm], pool_choices, scorer=scorer, dtype=np.float32, workers=1)[0]
+            for scorer in (fuzz.token_set_ratio, fuzz.partial_ratio)
+        ])
+
+        blend = RANK_WEIGHTS @ scores
+        k = min(top_k, len(pool))
+        top = np.argsort(-blend, kind="stable")[:k]
+        runner_up = blend[top[1]] if len(top) > 1 else 0.0
+        margins = np.where(np.arange(k) == 0, blend[top[0]] - runner_up, blend[top] - blend[top[0]])
+        return scan_ids[pool[top]], scores[:, top].astype(float), match_score(blend[top], margins)
+
+    def _ranked_frame(self, name: str, entries, scores, match_scores) -> pd.DataFrame:
+        columns = {
+            "entry": entries,
+            "match_name": [self.names[e] for e in entries],
+            "ccn": [self.ccns[e] for e in entries],
+            "city": [self.entry_cities[e] for e in entries],
+            "state": [self.entry_states[e] for e in entries],
+        }
+        for i, label in enumerate(RANK_SCORERS):
+            columns[label] = scores[i].round(1)
+        columns["match_score"] = match_scores.round(3)
+        columns["substring"] = [name.lower() in self.names_lower[e] for e in entries]
+        return pd.DataFrame(columns, columns=RANK_COLUMNS)
+
+    def rank(self, name: str, state: str = None, city: str = None, top_k: int = 5, blocking: bool = True) -> pd.DataFrame:
+        """
+        Top-k candidates with WRatio, token_set and partial scores plus a match score in [0, 1].
+        Columns: see RANK_COLUMNS. Empty frame if nothing shares a gram with the query.
+        """
+        return self._ranked_frame(name, *self._score(name, state, city, top_k, blocking))
+
+    def _pick(self, name: str, entries, scores, score_cutoff: float):
+        """
+        Walks the candidates in ranked (blended score) order, the same order callers see:
+        the first whose WRatio clears score_cutoff, else the first whose name contains the
+        query (substring fallback). Returns (entry, message).
+        """
+        if len(entries) == 0:
+            return None, "No match found"
+        for rank, entry in enumerate(entries):
+            if scores[0, rank] >= score_cutoff:
+                return entry, f"Matched '{self.names[entry]}' (score {round(float(scores[0, rank]), 1)})"
+
+        # Fallback: substring match among the ranked candidates (no second scan)
+        needle = name.lower()
+        for entry in entries:
+            if needle in self.names_lower[entry]:
+                return entry, f"Substring fallback: '{self.names[entry]}'"
+        return None, "No match found"
+
+    def match_ranked(self, name: str, state: str = None, city: str = None, top_k: int = 5,
+                     score_cutoff: float = 90, blocking: bool = True, with_candidates: bool = True):
+        """
+        Single-pass match: (matched row, name column, message, ranked candidates).
+        The ranked frame is None when with_candidates is False.
+        """
+        empty = pd.DataFrame(columns=RANK_COLUMNS) if with_candidates else None
+        if not self.name_col:
+            return None, None, "No name column found in dataframe", empty
+
+        ids, _ = self.candidates(state, city)
+        if len(ids) == 0:
+            return None, None, "No facilities found with specified state/city", empty
+
+        entries, scores, match_scores = self._score(name, state, city, top_k, blocking)
+        entry, message = self._pick(name, entries, scores, score_cutoff)
+        ranked = self._ranked_frame(name, entries, scores, match_scores) if with_candidates else None
+        row = self.row(entry) if entry is not None else None
+        return row, self.name_col, message, ranked
+
+    def match(self, name: str, state: str = None, city: str = None, score_cutoff: float = 90, blocking: bool = True):
+        """
+        Same contract as google_utils.match_org: (matched row, name column, message).
+        """
+        return self.match_ranked(name, state=state, city=city, score_cutoff=score_cutoff,
+                                 blocking=blocking, with_candidates=False)[:3]
+
+    def match_many(self, names, states=None, cities=None, top_k: int = 3, score_cutoff: float = 90,
+                   scorer=fuzz.WRatio, chunk_size: int = 2048, workers: int = -1) -> pd.DataFrame:
+        """
+        Bulk version of match(): score many names against the precomputed index with
+        rapidfuzz.process.cdist on all cores. Queries sharing a state/city filter are scored
+        together; duplicate normalized names are scored once, in chunks of chunk_size rows
+        to bound the score matrix.
+        states/cities may be None, a single value, or one value per name.
+        Returns one row per (query, candidate rank) with columns:
+        query_index, query, state, city, rank, match_name, ccn, score, method
+        where method is "fuzzy", "substring" or None (nothing above the cutoff).
+        """
+        names = list(names)
+        states = _broadcast(states, len(names))
+        cities = _broadcast(cities, len(names))
+
+        groups = defaultdict(list)
+        for qi, (st_val, ct_val) in enumerate(zip(states, cities)):
+            groups[(_key(st_val) if _present(st_val) else "", _key(ct_val) if _present(ct_val) else "")].append(qi)
+
+        records = []
+        for (st_key, ct_key), query_ids in groups.items():
+            ids, choices = self.candidates(st_key or None, ct_key or None)
+            if len(ids) == 0:
+                records.extend(self._record(qi, names, states, cities, None, None, None, None) for qi in query_ids)
+                continue
+            k = min(top_k, len(ids))
+
+            # Score each distinct normalized query once
+            unique = {}
+            for qi in query_ids:
+                unique.setdefault(normalize_name(str(names[qi])), []).append(qi)
+            queries = list(unique)
+
+            for start in range(0, len(queries), chunk_size):
+                chunk = queries[start:start + chunk_size]
+                scores = process.cdist(chunk, choices, scorer=scorer, dtype=np.float32, workers=workers)
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+                for row, query_norm in enumerate(chunk):
+                    for qi in unique[query_norm]:
+                        entries = [int(ids[j]) for j in top[row]]
+                        entry_scores = [float(x) for x in top_scores[row]]
+                        method = "fuzzy" if entry_scores[0] >= score_cutoff else None
+                        if method is None:
+                            # Fallback: substring match on the raw name, promoted to rank 1
+                            needle = str(names[qi]).lower()
+                            col = next((j for j, e in enumerate(ids) if needle and needle in self.names_lower[e]), None)
+                            if col is not None:
+                                method = "substring"
+                                hit = int(ids[col])
+                                rest = [(e, sc) for e, sc in zip(entries, entry_scores) if e != hit]
+                                entries, entry_scores = zip(*([(hit, float(scores[row, col]))] + rest)[:k])
+                        for rank, (entry, sc) in enumerate(zip(entries, entry_scores), start=1):
+                            records.append(self._record(qi, names, states, cities, rank, entry, sc, method))
+
+        out = pd.DataFrame.from_records(records, columns=BULK_COLUMNS)
+        out["rank"] = out["rank"].astype("Int64")
+        return out.sort_values(["query_index", "rank"], kind="stable", ignore_index=True)
+
+    def _record(self, qi, names, states, cities, rank, entry, score, method):
+        if entry is None:
+            return (qi, names[qi], states[qi], cities[qi], None, None, None, None, None)
+        return (qi, names[qi], states[qi], cities[qi], rank, self.names[entry], self.ccns[entry], score, method)
+
+RANK_SCORERS = ["wratio", "token_set", "partial"]
+RANK_WEIGHTS = np.array([0.6, 0.3, 0.1], dtype=np.float32)
+RANK_POOL = 32
+RANK_COLUMNS = ["entry", "match_name", "ccn", "city", "state", "wratio", "token_set", "partial", "match_score", "substring"]
+
+def match_score(blend, margin):
+    """
+    Ranking score in [0, 1]: a logistic squash of the blended score and its margin over
+    the runner-up (negative for non-top candidates). The constants are hand-set, not
+    fitted on labeled matches, so this orders candidates but is not a probability:
+    a blend of 85 with no margin lands at 0.5, an exact, unambiguous name near 1.
+    """
+    z = (np.asarray(blend, dtype=np.float64) - 85.0) / 4.0 + np.clip(margin, -20, 20) / 10.0
+    return 1.0 / (1.0 + np.exp(-z))
+
+BULK_COLUMNS = ["query_index", "query", "state", "city", "rank", "match_name", "ccn", "score", "method"]
+
+def _present(value) -> bool:
+    return value is not None and not (isinstance(value, float) and np.isnan(value)) and str(value).strip() != ""
+
+def _broadcast(values, n):
+    """None / scalar / sequence -> list of length n."""
+    if values is None or isinstance(values, str):
+        return [values] * n
+    values = list(values)
+    if len(values) != n:
+        raise ValueError(f"Expected {n} values, got {len(values)}")
+    return values
+
+# -------------------------
+# Blocking recall
+# -------------------------
+def blocking_recall(matcher: OrgMatcher, queries, score_cutoff: float = 90) -> dict:
+    """
+    Measure the gram-index blocking step against the exhaustive scan.
+    Recall is the share of queries with an exhaustive match >= score_cutoff whose
+    blocked top-1 has the same score (ties on score count as agreement).
+    """
+    found = agree = 0
+    exhaustive_s = blocked_s = 0.0
+    all_choices = matcher.names_norm
+    for q in queries:
+        q_norm = normalize_name(str(q))
+        t = time.perf_counter()
+        full = process.extractOne(q_norm, all_choices, scorer=fuzz.WRatio, score_cutoff=score_cutoff)
+        exhaustive_s += time.perf_counter() - t
+
+        t = time.perf_counter()
+        choices = [matcher.names_norm[i] for i in matcher.gram_index.candidates(q_norm)]
+        blocked = process.extractOne(q_norm, choices, scorer=fuzz.WRatio, score_cutoff=score_cutoff)
+        blocked_s += time.perf_counter() - t
+
+        if full:
+            found += 1
+            agree += bool(blocked and blocked[1] >= full[1])
+    n = max(len(queries), 1)
+    return {
+        "queries": len(queries),
+        "exhaustive_matches": found,
+        "recall": agree / found if found else 1.0,
+        "exhaustive_ms": 1000 * exhaustive_s / n,
+        "blocked_ms": 1000 * blocked_s / n,
+    }
+
+# -------------------------
+# Per-snapshot cache
+# -------------------------
+_MATCHERS = {}
+_MATCHERS_LOCK = threading.Lock()
+_MAX_MATCHERS = 4
+
+def frame_fingerprint(df) -> str:
+    """Hash of a frame's columns and contents (index included), for frames without a source fingerprint."""
+    h = hashlib.sha256("\x1f".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+def matcher_for(df) -> OrgMatcher:
+    """
+    Return the OrgMatcher for this CMS frame, building it once per snapshot.
+    Frames loaded from a file carry its fingerprint in df.attrs; any other frame is keyed
+    by a hash of its contents (object ids are reused, so they cannot tell frames apart).
+    """
+    key = df.attrs.get("source_fingerprint") or frame_fingerprint(df)
+    with _MATCHERS_LOCK:
+        cached = _MATCHERS.get(key)
+        if cached is not None and cached.index.equals(df.index):
+            return cached
+    matcher = OrgMatcher(df)
+    with _MATCHERS_LOCK:
+        if len(_MATCHERS) >= _MAX_MATCHERS:
+            _MATCHERS.pop(next(iter(_MATCHERS)))
+        _MATCHERS[key] = matcher
+    return matcher
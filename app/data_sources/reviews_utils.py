@@ -1,41 +1,74 @@
 import requests
+from response_cache import cached_get, json_status_ok
+from place_id_cache import get_place_id_cache, place_match_score
 from bs4 import BeautifulSoup
 from datetime import datetime
 
-def fetch_reviews(name, api_key=None, max_reviews=25):
+def place_details(place_id, api_key) -> dict:
+    """Places details JSON for a place_id (cached)."""
+    return place_details_response(place_id, api_key).json()
+
+def place_details_response(place_id, api_key):
+    """Places details CachedResponse for a place_id (from_cache tells a network fetch from a cache hit)."""
+    details_url = (
+        f"https://maps.googleapis.com/maps/api/place/details/json?"
+        f"place_id={place_id}&fields=name,reviews,formatted_address,rating,"
+        f"user_ratings_total,formatted_phone_number,international_phone_number,"
+        f"website,opening_hours,geometry,types,place_id&key={api_key}"
+    )
+    return cached_get(details_url, "places_details", validate=json_status_ok, timeout=10)
+
+def fetch_reviews(name, api_key=None, max_reviews=25, ccn=None, cms_name=None):
+    """
+    Google reviews for an org. Pass the CMS ccn (and facility name) to reuse a known
+    place_id and skip the Places text search.
+    """
     reviews_data = []
     place = {}
 
     if api_key:
         try:
-            search_url = (
-                f"https://maps.googleapis.com/maps/api/place/textsearch/json?"
-                f"query={requests.utils.quote(name)}&key={api_key}"
-            )
-            search_resp = requests.get(search_url, timeout=10).json()
-            results = search_resp.get("results", [])
-            if results:
-                place = results[0]
-                place_id = place.get("place_id")
-                if place_id:
-                    details_url = (
-                        f"https://maps.googleapis.com/maps/api/place/details/json?"
-                        f"place_id={place_id}&fields=name,reviews,formatted_address,rating,"
-                        f"user_ratings_total,formatted_phone_number,international_phone_number,"
-                        f"website,opening_hours,geometry,types,place_id&key={api_key}"
-                    )
-                    details_resp = requests.get(details_url, timeout=10).json()
-                    place = details_resp.get("result", {})
-                    for r in place.get("reviews", []):
-                        reviews_data.append({
-                            "name": place.get("name"),
-                            "address": place.get("formatted_address"),
-                            "rating": r.get("rating"),
-                            "user_ratings_total": place.get("user_ratings_total"),
-                            "author_name": r.get("author_name"),
-                            "review_text": r.get("text"),
-                            "time": datetime.utcfromtimestamp(r.get("time")).isoformat() if r.get("time") else None
-                        })
+            place_ids = get_place_id_cache()
+            details_resp = None
+            known = place_ids.usable(ccn)
+            if known:
+                resp = place_details_response(known["place_id"], api_key)
+                details_resp = resp.json()
+                if details_resp.get("status") in ("NOT_FOUND", "INVALID_REQUEST"):
+                    # Place was removed or merged: drop the mapping and search again
+                    place_ids.forget(ccn)
+                    details_resp = None
+                elif details_resp.get("status") == "OK" and not resp.from_cache:
+                    # Only a live answer re-verifies the mapping; a cached one may be days old
+                    place_ids.touch(ccn)
+                elif known["expired"]:
+                    place_ids.refresh_later(ccn, cms_name, name, api_key)
+            if details_resp is None:
+                search_url = (
+                    f"https://maps.googleapis.com/maps/api/place/textsearch/json?"
+                    f"query={requests.utils.quote(name)}&key={api_key}"
+                )
+                search_resp = cached_get(search_url, "places_search", validate=json_status_ok, timeout=10).json()
+                results = search_resp.get("results", [])
+                if results:
+                    place = results[0]
+                    place_id = place.get("place_id")
+                    if place_id and ccn:
+                        place_ids.put(ccn, place_id, place.get("name"), place_match_score(cms_name or name, place.get("name")))
+                    if place_id:
+                        details_resp = place_details(place_id, api_key)
+            if details_resp:
+                place = details_resp.get("result", {})
+                for r in place.get("reviews", []):
+                    reviews_data.append({
+                        "name": place.get("name"),
+                        "address": place.get("formatted_address"),
+                        "rating": r.get("rating"),
+                        "user_ratings_total": place.get("user_ratings_total"),
+                        "author_name": r.get("author_name"),
+                        "review_text": r.get("text"),
+                        "time": datetime.utcfromtimestamp(r.get("time")).isoformat() if r.get("time") else None
+                    })
         except Exception:
             pass
 
@@ -43,7 +76,7 @@ def fetch_reviews(name, api_key=None, max_reviews=25):
         try:
             remaining = max_reviews - len(reviews_data)
             query = requests.utils.quote(name + " reviews")
-            r = requests.get(f"https://www.google.com/search?q={query}", headers={"User-Agent":"Mozilla/5.0"}, timeout=10)
+            r = cached_get(f"https://www.google.com/search?q={query}", "google_search", headers={"User-Agent":"Mozilla/5.0"}, timeout=10)
             soup = BeautifulSoup(r.text, "html.parser")
             snippets = [span.get_text() for span in soup.find_all("span") if len(span.get_text()) > 20][:remaining]
             for s in snippets:
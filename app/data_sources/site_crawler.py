@@ -0,0 +1,264 @@
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+from bs4 import BeautifulSoup
+
+from config import settings
+from response_cache import get_response_cache
+from data_sources.website_scraper import about_fields
+
+logger = logging.getLogger("site_crawler")
+
+# One agent string for both the requests and the robots.txt rules they are checked against
+HEADERS = {"User-Agent": settings.CRAWL_USER_AGENT}
+
+# Page kinds and the path / link-text keywords that identify them
+PAGE_KINDS = {
+    "about": ("about", "who-we-are", "who we are", "our-story", "our story", "overview"),
+    "mission": ("mission", "vision", "values"),
+    "leadership": ("leadership", "executive", "board", "administration", "our-team", "our team"),
+    "locations": ("locations", "find-a-location", "find a location", "campuses", "facilities", "directions"),
+}
+SKIP_EXTENSIONS = re.compile(r"\.(pdf|jpe?g|png|gif|svg|webp|zip|docx?|xlsx?|pptx?|mp4|mp3)$", re.I)
+
+# schema.org types that describe the organization itself
+ORG_TYPES = {
+    "Organization", "MedicalOrganization", "Hospital", "MedicalClinic", "MedicalCenter",
+    "LocalBusiness", "MedicalBusiness", "HealthAndBeautyBusiness", "Physician",
+}
+ORG_FIELDS = ("name", "legalName", "url", "telephone", "email", "description", "foundingDate", "logo", "sameAs")
+
+# -------------------------
+# URLs
+# -------------------------
+def site_domain(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def clean_url(url: str) -> str:
+    """Absolute http(s) URL without fragment; bare hosts get https://."""
+    if not re.match(r"^https?://", url, re.I):
+        url = "https://" + url.lstrip("/")
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+def classify_link(url: str, text: str = ""):
+    """Page kind for a link from its path or anchor text, or None."""
+    path = urlsplit(url).path.lower()
+    text = (text or "").lower()
+    for kind, keywords in PAGE_KINDS.items():
+        if any(k in path for k in keywords) or any(k in text for k in keywords):
+            return kind
+    return None
+
+# -------------------------
+# robots.txt
+# -------------------------
+_robots = OrderedDict()  # origin -> (RobotFileParser, expires_at), least recently used first
+_robots_lock = threading.Lock()
+
+async def robots_for(url: str) -> RobotFileParser:
+    """
+    Parsed robots.txt for the URL's origin. The raw file lives in the response cache; the
+    last CRAWL_ROBOTS_CACHE parsed files are also kept in memory.
+    """
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    with _robots_lock:
+        entry = _robots.get(origin)
+        if entry is not None and entry[1] > time.time():
+            _robots.move_to_end(origin)
+            return entry[0]
+
+    parser = RobotFileParser(origin + "/robots.txt")
+    try:
+        resp = await get_response_cache().aget(origin + "/robots.txt", "robots", headers=HEADERS)
+        if resp.status_code in (401, 403):
+            parser.disallow_all = True
+        elif resp.ok:
+            parser.parse(resp.text.splitlines())
+        else:
+            parser.allow_all = True
+    except Exception as e:
+        logger.info(f"robots.txt unavailable for {origin}: {e}")
+        parser.allow_all = True
+    with _robots_lock:
+        _robots[origin] = (parser, time.time() + settings.CACHE_TTLS["robots"])
+        _robots.move_to_end(origin)
+        while len(_robots) > settings.CRAWL_ROBOTS_CACHE:
+            _robots.popitem(last=False)
+    return parser
+
+# -------------------------
+# Per-domain concurrency
+# -------------------------
+_semaphores = weakref.WeakKeyDictionary()  # event loop -> {host: Semaphore}
+
+def domain_semaphore(host: str) -> asyncio.Semaphore:
+    """
+    Process-wide CRAWL_PER_DOMAIN limit for a host, shared by every crawl on the running
+    loop (the batch workers all crawl on the one background loop).
+    """
+    hosts = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if host not in hosts:
+        hosts[host] = asyncio.Semaphore(settings.CRAWL_PER_DOMAIN)
+    return hosts[host]
+
+# -------------------------
+# Extraction
+# -------------------------
+def _jsonld_items(data):
+    """Flatten JSON-LD (lists and @graph) into a list of dict nodes."""
+    if isinstance(data, list):
+        return [item for d in data for item in _jsonld_items(d)]
+    if isinstance(data, dict):
+        return [data] + _jsonld_items(data.get("@graph", []))
+    return []
+
+def _types(item) -> set:
+    t = item.get("@type", [])
+    return set(t) if isinstance(t, list) else {t}
+
+def format_address(address) -> str:
+    if isinstance(address, str):
+        return address.strip()
+    if isinstance(address, dict):
+        keys = ("streetAddress", "addressLocality", "addressRegion", "postalCode")
+        return ", ".join(str(address[k]).strip() for k in keys if address.get(k))
+    return ""
+
+def extract_page(html: str, url: str) -> dict:
+    """
+    Everything the profile needs from one page in a single parse: title / meta
+    description / h1, section headings, leading paragraph text, schema.org JSON-LD
+    organization fields and addresses, and outgoing links.
+    """
+    soup = BeautifulSoup(html, "lxml")
+    page = about_fields(soup, url)
+
+    items = []
+    for script in soup.find_all("script", attrs={"type": "application/ld+json"}):
+        try:
+            items += _jsonld_items(json.loads(script.string or ""))
+        except ValueError:
+            continue
+
+    organization, addresses = {}, []
+    for item in items:
+        if item.get("address"):
+            for address in item["address"] if isinstance(item["address"], list) else [item["address"]]:
+                text = format_address(address)
+                if text and text not in addresses:
+                    addresses.append(text)
+        if _types(item) & ORG_TYPES:
+            for field in ORG_FIELDS:
+                if item.get(field) and field not in organization:
+                    value = item[field]
+                    organization[field] = value.get("url", "") if isinstance(value, dict) else value
+
+    paragraphs = [p.get_text(" ", strip=True) for p in soup.find_all("p")]
+    page.update({
+        "headings": [h.get_text(" ", strip=True) for h in soup.find_all(["h2", "h3"])][:25],
+        "text": " ".join(p for p in paragraphs if len(p) > 40)[:2000],
+        "organization": organization,
+        "addresses": addresses,
+        "jsonld_types": sorted({t for item in items for t in _types(item) if isinstance(t, str)}),
+        "links": [(urljoin(url, a["href"]), a.get_text(" ", strip=True)) for a in soup.find_all("a", href=True)],
+    })
+    return page
+
+def pick_links(links, domain: str, seen: set, wanted: dict, limit: int):
+    """
+    Same-domain (url, kind) candidates for the page kinds still wanted ({kind: slots}),
+    preferring the shortest path per kind, at most limit in total.
+    """
+    candidates = {}
+    for href, text in links:
+        if not href.lower().startswith(("http://", "https://")):
+            continue
+        url = clean_url(href)
+        if url in seen or site_domain(url) != domain or SKIP_EXTENSIONS.search(urlsplit(url).path):
+            continue
+        kind = classify_link(url, text)
+        if kind and wanted.get(kind, 0) > 0:
+            candidates.setdefault(kind, set()).add(url)
+
+    picked = []
+    for kind, urls in candidates.items():
+        for url in sorted(urls, key=lambda u: (u.count("/"), len(u)))[:wanted[kind]]:
+            picked.append((url, kind))
+    return picked[:limit]
+
+# -------------------------
+# Crawl
+# -------------------------
+async def crawl_site(start_url: str, max_depth: int = None, max_pages: int = None) -> dict:
+    """
+    Crawl the homepage plus its About / Mission / Leadership / Locations pages.
+    Each depth level is fetched concurrently (at most CRAWL_PER_DOMAIN requests in flight
+    per host across all crawls, robots.txt respected), so latency is about one round trip per level.
+    Returns {"url", "pages": {url: fields}, "by_kind": {kind: [urls]}, "organization",
+             "addresses", "blocked": [urls], "errors": {url: message}}.
+    """
+    if not start_url:
+        return {}
+    max_depth = settings.CRAWL_MAX_DEPTH if max_depth is None else max_depth
+    max_pages = max_pages or settings.CRAWL_MAX_PAGES
+
+    home = clean_url(start_url)
+    domain = site_domain(home)
+    cache = get_response_cache()
+    result = {
+        "url": home, "pages": {}, "by_kind": {kind: [] for kind in PAGE_KINDS},
+        "organization": {}, "addresses": [], "blocked": [], "errors": {},
+    }
+
+    async def fetch_page(url):
+        async with domain_semaphore(urlsplit(url).hostname):
+            robots = await robots_for(url)
+            if not robots.can_fetch(settings.CRAWL_USER_AGENT, url):
+                result["blocked"].append(url)
+                return None
+            resp = await cache.aget(url, "website_pages", headers=HEADERS, max_bytes=settings.CRAWL_MAX_BYTES)
+        if not resp.ok:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        # Parsing is CPU work; keep it off the shared event loop
+        return await asyncio.to_thread(extract_page, resp.text, resp.url or url)
+
+    level, seen = [(home, "home")], {home}
+    for depth in range(max_depth + 1):
+        pages = await asyncio.gather(*(fetch_page(url) for url, _ in level), return_exceptions=True)
+        links = []
+        for (url, kind), page in zip(level, pages):
+            if isinstance(page, Exception):
+                result["errors"][url] = str(page)
+                continue
+            if page is None:
+                continue
+            links += page.pop("links")
+            page["kind"] = kind
+            result["pages"][url] = page
+            if kind in result["by_kind"]:
+                result["by_kind"][kind].append(url)
+            for field, value in page["organization"].items():
+                result["organization"].setdefault(field, value)
+            result["addresses"] += [a for a in page["addresses"] if a not in result["addresses"]]
+
+        remaining = max_pages - len(seen)
+        if depth == max_depth or remaining <= 0:
+            break
+        wanted = {kind: settings.CRAWL_PAGES_PER_KIND - len(urls) for kind, urls in result["by_kind"].items()}
+        level = pick_links(links, domain, seen, wanted, remaining)
+        seen.update(url for url, _ in level)
+        if not level:
+            break
+
+    return result
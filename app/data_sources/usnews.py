@@ -1,11 +1,44 @@
-import requests
+import re
+from response_cache import cached_get
 from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 
 DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                   "(KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
 }
 
+# "#3 in California", "High Performing in Cancer", "San Francisco, CA"
+RANK_RE = re.compile(r"#\s?(\d+)\s+in\s+([A-Za-z&,.'/ -]+?)(?=\s*(?:#|\||\n|$|High Performing|Ranked|Nationally))")
+HIGH_PERFORMING_RE = re.compile(r"High Performing(?:\s+in)?\s+([A-Za-z&,.'/ -]+?)(?=\s*(?:#|\||\n|$|High Performing))")
+CITY_STATE_RE = re.compile(r"([A-Z][A-Za-z .'-]+),\s*([A-Z]{2})\b")
+
+# -------------------------
+# Entry normalization
+# -------------------------
+def make_entry(name, city=None, state=None, url=None, text: str = "", rankings=None, specialties=None) -> dict:
+    """Normalized rankings entry; ranks/specialties are parsed out of text when not given."""
+    rankings = list(rankings or [])
+    specialties = list(specialties or [])
+    for rank, title in RANK_RE.findall(text or ""):
+        item = {"rank": int(rank), "list": title.strip(" ,.-")}
+        if item not in rankings:
+            rankings.append(item)
+    for title in HIGH_PERFORMING_RE.findall(text or ""):
+        title = title.strip(" ,.-")
+        if title and title not in specialties:
+            specialties.append(title)
+    rankings.sort(key=lambda r: r["rank"])
+    return {
+        "name": re.sub(r"\s+", " ", str(name)).strip(),
+        "city": str(city).strip().title() if city else None,
+        "state": str(state).strip().upper() if state else None,
+        "url": url,
+        "ranking": f"#{rankings[0]['rank']} in {rankings[0]['list']}" if rankings else "N/A",
+        "rankings": rankings,
+        "specialties": specialties,
+    }
+
 def fetch_usnews_rankings(hospital_name: str, city: str = None):
     """
     Fetch US News rankings for a hospital.
@@ -27,7 +60,7 @@ def fetch_usnews_rankings(hospital_name: str, city: str = None):
 
         url = f"https://health.usnews.com/best-hospitals/search?hospital_name={query}"
 
-        r = requests.get(url, headers=DEFAULT_HEADERS, timeout=15)
+        r = cached_get(url, "usnews", headers=DEFAULT_HEADERS, timeout=15)
         if r.status_code != 200:
             return {"ranking": "N/A", "specialties": [], "error": f"HTTP {r.status_code}"}
 
@@ -55,6 +88,30 @@ def fetch_usnews_rankings(hospital_name: str, city: str = None):
 
 # manual scrape workflow items
 def fetch_usnews_rankings_url(url: str) -> dict:
-    """Scrape US News ranking info directly from a hospital URL."""
-    # Your existing US News scraping logic adapted to accept full URL
-    pass
\ No newline at end of file
+    """
+    Scrape US News ranking info directly from a hospital URL.
+    Returns the same keys as fetch_usnews_rankings plus name, city, state, url and
+    rankings ([{"rank", "list"}]).
+    """
+    if not url:
+        return {"ranking": "N/A", "specialties": [], "error": "No URL provided"}
+    try:
+        r = cached_get(url, "usnews", headers=DEFAULT_HEADERS, timeout=15)
+        if r.status_code != 200:
+            return {"ranking": "N/A", "specialties": [], "error": f"HTTP {r.status_code}"}
+
+        doc = lxml_html.fromstring(r.text)
+        h1 = doc.find(".//h1")
+        name = h1.text_content().strip() if h1 is not None else ""
+        for junk in doc.xpath("//script|//style|//noscript"):
+            junk.drop_tree()
+        text = doc.text_content()
+        city_state = CITY_STATE_RE.search(text)
+        return make_entry(
+            name, city_state.group(1) if city_state else None,
+            city_state.group(2) if city_state else None, url,
+            "\n".join(line.strip() for line in text.splitlines() if line.strip()),
+        )
+
+    except Exception as e:
+        return {"ranking": "N/A", "specialties": [], "error": f"Failed to fetch U.S. News data: {e}"}
@@ -0,0 +1,265 @@
+import io
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from urllib.parse import urljoin
+
+import pandas as pd
+import streamlit as st
+from lxml import html as lxml_html
+
+from config import settings
+from response_cache import get_response_cache
+from async_runtime import run_async
+from data_sources.org_matcher import normalize_name, matcher_for
+from data_sources.yelp_json import json_payloads, walk_json
+from data_sources.usnews import DEFAULT_HEADERS, CITY_STATE_RE, make_entry
+
+logger = logging.getLogger("usnews_index")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usnews_rankings (
+    key TEXT PRIMARY KEY,
+    ccn TEXT,
+    name TEXT NOT NULL,
+    city TEXT,
+    state TEXT,
+    url TEXT,
+    ranking TEXT,
+    rankings TEXT,
+    specialties TEXT,
+    match_name TEXT,
+    match_score REAL,
+    source TEXT,
+    refreshed_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_usnews_ccn ON usnews_rankings(ccn);
+CREATE TABLE IF NOT EXISTS usnews_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Hospital profile links: /best-hospitals/area/<state>/<slug>
+HOSPITAL_URL_RE = re.compile(r"/best-hospitals/area/([a-z]{2})/[a-z0-9-]+", re.I)
+
+def _strings(node):
+    """All string values nested in a JSON node."""
+    for item in walk_json(node):
+        for value in item.values():
+            if isinstance(value, str):
+                yield value
+
+# -------------------------
+# Parsing
+# -------------------------
+def parse_rankings_html(html: str, page_url: str = "") -> list[dict]:
+    """
+    Ranked-hospital entries from a US News list page (or pasted HTML): embedded JSON
+    payloads first, then hospital profile links and the rank text around them.
+    """
+    entries = {}
+    for payload in json_payloads(html):
+        for node in walk_json(payload):
+            url = next((v for v in node.values() if isinstance(v, str) and HOSPITAL_URL_RE.search(v)), None)
+            name = node.get("name") or node.get("hospitalName")
+            if not url or not isinstance(name, str):
+                continue
+            url = urljoin(page_url or "https://health.usnews.com", url)
+            text = "\n".join(_strings(node))
+            loc = node.get("location") if isinstance(node.get("location"), dict) else node
+            state = loc.get("state") or HOSPITAL_URL_RE.search(url).group(1)
+            entries.setdefault(url, make_entry(name, loc.get("city"), state, url, text))
+
+    if entries:
+        return list(entries.values())
+
+    doc = lxml_html.fromstring(html or "<html/>")
+    for anchor in doc.iter("a"):
+        href = anchor.get("href") or ""
+        match = HOSPITAL_URL_RE.search(href)
+        name = anchor.text_content().strip()
+        if not match or not name:
+            continue
+        url = urljoin(page_url or "https://health.usnews.com", href.split("?")[0])
+        # Nearest ancestor that carries rank text is the result card
+        card, text = anchor, ""
+        for _ in range(6):
+            card = card.getparent()
+            if card is None:
+                break
+            text = card.text_content()
+            if "#" in text or "High Performing" in text:
+                break
+        city_state = CITY_STATE_RE.search(text.replace(name, ""))
+        city = city_state.group(1) if city_state else None
+        entry = make_entry(name, city, match.group(1), url, text)
+        if url not in entries or len(entry["rankings"]) > len(entries[url]["rankings"]):
+            entries[url] = entry
+    return list(entries.values())
+
+def parse_rankings_table(text: str) -> list[dict]:
+    """Entries from a pasted CSV/TSV export with a name column (and optional city/state/rank)."""
+    df = pd.read_csv(io.StringIO(text), sep=None, engine="python", dtype=str)
+    cols = {c.lower(): c for c in df.columns}
+    def col(*keywords):
+        return next((cols[c] for c in cols if any(k in c for k in keywords)), None)
+    name_col, city_col, state_col = col("hospital", "name"), col("city"), col("state")
+    rank_cols = [c for c in df.columns if "rank" in c.lower()]
+    if name_col is None:
+        raise ValueError("No hospital/name column in pasted table")
+    entries = []
+    for _, row in df.iterrows():
+        if pd.isna(row[name_col]):
+            continue
+        text = "\n".join(str(row[c]) for c in rank_cols if pd.notna(row[c]))
+        rankings = [] if "#" in text else [
+            {"rank": int(row[c]), "list": c} for c in rank_cols if pd.notna(row[c]) and str(row[c]).isdigit()
+        ]
+        entries.append(make_entry(
+            row[name_col],
+            row[city_col] if city_col and pd.notna(row[city_col]) else None,
+            row[state_col] if state_col and pd.notna(row[state_col]) else None,
+            text=text, rankings=rankings,
+        ))
+    return entries
+
+def parse_rankings_paste(text: str) -> list[dict]:
+    """Pasted US News HTML, or a CSV/TSV export."""
+    if re.search(r"<\w+[^>]*>", text or ""):
+        return parse_rankings_html(text)
+    return parse_rankings_table(text)
+
+# -------------------------
+# Index
+# -------------------------
+class UsnewsIndex:
+    """
+    Local US News rankings keyed by fuzzy-matched CMS CCN (entries that did not match
+    a CCN are kept under their normalized name + state). Lookups are a primary-key read.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.USNEWS_INDEX_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def name_key(name: str, state: str = None) -> str:
+        return f"name:{normalize_name(name)}|{(state or '').upper()}"
+
+    def add(self, entries: list[dict], df_cms: pd.DataFrame = None, source: str = "scrape") -> dict:
+        """Match entries to CMS CCNs (per state) and upsert them. Returns {"entries", "matched"}."""
+        matches = [None] * len(entries)
+        if entries and df_cms is not None and not df_cms.empty:
+            matcher = matcher_for(df_cms)
+            bulk = matcher.match_many(
+                [e["name"] for e in entries], states=[e["state"] for e in entries],
+                top_k=1, score_cutoff=settings.USNEWS_MIN_SCORE,
+            )
+            for row in bulk.itertuples(index=False):
+                if pd.notna(row.method) and pd.notna(row.ccn):
+                    matches[row.query_index] = (str(row.ccn), row.match_name, row.score)
+
+        now = time.time()
+        with self._conn() as conn:
+            for entry, match in zip(entries, matches):
+                ccn, match_name, score = match or (None, None, None)
+                conn.execute(
+                    "INSERT OR REPLACE INTO usnews_rankings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (ccn or self.name_key(entry["name"], entry["state"]), ccn, entry["name"], entry["city"],
+                     entry["state"], entry["url"], entry["ranking"], json.dumps(entry["rankings"]),
+                     json.dumps(entry["specialties"]), match_name, score, source, now),
+                )
+            conn.execute("INSERT OR REPLACE INTO usnews_meta VALUES ('refreshed_at', ?)", (str(now),))
+        return {"entries": len(entries), "matched": sum(m is not None for m in matches)}
+
+    def _row(self, row) -> dict:
+        keys = ("ccn", "name", "city", "state", "url", "ranking", "rankings", "specialties",
+                "match_name", "match_score", "source", "refreshed_at")
+        out = dict(zip(keys, row))
+        out["rankings"] = json.loads(out["rankings"] or "[]")
+        out["specialties"] = json.loads(out["specialties"] or "[]")
+        return out
+
+    def lookup(self, ccn: str = None, name: str = None, state: str = None):
+        """Entry for a CCN (or, failing that, an unmatched entry with this name + state), or None."""
+        conn = self._conn()
+        cols = "ccn, name, city, state, url, ranking, rankings, specialties, match_name, match_score, source, refreshed_at"
+        row = None
+        if ccn:
+            row = conn.execute(f"SELECT {cols} FROM usnews_rankings WHERE key = ?", (str(ccn),)).fetchone()
+        if row is None and name:
+            row = conn.execute(f"SELECT {cols} FROM usnews_rankings WHERE key = ?", (self.name_key(name, state),)).fetchone()
+        return self._row(row) if row else None
+
+    def refreshed_at(self):
+        row = self._conn().execute("SELECT value FROM usnews_meta WHERE key = 'refreshed_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM usnews_rankings").fetchone()[0]
+
+@st.cache_resource
+def get_usnews_index() -> UsnewsIndex:
+    """Single UsnewsIndex per process."""
+    return UsnewsIndex()
+
+# -------------------------
+# Bulk refresh / import
+# -------------------------
+def usnews_list_urls(states, pages: int = None) -> list[str]:
+    """Ranking list page URLs (all pages) for the given state codes."""
+    pages = pages or settings.USNEWS_PAGES_PER_STATE
+    urls = []
+    for state in sorted({str(s).lower() for s in states if isinstance(s, str) and len(s) == 2}):
+        base = settings.USNEWS_AREA_URL.format(state=state)
+        urls += [base] + [f"{base}?page={n}" for n in range(2, pages + 1)]
+    return urls
+
+async def ascrape_rankings(urls: list[str]) -> list[dict]:
+    """Fetch list pages concurrently (paced by the health.usnews.com host policy) and parse them."""
+    cache = get_response_cache()
+
+    async def one(url):
+        try:
+            resp = await cache.aget(url, "usnews_lists", headers=DEFAULT_HEADERS)
+            if not resp.ok:
+                return []
+            return await asyncio.to_thread(parse_rankings_html, resp.text, url)
+        except Exception as e:
+            logger.info(f"[US News list] {url}: {e}")
+            return []
+
+    entries = {}
+    for page in await asyncio.gather(*(one(url) for url in urls)):
+        for entry in page:
+            entries.setdefault(entry["url"] or UsnewsIndex.name_key(entry["name"], entry["state"]), entry)
+    return list(entries.values())
+
+def refresh_usnews_index(df_cms: pd.DataFrame, states=None) -> dict:
+    """Scrape the ranking lists for states (default: every state in the CMS frame) into the index."""
+    if states is None:
+        states = df_cms["State"].dropna().unique() if "State" in df_cms.columns else []
+    urls = usnews_list_urls(states)
+    entries = run_async(ascrape_rankings(urls))
+    return dict(get_usnews_index().add(entries, df_cms, source="scrape"), pages=len(urls))
+
+def import_usnews_paste(text: str, df_cms: pd.DataFrame) -> dict:
+    """Parse pasted list HTML or a CSV/TSV export into the index."""
+    return get_usnews_index().add(parse_rankings_paste(text), df_cms, source="paste")
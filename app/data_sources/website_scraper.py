@@ -1,44 +1,60 @@
-import requests
-from bs4 import BeautifulSoup
+from response_cache import cached_get
+from bs4 import BeautifulSoup, SoupStrainer
+from config import settings
 import logging
 
+# Only these tags are built into the soup; everything else is skipped by the parser
+ABOUT_TAGS = SoupStrainer(["title", "meta", "h1"])
+# Stop downloading once the head and the first h1 have been received
+ABOUT_MARKERS = (b"</head", b"</h1")
+
+def parse_about(html: str, website_url: str = "") -> dict:
+    """Title, meta description and first H1 from (possibly truncated) HTML."""
+    return about_fields(BeautifulSoup(html, "lxml", parse_only=ABOUT_TAGS), website_url)
+
+def about_fields(soup, website_url: str = "") -> dict:
+    """Title, meta description and first H1 from an already parsed soup."""
+    # Title
+    title = soup.title.string.strip() if soup.title and soup.title.string else ""
+
+    # Meta description
+    desc_tag = (
+        soup.find("meta", attrs={"name": "description"}) or
+        soup.find("meta", attrs={"property": "og:description"})
+    )
+    meta_desc = desc_tag["content"].strip() if desc_tag and desc_tag.get("content") else ""
+
+    # First H1
+    h1_tag = soup.find("h1")
+    h1_text = h1_tag.get_text().strip() if h1_tag else ""
+
+    return {
+        "title": title,
+        "meta_description": meta_desc,
+        "h1": h1_text,
+        "url": website_url
+    }
+
 def scrape_about(website_url: str) -> dict:
     """
     Scrape basic info from a website: title, meta description, first H1.
+    Only the start of the page is downloaded (up to the first </h1>, or ABOUT_MAX_BYTES).
     Returns dict with keys: title, meta_description, h1, url.
     """
     if not website_url:
         return {}
 
     try:
-        resp = requests.get(
+        resp = cached_get(
             website_url,
+            "website_about",
             headers={"User-Agent": "Mozilla/5.0"},
+            max_bytes=settings.ABOUT_MAX_BYTES,
+            until=ABOUT_MARKERS,
             timeout=10
         )
         resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        # Title
-        title = soup.title.string.strip() if soup.title and soup.title.string else ""
-
-        # Meta description
-        desc_tag = (
-            soup.find("meta", attrs={"name": "description"}) or
-            soup.find("meta", attrs={"property": "og:description"})
-        )
-        meta_desc = desc_tag["content"].strip() if desc_tag and desc_tag.get("content") else ""
-
-        # First H1
-        h1_tag = soup.find("h1")
-        h1_text = h1_tag.get_text().strip() if h1_tag else ""
-
-        return {
-            "title": title,
-            "meta_description": meta_desc,
-            "h1": h1_text,
-            "url": website_url
-        }
+        return parse_about(resp.text, website_url)
 
     except Exception as e:
         logging.warning(f"[Scrape About Error] {e} | URL: {website_url}")
@@ -0,0 +1,109 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger("yelp_json")
+
+# <script type="application/ld+json"> and hydration payloads (<script type="application/json" ...>,
+# often wrapped in <!-- -->). Matched with a regex so the page is never built into a DOM.
+JSON_SCRIPT_RE = re.compile(
+    r"<script[^>]*type=[\"']application/(?:ld\+)?json[\"'][^>]*>(.*?)</script>",
+    re.I | re.S,
+)
+
+def json_payloads(html: str):
+    """Decoded JSON documents embedded in ld+json / application/json script tags."""
+    for match in JSON_SCRIPT_RE.finditer(html or ""):
+        raw = match.group(1).strip()
+        if raw.startswith("<!--"):
+            raw = raw[4:]
+        if raw.endswith("-->"):
+            raw = raw[:-3]
+        try:
+            yield json.loads(raw)
+        except ValueError:
+            continue
+
+def walk_json(node):
+    """Every dict nested anywhere in a JSON document."""
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            yield item
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+
+def _deref(value, refs: dict):
+    """Resolve Apollo-style {"__ref": "User:abc"} pointers against the top-level state map."""
+    if isinstance(value, dict) and "__ref" in value:
+        return refs.get(value["__ref"], {})
+    return value
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _from_ld(node: dict) -> dict:
+    """schema.org Review node."""
+    author = node.get("author")
+    if isinstance(author, dict):
+        author = author.get("name")
+    rating = node.get("reviewRating")
+    return {
+        "id": node.get("@id") or node.get("url"),
+        "user": author or "Anonymous",
+        "rating": _float(rating.get("ratingValue") if isinstance(rating, dict) else rating),
+        "text": node.get("reviewBody") or node.get("description") or "",
+        "date": node.get("datePublished"),
+    }
+
+def _from_hydration(node: dict, refs: dict) -> dict:
+    """Yelp hydration (GraphQL/Apollo) Review node."""
+    text = _deref(node.get("text"), refs)
+    if isinstance(text, dict):
+        text = text.get("full") or text.get("text") or ""
+    author = _deref(node.get("author") or node.get("user"), refs)
+    if isinstance(author, dict):
+        author = author.get("displayName") or author.get("name")
+    created = node.get("createdAt") or node.get("localizedDate")
+    if isinstance(created, dict):
+        created = created.get("utcDateTime") or created.get("localDateTimeForBusiness")
+    return {
+        "id": node.get("encid") or node.get("id"),
+        "user": author or "Anonymous",
+        "rating": _float(node.get("rating")),
+        "text": text or "",
+        "date": created,
+    }
+
+def extract_yelp_reviews_json(html: str, limit: int = None) -> list[dict]:
+    """
+    Review records decoded from the JSON a Yelp page embeds (ld+json and hydration
+    state), in page order and de-duplicated by id/text.
+    Returns a list of dicts: {"id", "user", "rating", "text", "date"}; [] if none found.
+    """
+    reviews, seen = [], set()
+    for payload in json_payloads(html):
+        refs = payload if isinstance(payload, dict) else {}
+        for node in walk_json(payload):
+            types = node.get("@type")
+            if types == "Review" or (isinstance(types, list) and "Review" in types):
+                review = _from_ld(node)
+            elif node.get("__typename") == "Review" or ("encid" in node and "rating" in node and "text" in node):
+                review = _from_hydration(node, refs)
+            else:
+                continue
+            if not review["text"]:
+                continue
+            key = review["id"] or review["text"]
+            if key in seen:
+                continue
+            seen.add(key)
+            reviews.append(review)
+            if limit and len(reviews) >= limit:
+                return reviews
+    return reviews
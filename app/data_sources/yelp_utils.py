@@ -1,5 +1,10 @@
 import os
-import requests
+import asyncio
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from response_cache import cached_get, get_response_cache
+from async_runtime import run_async
+from data_sources.yelp_json import extract_yelp_reviews_json
 from bs4 import BeautifulSoup
 from rapidfuzz import fuzz
 import logging
@@ -8,6 +13,7 @@ import re
 logging.basicConfig(level=logging.INFO)
 
 DEFAULT_YELP_LIMIT = 5
+YELP_PAGE_SIZE = 10  # reviews per business page (?start=N offsets)
 DEFAULT_YELP_LOCATION = os.getenv("DEFAULT_YELP_LOCATION", "San Francisco, CA")
 
 # -------------------------
@@ -26,7 +32,7 @@ def fetch_yelp_reviews_api(name: str, city: str = None, api_key: str = None, lim
     params = {"term": name, "location": city or DEFAULT_YELP_LOCATION, "limit": limit}
 
     try:
-        resp = requests.get("https://api.yelp.com/v3/businesses/search", headers=headers, params=params, timeout=10)
+        resp = cached_get("https://api.yelp.com/v3/businesses/search", "yelp_api", headers=headers, params=params, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         businesses = data.get("businesses", [])
@@ -38,7 +44,7 @@ def fetch_yelp_reviews_api(name: str, city: str = None, api_key: str = None, lim
         best = businesses[0]
 
         # Fetch reviews for this business
-        review_resp = requests.get(f"https://api.yelp.com/v3/businesses/{best['id']}/reviews", headers=headers, timeout=10)
+        review_resp = cached_get(f"https://api.yelp.com/v3/businesses/{best['id']}/reviews", "yelp_api", headers=headers, timeout=10)
         review_resp.raise_for_status()
         reviews = review_resp.json().get("reviews", [])
         return [
@@ -63,7 +69,7 @@ def fetch_yelp_reviews_scrape(name: str, city: str = None, limit: int = DEFAULT_
     url = f"https://www.yelp.com/search?find_desc={query}"
 
     try:
-        resp = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+        resp = cached_get(url, "yelp", headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
         resp.raise_for_status()
         soup = BeautifulSoup(resp.text, "html.parser")
         reviews = []
@@ -88,43 +94,127 @@ def fetch_yelp_reviews_scrape(name: str, city: str = None, limit: int = DEFAULT_
 # -------------------------
 # Yelp business page scraping
 # -------------------------
-def fetch_yelp_reviews_scrape_url(url: str, limit: int = DEFAULT_YELP_LIMIT) -> list[dict]:
+def parse_yelp_reviews(html: str, limit: int = None) -> list[dict]:
     """
-    Scrape Yelp reviews directly from a Yelp business page URL.
-    Returns a list of dicts: {"user", "rating", "text"}.
+    Review records from a Yelp business page: the embedded JSON payloads first,
+    the (hashed-class) markup only if the page carries none.
+    Returns a list of dicts: {"id", "user", "rating", "text", "date"}.
     """
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        reviews = []
+    return extract_yelp_reviews_json(html, limit) or parse_yelp_reviews_dom(html, limit)
 
-        review_divs = soup.select("div.review__09f24__oHr9V") or soup.find_all("div", {"role": "region"})
+def parse_yelp_reviews_dom(html: str, limit: int = None) -> list[dict]:
+    """
+    Fallback: review records from a Yelp business page's markup.
+    Returns a list of dicts: {"id", "user", "rating", "text", "date"} (id/date may be None).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    reviews = []
 
-        for div in review_divs[:limit]:
-            text_tag = div.find("span", {"class": "raw__09f24__T4Ezm"})
-            text = text_tag.get_text() if text_tag else ""
+    review_divs = soup.select("div.review__09f24__oHr9V") or soup.find_all("div", {"role": "region"})
 
-            rating_tag = div.find("div", {"role": "img"})
-            rating = None
-            if rating_tag:
-                match = re.search(r"(\d\.?\d?) star rating", rating_tag.get("aria-label", ""))
-                if match:
-                    rating = float(match.group(1))
+    for div in review_divs[:limit]:
+        text_tag = div.find("span", {"class": "raw__09f24__T4Ezm"})
+        text = text_tag.get_text() if text_tag else ""
 
-            user_tag = div.find("span", {"class": "fs-block css-m6anxm"})
-            user = user_tag.get_text() if user_tag else "Anonymous"
+        rating_tag = div.find("div", {"role": "img"})
+        rating = None
+        if rating_tag:
+            match = re.search(r"(\d\.?\d?) star rating", rating_tag.get("aria-label", ""))
+            if match:
+                rating = float(match.group(1))
 
-            reviews.append({"user": user, "rating": rating, "text": text})
+        user_tag = div.find("span", {"class": "fs-block css-m6anxm"})
+        user = user_tag.get_text() if user_tag else "Anonymous"
 
-        return reviews[:limit]
+        id_tag = div if div.get("data-review-id") else div.find(attrs={"data-review-id": True})
+        review_id = id_tag.get("data-review-id") if id_tag else None
+
+        reviews.append({"id": review_id, "user": user, "rating": rating, "text": text, "date": None})
+
+    return reviews
+
+def fetch_yelp_reviews_scrape_url(url: str, limit: int = DEFAULT_YELP_LIMIT) -> list[dict]:
+    """
+    Scrape Yelp reviews directly from a Yelp business page URL.
+    Returns a list of dicts: {"id", "user", "rating", "text", "date"}.
+    """
+    headers = {"User-Agent": "Mozilla/5.0"}
+    try:
+        resp = cached_get(url, "yelp", headers=headers, timeout=10)
+        resp.raise_for_status()
+        return parse_yelp_reviews(resp.text, limit)
 
     except Exception as e:
         logging.warning(f"[Yelp Scrape URL Error] {e}")
         return []
 
-# playwright scraper fetch_yelp_reviews_scroll
+# -------------------------
+# Paginated business page fetch
+# -------------------------
+def yelp_page_urls(url: str, limit: int) -> list[str]:
+    """Review page URLs (?start=0,10,20,...) covering limit reviews."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "start"]
+    urls = []
+    for start in range(0, max(limit, 1), YELP_PAGE_SIZE):
+        page_query = query + ([("start", str(start))] if start else [])
+        urls.append(urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(page_query), "")))
+    return urls
+
+def review_key(review: dict) -> str:
+    """Dedup key: Yelp review id, or a hash of user + text when the id is missing."""
+    if review.get("id"):
+        return review["id"]
+    return hashlib.sha1(f"{review.get('user')}|{review.get('text')}".encode()).hexdigest()
+
+def merge_reviews(pages: list[list[dict]], limit: int) -> list[dict]:
+    """Concatenate pages in order, dropping reviews already seen (pages shift as reviews are added)."""
+    seen, merged = set(), []
+    for page in pages:
+        for review in page:
+            key = review_key(review)
+            if key not in seen:
+                seen.add(key)
+                merged.append(review)
+    return merged[:limit]
+
+async def afetch_yelp_reviews_paged(url: str, limit: int = 50) -> list[dict]:
+    """
+    Fetch all ?start=N review pages needed for limit reviews concurrently (paced by the
+    www.yelp.com host policy) and merge them in page order, de-duplicated by review id.
+    """
+    cache = get_response_cache()
+    urls = yelp_page_urls(url, limit)
+    responses = await asyncio.gather(
+        *(cache.aget(u, "yelp", headers={"User-Agent": "Mozilla/5.0"}) for u in urls), return_exceptions=True
+    )
+    pages = []
+    for page_url, resp in zip(urls, responses):
+        if isinstance(resp, Exception) or not resp.ok:
+            logging.warning(f"[Yelp Page Error] {resp if isinstance(resp, Exception) else resp.status_code} | URL: {page_url}")
+            continue
+        pages.append(await asyncio.to_thread(parse_yelp_reviews, resp.text))
+    return merge_reviews(pages, limit)
+
+def fetch_yelp_reviews_paged(url: str, limit: int = 50) -> list[dict]:
+    """Blocking wrapper for afetch_yelp_reviews_paged (runs on the shared background loop)."""
+    try:
+        return run_async(afetch_yelp_reviews_paged(url, limit))
+    except Exception as e:
+        logging.warning(f"[Yelp Paged Error] {e}")
+        return []
+
+# -------------------------
+# Playwright scroll fallback (optional dependency)
+# -------------------------
+def fetch_yelp_reviews_scroll(url: str, limit: int = DEFAULT_YELP_LIMIT) -> list[dict]:
+    """Scroll-scrape with the pooled headless browser; [] if Playwright is not installed."""
+    try:
+        from yelp_playwright import fetch_yelp_reviews_scroll as scroll
+    except ImportError as e:
+        logging.info(f"[Yelp Scroll] Playwright unavailable: {e}")
+        return []
+    return scroll(url, limit)
 
 def fetch_yelp_reviews(url: str, limit: int = DEFAULT_YELP_LIMIT) -> list[dict]:
     """
@@ -144,8 +234,11 @@ def fetch_yelp_reviews(url: str, limit: int = DEFAULT_YELP_LIMIT) -> list[dict]:
     # if reviews:
     #     return reviews
 
-    # 3. Try direct URL scrape
-    reviews = fetch_yelp_reviews_scrape_url(url, limit)
+    # 3. Try direct URL scrape (all review pages at once when more than one page is needed)
+    if limit > YELP_PAGE_SIZE:
+        reviews = fetch_yelp_reviews_paged(url, limit)
+    else:
+        reviews = fetch_yelp_reviews_scrape_url(url, limit)
     if reviews:
         return reviews
 
@@ -35,6 +35,8 @@ def export_to_excel(
         else:
             cms_dict = cms_data
         for r_idx, (key, value) in enumerate(cms_dict.items(), start=1):
+            if pd.api.types.is_scalar(value) and pd.isna(value):
+                value = None  # typed CMS snapshot uses <NA> for "Not Available"
             ws.cell(row=r_idx, column=1, value=key)
             ws.cell(row=r_idx, column=2, value=value)
     
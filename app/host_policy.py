@@ -0,0 +1,164 @@
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import streamlit as st
+
+from config import settings
+
+logger = logging.getLogger("host_policy")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a host whose circuit breaker is open."""
+
+def parse_retry_after(value) -> float:
+    """Retry-After header (seconds or HTTP date) -> seconds to wait (0 if absent/invalid)."""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return 0.0
+
+class HostPolicy:
+    """
+    Politeness + resilience policy for one host:
+    - token bucket whose rate adapts (AIMD): halved on 429/503, nudged back up on success
+    - Retry-After pauses the whole host until the given time
+    - circuit breaker: after N consecutive failures the host fails fast for a cooldown,
+      then one trial request is let through (half-open)
+    Thread-safe; callers sleep (sync) or await (async) on the returned delay.
+    """
+
+    def __init__(self, host: str, rate: float, burst: float, min_rate: float = None):
+        self.host = host
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or max(rate / 20, 0.05)
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_trial = False
+
+        self.requests = self.throttled = self.errors = 0
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # Token bucket
+    # -------------------------
+    def reserve(self) -> float:
+        """
+        Take a token and return how long the caller must wait before sending.
+        Raises CircuitOpenError while the breaker is open.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._check_circuit(now)
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            self.requests += 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def _check_circuit(self, now):
+        if self.opened_at is None:
+            return
+        if now - self.opened_at < settings.CIRCUIT_COOLDOWN:
+            raise CircuitOpenError(f"{self.host} circuit open ({self.failures} consecutive failures)")
+        if self.half_open_trial:
+            raise CircuitOpenError(f"{self.host} circuit half-open, trial request in flight")
+        self.half_open_trial = True
+
+    def release(self):
+        """Give up a reserved request without feedback (cancelled), freeing a half-open trial."""
+        with self._lock:
+            self.half_open_trial = False
+
+    # -------------------------
+    # Feedback
+    # -------------------------
+    def record(self, status: int = None, retry_after: float = 0.0):
+        """Feed back a response status (None for a connection error/timeout)."""
+        with self._lock:
+            now = time.monotonic()
+            failed = status is None or status in RETRY_STATUSES
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate * 0.5)
+                self.tokens = min(self.tokens, 0.0)
+            elif not failed:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+            if retry_after:
+                # Honour Retry-After for the whole host, but never park it longer than a retry would wait
+                self.blocked_until = max(self.blocked_until, now + min(retry_after, settings.RETRY_MAX_DELAY))
+
+            if failed:
+                self.errors += 1
+                self.failures += 1
+                if self.half_open_trial or self.failures >= settings.CIRCUIT_FAILURE_THRESHOLD:
+                    if self.opened_at is None or self.half_open_trial:
+                        logger.warning(f"[Circuit open] {self.host} after {self.failures} failures")
+                    self.opened_at = now
+            else:
+                self.failures = 0
+                self.opened_at = None
+            self.half_open_trial = False
+
+    def backoff(self, attempt: int, retry_after: float = 0.0) -> float:
+        """
+        Full-jitter exponential backoff for retry number attempt (0-based), at least
+        retry_after, and never more than RETRY_MAX_DELAY (a Retry-After of hours would
+        otherwise stall the worker).
+        """
+        cap = min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * (2 ** attempt))
+        return min(max(random.uniform(0, cap), retry_after or 0.0), settings.RETRY_MAX_DELAY)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3), "max_rate": self.max_rate, "requests": self.requests,
+                "throttled": self.throttled, "errors": self.errors,
+                "circuit": "open" if self.opened_at is not None else "closed",
+            }
+
+class HostPolicies:
+    """Registry of HostPolicy objects keyed by host, configured from settings.HOST_LIMITS."""
+
+    def __init__(self, limits: dict = None):
+        self.limits = limits or settings.HOST_LIMITS
+        self._policies = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> HostPolicy:
+        host = (urlsplit(url).hostname or "").lower()
+        with self._lock:
+            policy = self._policies.get(host)
+            if policy is None:
+                rate, burst = self.limits.get(host, self.limits["default"])
+                policy = self._policies[host] = HostPolicy(host, rate, burst)
+            return policy
+
+    def stats(self) -> dict:
+        with self._lock:
+            policies = dict(self._policies)
+        return {host: p.snapshot() for host, p in policies.items()}
+
+@st.cache_resource
+def get_host_policies() -> HostPolicies:
+    """Single HostPolicies registry per process."""
+    return HostPolicies()
@@ -0,0 +1,257 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+
+import aiohttp
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from config import settings
+from host_policy import get_host_policies, parse_retry_after, RETRY_STATUSES
+
+logger = logging.getLogger("http_client")
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+# Errors that count against a host besides connection errors and timeouts (which are
+# retried). Anything else (invalid URL or scheme, a bad argument) is the caller's fault.
+ASYNC_HOST_ERRORS = (aiohttp.ClientPayloadError, aiohttp.ClientResponseError)
+SYNC_HOST_ERRORS = (requests.HTTPError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ContentDecodingError)
+
+async def _close_with_loop(session: aiohttp.ClientSession):
+    """
+    Parked on the session's loop. Loops shut down the usual way (asyncio.run) finalize
+    their async generators before closing, which resumes this to close the session's
+    connections while the loop can still run it.
+    """
+    try:
+        yield
+    finally:
+        if not session.closed:
+            await session.close()
+
+def _discard_session(session: aiohttp.ClientSession):
+    """
+    Drop a session whose loop was closed without finalizing its async generators.
+    Nothing can be awaited on that loop any more, so the connector is detached (the
+    session counts as closed) and its sockets are freed with their transports.
+    """
+    logger.debug("Discarding HTTP session of a loop closed without shutdown_asyncgens()")
+    session.detach()
+
+class HttpClient:
+    """
+    Process-wide HTTP client shared by every data source.
+    - async: one aiohttp.ClientSession per event loop, with a pooled TCPConnector
+      (per-host limit, keep-alive, DNS cache) and gzip/deflate decoding.
+    - sync: a pooled requests.Session facade for the existing blocking callers.
+    Both paths go through the per-host policy (token bucket, retries with jittered
+    backoff, circuit breaker) from host_policy.
+    """
+
+    def __init__(
+        self,
+        timeout: float = settings.HTTP_TIMEOUT,
+        connect_timeout: float = settings.HTTP_CONNECT_TIMEOUT,
+        pool_size: int = settings.HTTP_POOL_SIZE,
+        pool_per_host: int = settings.HTTP_POOL_PER_HOST,
+        dns_ttl: int = settings.HTTP_DNS_TTL,
+        max_retries: int = settings.HTTP_MAX_RETRIES,
+        policies=None,
+    ):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.pool_per_host = pool_per_host
+        self.dns_ttl = dns_ttl
+        self.max_retries = max_retries
+        self.policies = policies or get_host_policies()
+
+        self._sessions = {}  # id(loop) -> (loop, session, closer async generator)
+        self._lock = threading.Lock()
+
+        self._sync = requests.Session()
+        self._sync.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_per_host)
+        self._sync.mount("http://", adapter)
+        self._sync.mount("https://", adapter)
+
+    # -------------------------
+    # Async
+    # -------------------------
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Pooled aiohttp session for the running event loop (created on first use).
+        Sessions are bound to their loop, so each loop gets its own pool. Each session is
+        closed when its loop shuts down (see _close_with_loop); entries of loops closed
+        any other way are pruned here with their connectors detached.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for key, (other, stale, _) in list(self._sessions.items()):
+                if other.is_closed():
+                    del self._sessions[key]
+                    if not stale.closed:
+                        _discard_session(stale)
+            owner, session, _ = self._sessions.get(id(loop), (None, None, None))
+            if owner is not loop or session is None or session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    limit_per_host=self.pool_per_host,
+                    ttl_dns_cache=self.dns_ttl,
+                    keepalive_timeout=30,
+                )
+                session = aiohttp.ClientSession(
+                    connector=connector,
+                    headers=DEFAULT_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=self.connect_timeout),
+                    auto_decompress=True,
+                )
+                closer = _close_with_loop(session)
+                asyncio.ensure_future(closer.__anext__())  # runs to the yield; the loop now tracks it
+                self._sessions[id(loop)] = (loop, session, closer)
+            return session
+
+    async def fetch(self, url: str, method: str = "GET", retries: int = None, max_bytes: int = None,
+                    stop=None, **kwargs):
+        """
+        Async request under the host policy. Returns (status, headers, body bytes, final url)
+        of the last attempt; raises CircuitOpenError or the last connection error.
+        max_bytes stops reading the body after that many bytes, and stop (called with each
+        chunk as it arrives) as soon as it returns True.
+        """
+        policy = self.policies.for_url(url)
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            delay = policy.reserve()
+            try:
+                await asyncio.sleep(delay)
+                async with self.session().request(method, url, **kwargs) as resp:
+                    if max_bytes:
+                        body = bytearray()
+                        async for chunk in resp.content.iter_chunked(64 * 1024):
+                            body += chunk
+                            if len(body) >= max_bytes or (stop and stop(chunk)):
+                                break
+                        body = bytes(body[:max_bytes])
+                    else:
+                        body = await resp.read()
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))  # case-insensitive
+                    result = (resp.status, dict(resp.headers), body, str(resp.url))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                policy.record(None)
+                if attempt >= retries:
+                    raise
+                await asyncio.sleep(policy.backoff(attempt))
+                continue
+            except ASYNC_HOST_ERRORS:
+                policy.record(None)
+                raise
+            except BaseException:
+                # Caller errors and cancellation (stage timeout, budget): no verdict on the
+                # host, but free a half-open trial
+                policy.release()
+                raise
+            policy.record(result[0], retry_after)
+            if result[0] not in RETRY_STATUSES or attempt >= retries:
+                return result
+            await asyncio.sleep(policy.backoff(attempt, retry_after))
+
+    async def get_json(self, url: str, **kwargs):
+        status, _, body, final_url = await self.fetch(url, **kwargs)
+        if status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=status, message=f"HTTP {status} for {final_url}")
+        return json.loads(body)
+
+    async def get_text(self, url: str, **kwargs) -> str:
+        status, _, body, final_url = await self.fetch(url, **kwargs)
+        if status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=status, message=f"HTTP {status} for {final_url}")
+        return body.decode("utf-8", errors="replace")
+
+    async def aclose(self):
+        """Close the session bound to the running loop."""
+        with self._lock:
+            _, session, _ = self._sessions.pop(id(asyncio.get_running_loop()), (None, None, None))
+        if session is not None and not session.closed:
+            await session.close()
+
+    # -------------------------
+    # Sync facade
+    # -------------------------
+    def request(self, method: str, url: str, retries: int = None, **kwargs) -> requests.Response:
+        """Blocking request under the host policy (waits for a token, retries 429/5xx/connection errors)."""
+        kwargs.setdefault("timeout", (self.connect_timeout, self.timeout))
+        policy = self.policies.for_url(url)
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            delay = policy.reserve()
+            try:
+                time.sleep(delay)
+                resp = self._sync.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                policy.record(None)
+                if attempt >= retries:
+                    raise
+                time.sleep(policy.backoff(attempt))
+                continue
+            except SYNC_HOST_ERRORS:
+                policy.record(None)
+                raise
+            except BaseException:
+                policy.release()
+                raise
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            policy.record(resp.status_code, retry_after)
+            if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                return resp
+            resp.close()
+            time.sleep(policy.backoff(attempt, retry_after))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Drop-in for requests.get that reuses pooled keep-alive connections."""
+        return self.request("GET", url, **kwargs)
+
+    def get_prefix(self, url: str, max_bytes: int, until=(), stop=None, chunk_size: int = 16 * 1024,
+                   **kwargs) -> requests.Response:
+        """
+        Streaming GET that stops reading once every marker in until (bytes, matched
+        case-insensitively) has been seen, once stop (called with each chunk) returns True,
+        or after max_bytes. resp.content holds only the prefix that was read; the rest of
+        the body is never downloaded.
+        """
+        resp = self.request("GET", url, stream=True, **kwargs)
+        pending = [m.lower() for m in until]
+        overlap = max((len(m) for m in pending), default=1) - 1
+        buf = bytearray()
+        try:
+            for chunk in resp.iter_content(chunk_size):
+                start = max(0, len(buf) - overlap)
+                buf += chunk
+                if pending:
+                    window = bytes(buf[start:]).lower()
+                    pending = [m for m in pending if m not in window]
+                if (until and not pending) or len(buf) >= max_bytes or (stop and stop(chunk)):
+                    break
+        finally:
+            resp.close()
+        resp._content = bytes(buf[:max_bytes])
+        resp._content_consumed = True
+        return resp
+
+@st.cache_resource
+def get_http_client() -> HttpClient:
+    """Single HttpClient per process, shared across Streamlit sessions and reruns."""
+    return HttpClient()
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """Shortcut for get_http_client().get(...)."""
+    return get_http_client().get(url, **kwargs)
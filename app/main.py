@@ -2,15 +2,10 @@ import os
 import sys
 from dotenv import load_dotenv
 import json
-import re
 from datetime import datetime, timezone
-import asyncio
 
 import pandas as pd
 import streamlit as st
-import aiohttp
-from aiolimiter import AsyncLimiter
-import nest_asyncio
 from bs4 import BeautifulSoup
 
 # Add parent folder to path
@@ -18,11 +13,19 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # Import modules
 from config import settings
-from data_sources.google_utils import google_search_name, match_org, normalize_name
-from data_sources.cms_utils import load_cms_general_info, calculate_cms_score
-from data_sources.website_scraper import scrape_about
-from data_sources.yelp_utils import fetch_yelp_reviews_scrape_url
+from data_sources.google_utils import normalize_name
+from data_sources.org_matcher import matcher_for
+from data_sources.cms_utils import load_cms_general_info
+from data_sources.usnews_index import get_usnews_index, refresh_usnews_index, import_usnews_paste
+from data_sources.yelp_utils import fetch_yelp_reviews_scrape_url, fetch_yelp_reviews_paged, YELP_PAGE_SIZE
+from data_sources.yelp_json import extract_yelp_reviews_json
 from export_utils import export_to_excel
+from response_cache import get_response_cache
+from orchestrator import run_stages
+from async_runtime import get_background_loop
+from profile_engine import build_profile_stages, score_profile, profile_record
+from profile_store import get_profile_store, normalize_reviews
+from review_store import get_review_store
 
 # Load environment variables
 load_dotenv()
@@ -54,57 +57,48 @@ df_cms = load_cms()
 org_input = st.text_input("Organization Name", placeholder="e.g., UCSF Medical Center")
 search_button = st.button("Search")
 
-# --- Async Limiters ---
-google_limiter = AsyncLimiter(max_rate=5, time_period=1)
-
-# --- Async fetch wrappers ---
-async def limited_google_search(query, api_key):
-    async with google_limiter:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://maps.googleapis.com/maps/api/place/textsearch/json?query={query}&key={api_key}"
-            async with session.get(url, timeout=10) as resp:
-                return await resp.json()
-
-async def limited_google_details(place_id, api_key):
-    async with google_limiter:
-        async with aiohttp.ClientSession() as session:
-            url = (
-                f"https://maps.googleapis.com/maps/api/place/details/json?"
-                f"place_id={place_id}&fields=name,reviews,formatted_address,rating,"
-                f"user_ratings_total,formatted_phone_number,international_phone_number,"
-                f"website,opening_hours,geometry,types,place_id&key={api_key}"
-            )
-            async with session.get(url, timeout=10) as resp:
-                return await resp.json()
-
-# Streamlit-friendly async
-nest_asyncio.apply()
+# --- Background event loop + shared caches (across reruns and sessions) ---
+background_loop = get_background_loop()
+response_cache = get_response_cache()
 
 # --- Main workflow ---
 if org_input and search_button:
+    with st.spinner("Collecting profile sources (Google, CMS, Places, website, news, US News)..."):
+        run = background_loop.run(
+            run_stages(build_profile_stages(org_input, gkey, df_cms), budget=settings.PROFILE_BUDGET),
+            timeout=settings.PROFILE_BUDGET + 5,
+        )
+    results = run["results"]
+    record = profile_record(org_input, run, df_cms)
+    get_profile_store().save_record(record)
+    get_review_store().append_record(record, flush=True)
+    incomplete = {name: status for name, status in run["status"].items() if status != "ok"}
+    if incomplete:
+        st.warning("Partial profile: " + ", ".join(f"{name} ({status})" for name, status in incomplete.items()))
+    counters = response_cache.counters()
+    st.caption(
+        f"Sources collected in {run['total']:.1f}s · cache hits {counters['hits'] + counters['stale_hits']}, "
+        f"fetches {counters['fetches']}, coalesced {counters['coalesced']} (process-wide)"
+    )
+
     # 1) Pre-validate via Google Search
-    with st.spinner("Validating via Google search..."):
-        google_hits = google_search_name(org_input, limit=settings.GOOGLE_SEARCH_PREVALIDATION_RESULTS)
-        st.subheader("Top Google Search Hits")
-        if google_hits:
-            for hit in google_hits:
-                st.markdown(f"- [{hit['title']}]({hit['link']}) — {hit['snippet']}")
-        else:
-            st.info("No results from Google pre-validation. Continuing with CMS match.")
-
-        # Extract city/state from snippet if possible
-        city, state = None, None
-        for hit in google_hits or []:
-            snippet = hit.get("snippet","")
-            match_loc = re.search(r"\b([A-Za-z\s]+),\s([A-Z]{2})\b", snippet)
-            if match_loc:
-                city, state = match_loc.group(1), match_loc.group(2)
-                break
+    google_hits = results.get("prevalidate") or []
+    st.subheader("Top Google Search Hits")
+    if google_hits:
+        for hit in google_hits:
+            st.markdown(f"- [{hit['title']}]({hit['link']}) — {hit['snippet']}")
+    else:
+        st.info("No results from Google pre-validation. Continuing with CMS match.")
 
     # 2) Match CMS
-    with st.spinner("Matching organization with CMS..."):
-        match, name_col, msg = match_org(org_input, df_cms, state=state, city=city)
-        st.info(msg)
+    cms = results.get("cms_match") or {}
+    match, name_col, city = cms.get("match"), cms.get("name_col"), cms.get("city")
+    ranked = cms.get("ranked")
+    st.info(cms.get("msg", "CMS match did not complete."))
+
+    if ranked is not None and not ranked.empty:
+        with st.expander(f"Alternate CMS matches ({len(ranked)})"):
+            st.dataframe(ranked.drop(columns=["entry", "substring"]))
 
     if match is None:
         st.error("No match could be found in CMS. Try adjusting the name or adding city/state.")
@@ -114,37 +108,12 @@ if org_input and search_button:
     st.json(match.to_dict())
 
     # Normalize org name and location for Google API
-    org_name_for_api = normalize_name(match.get("Hospital Name") or org_input)
-    cms_city = match.get("City") or city or "San Francisco"
-
-    st.write(f"Fetching Google Business Profile for: {org_name_for_api}, {cms_city}")
-
-    # --- Async fetch Google ---
-    async def fetch_google_profile(org_name):
-        google_reviews = []
-        place_info = {}
-        if gkey:
-            search_data = await limited_google_search(org_name, gkey)
-            results = search_data.get("results", [])
-            if results:
-                place = results[0]
-                place_id = place.get("place_id")
-                if place_id:
-                    details = await limited_google_details(place_id, gkey)
-                    place_info = details.get("result", {})
-                    for r in place_info.get("reviews", []):
-                        google_reviews.append({
-                            "name": place_info.get("name"),
-                            "address": place_info.get("formatted_address"),
-                            "rating": r.get("rating"),
-                            "user_ratings_total": place_info.get("user_ratings_total"),
-                            "author_name": r.get("author_name"),
-                            "review_text": r.get("text"),
-                            "time": datetime.fromtimestamp(r.get("time"), tz=timezone.utc).isoformat() if r.get("time") else None
-                        })
-        return google_reviews, place_info
-
-    google_reviews, place_info = asyncio.run(fetch_google_profile(org_name_for_api))
+    cms_city_col = matcher_for(df_cms).city_col
+    org_name_for_api = normalize_name(match.get(name_col) or org_input)
+    cms_city = (match.get(cms_city_col) if cms_city_col else None) or city or "San Francisco"
+
+    st.write(f"Google Business Profile for: {org_name_for_api}, {cms_city}")
+    google_reviews, place_info = results.get("places") or ([], {})
 
     # 3) Display Google Reviews
     st.subheader("Google Reviews (Top 25)")
@@ -161,6 +130,13 @@ if org_input and search_button:
     else:
         st.info("No Google reviews found.")
 
+    if record["ccn"]:
+        review_trends = get_review_store().rating_trends(record["ccn"])
+        if not review_trends.empty:
+            with st.expander(f"Review history ({int(review_trends['reviews'].sum())} stored reviews)"):
+                st.line_chart(review_trends.pivot(index="month", columns="source", values="mean_rating"))
+                st.dataframe(get_review_store().history(record["ccn"]))
+
     # 4) Google Business Profile
     st.subheader("Google Business Profile Info")
     if place_info:
@@ -179,24 +155,39 @@ if org_input and search_button:
         })
 
     # 5) Website About
-    about_data = {}
-    if place_info.get("website"):
-        with st.spinner("Scraping website for About info..."):
-            about_data = scrape_about(place_info.get("website"))
+    about_data = results.get("about") or {}
     if about_data:
         st.subheader("About (from Website)")
         st.json(about_data)
+    site_data = results.get("site") or {}
+    if site_data.get("pages"):
+        with st.expander(f"Website pages ({len(site_data['pages'])} crawled)"):
+            if site_data["organization"] or site_data["addresses"]:
+                st.json({"organization": site_data["organization"], "addresses": site_data["addresses"]})
+            for kind, urls in site_data["by_kind"].items():
+                for url in urls:
+                    page = site_data["pages"][url]
+                    st.markdown(f"**{kind.title()}** — [{page['title'] or url}]({url})")
+                    if page["headings"]:
+                        st.caption(" · ".join(page["headings"][:8]))
+                    if page["text"]:
+                        st.write(page["text"][:500])
+
+    # 5b) News and US News
+    news_items = results.get("news") or []
+    if news_items:
+        st.subheader("Recent News")
+        for item in news_items:
+            flag = " **(new)**" if item.get("new") else ""
+            st.markdown(f"- [{item['title']}]({item['link']}) — {item['date']}{flag}")
+    usnews_data = results.get("usnews") or {}
+    if usnews_data:
+        st.subheader("U.S. News Rankings")
+        st.json(usnews_data)
 
     # 6) CMS + Combined Score
-    cms_score = calculate_cms_score(match)
-    google_score = place_info.get("rating") if place_info else None
-    combined_score = None
-    if cms_score and google_score:
-        combined_score = round(0.5*float(google_score) + 0.5*float(cms_score),2)
-    elif cms_score:
-        combined_score = float(cms_score)
-    elif google_score:
-        combined_score = float(google_score)
+    scores = results.get("score") or score_profile(match, place_info)
+    cms_score, google_score, combined_score = scores["cms_score"], scores["google_score"], scores["combined_score"]
 
     st.subheader("CMS & Combined Scores")
     st.write("CMS Score:", cms_score)
@@ -209,11 +200,21 @@ if org_input and search_button:
         st.session_state.yelp_reviews_manual = []
 
     st.session_state.manual_yelp_url = st.text_input("Enter Yelp Business URL (optional)", value="")
+    yelp_limit = st.number_input("Max Yelp reviews", min_value=1, max_value=300, value=20, step=10)
     if st.button("Fetch Yelp Reviews Manually"):
         if st.session_state.manual_yelp_url:
             try:
-                st.session_state.yelp_reviews_manual = fetch_yelp_reviews_scrape_url(
-                    st.session_state.manual_yelp_url
+                if yelp_limit > YELP_PAGE_SIZE:
+                    st.session_state.yelp_reviews_manual = fetch_yelp_reviews_paged(
+                        st.session_state.manual_yelp_url, int(yelp_limit)
+                    )
+                else:
+                    st.session_state.yelp_reviews_manual = fetch_yelp_reviews_scrape_url(
+                        st.session_state.manual_yelp_url, int(yelp_limit)
+                    )
+                get_review_store().append(
+                    normalize_reviews({"yelp_reviews": st.session_state.yelp_reviews_manual}),
+                    ccn=record["ccn"], flush=True,
                 )
                 st.success(f"Fetched {len(st.session_state.yelp_reviews_manual)} Yelp reviews manually.")
             except Exception as e:
@@ -245,14 +246,55 @@ if st.button("Parse US News Data"):
             st.warning(f"Failed to parse US News: {e}")
             st.session_state.manual_data["usnews"] = {"raw_html": usnews_text.strip()}
 
+# --- US News rankings index ---
+with st.expander("US News rankings index"):
+    usnews_index = get_usnews_index()
+    refreshed = usnews_index.refreshed_at()
+    st.caption(
+        f"{len(usnews_index)} ranked hospitals, refreshed "
+        f"{datetime.fromtimestamp(refreshed, timezone.utc):%Y-%m-%d %H:%M} UTC" if refreshed else "Index is empty"
+    )
+    if st.button("Import pasted US News list / export into index"):
+        if usnews_text:
+            try:
+                summary = import_usnews_paste(usnews_text, df_cms)
+                st.success(f"Imported {summary['entries']} entries ({summary['matched']} matched to a CMS CCN).")
+            except Exception as e:
+                st.warning(f"Failed to import US News data: {e}")
+    if st.button("Scrape US News ranking lists (all CMS states)"):
+        with st.spinner("Fetching US News ranking lists..."):
+            summary = refresh_usnews_index(df_cms)
+        st.success(f"Indexed {summary['entries']} entries from {summary['pages']} pages ({summary['matched']} matched).")
+
+# --- Stored profiles ---
+with st.expander("Stored profiles"):
+    profile_store = get_profile_store()
+    st.caption(f"{len(profile_store)} profiles stored")
+    q1, q2, q3, q4 = st.columns(4)
+    with q1:
+        q_state = st.text_input("State", max_chars=2, key="store_state")
+    with q2:
+        q_type = st.selectbox("Hospital type", [""] + profile_store.hospital_types(), key="store_type")
+    with q3:
+        q_max = st.number_input("Combined score below (0 = any)", min_value=0.0, value=0.0, step=0.5, key="store_max")
+    with q4:
+        q_days = st.number_input("Profiled within days (0 = any)", min_value=0, value=0, key="store_days")
+    st.dataframe(profile_store.query(
+        state=q_state or None, hospital_type=q_type or None, max_score=q_max or None,
+        profiled_within_days=q_days or None, limit=500,
+    ))
+
 # --- Yelp Manual HTML ---
 yelp_html = st.text_area("Paste Yelp HTML here", height=150)
 if st.button("Parse Yelp Data"):
     if yelp_html:
         try:
-            soup = BeautifulSoup(yelp_html, "html.parser")
-            yelp_reviews_parsed = []
-            review_blocks = soup.find_all("div", class_="review")
+            # Embedded JSON (ld+json / hydration state) first, markup classes as fallback
+            yelp_reviews_parsed = [
+                {"author": r["user"], "rating": r["rating"], "text": r["text"], "date": r["date"]}
+                for r in extract_yelp_reviews_json(yelp_html)
+            ]
+            review_blocks = [] if yelp_reviews_parsed else BeautifulSoup(yelp_html, "html.parser").find_all("div", class_="review")
             for r in review_blocks:
                 author = r.find("span", class_="fs-block").get_text(strip=True) if r.find("span", class_="fs-block") else None
                 rating = r.find("div", role="img")["aria-label"].split()[0] if r.find("div", role="img") else None
@@ -0,0 +1,114 @@
+import asyncio
+import inspect
+import logging
+import time
+
+logger = logging.getLogger("orchestrator")
+
+class Stage:
+    """
+    One data source in a profile run.
+    func receives a dict of {dependency name: result} and may be async or sync
+    (sync functions run in a worker thread). timeout is the per-stage deadline in seconds.
+    For sync stages the deadline is soft: the run stops waiting, but the thread cannot be
+    cancelled and finishes in the background, so blocking calls need their own timeouts
+    (the shared HTTP client applies HTTP_CONNECT_TIMEOUT / HTTP_TIMEOUT per attempt).
+    depends_on: stages that must succeed first (otherwise this stage is skipped).
+    soft_depends_on: stages to wait for, but whose result is None if they failed.
+    """
+
+    def __init__(self, name: str, func, depends_on=(), soft_depends_on=(), timeout: float = None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.soft_depends_on = tuple(soft_depends_on)
+        self.timeout = timeout
+
+    @property
+    def waits_for(self):
+        return self.depends_on + self.soft_depends_on
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, depends_on={self.depends_on})"
+
+def _check_graph(stages: list[Stage]):
+    names = {s.name for s in stages}
+    for s in stages:
+        missing = set(s.waits_for) - names
+        if missing:
+            raise ValueError(f"Stage '{s.name}' depends on unknown stage(s): {sorted(missing)}")
+    # Reject cycles (Kahn's algorithm)
+    remaining = {s.name: set(s.waits_for) for s in stages}
+    while remaining:
+        ready = [n for n, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Stage dependency cycle among: {sorted(remaining)}")
+        for n in ready:
+            remaining.pop(n)
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+async def run_stages(stages: list[Stage], budget: float = None) -> dict:
+    """
+    Run stages concurrently, each as soon as its dependencies finish.
+    A stage whose dependency failed or timed out is skipped. Anything still running when
+    the global budget expires is cancelled, and whatever finished is returned. The budget
+    bounds when this returns, not the lifetime of sync stage threads (see Stage); run it
+    on the long-lived background loop, since asyncio.run() joins those threads on exit.
+    Returns {"results": {name: value}, "status": {name: "ok"|"timeout"|"error"|"skipped"},
+             "errors": {name: str}, "elapsed": {name: seconds}, "total": seconds}.
+    """
+    _check_graph(stages)
+    started = time.perf_counter()
+    results, status, errors, elapsed = {}, {}, {}, {}
+    done_events = {s.name: asyncio.Event() for s in stages}
+
+    async def run_one(stage: Stage):
+        try:
+            for dep in stage.waits_for:
+                await done_events[dep].wait()
+            failed = [d for d in stage.depends_on if status.get(d) != "ok"]
+            if failed:
+                status[stage.name] = "skipped"
+                errors[stage.name] = f"dependency not available: {', '.join(failed)}"
+                return
+
+            inputs = {d: results.get(d) for d in stage.waits_for}
+            t0 = time.perf_counter()
+            if inspect.iscoroutinefunction(stage.func):
+                coro = stage.func(inputs)
+            else:
+                coro = asyncio.to_thread(stage.func, inputs)
+            try:
+                results[stage.name] = await asyncio.wait_for(coro, timeout=stage.timeout)
+                status[stage.name] = "ok"
+            except asyncio.TimeoutError:
+                status[stage.name] = "timeout"
+                errors[stage.name] = f"exceeded {stage.timeout}s"
+            except Exception as e:
+                status[stage.name] = "error"
+                errors[stage.name] = str(e)
+                logger.warning(f"[Stage {stage.name}] {e}")
+            finally:
+                elapsed[stage.name] = time.perf_counter() - t0
+        finally:
+            done_events[stage.name].set()
+
+    tasks = [asyncio.create_task(run_one(s), name=s.name) for s in stages]
+    _, pending = await asyncio.wait(tasks, timeout=budget)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    for s in stages:
+        if s.name not in status:
+            status[s.name] = "timeout"
+            errors[s.name] = f"global budget of {budget}s exhausted"
+
+    return {
+        "results": results,
+        "status": status,
+        "errors": errors,
+        "elapsed": elapsed,
+        "total": time.perf_counter() - started,
+    }
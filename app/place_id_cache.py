@@ -0,0 +1,139 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from rapidfuzz import fuzz
+
+from config import settings
+from data_sources.org_matcher import normalize_name
+from response_cache import cached_get, json_status_ok
+
+logger = logging.getLogger("place_id_cache")
+
+PLACES_SEARCH_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS place_ids (
+    ccn TEXT PRIMARY KEY,
+    place_id TEXT NOT NULL,
+    place_name TEXT,
+    score REAL,
+    verified_at REAL NOT NULL
+);
+"""
+
+def place_match_score(cms_name: str, place_name: str) -> float:
+    """How well a Places result name matches the CMS facility name (0-100)."""
+    if not cms_name or not place_name:
+        return 0.0
+    return float(fuzz.WRatio(normalize_name(cms_name), normalize_name(place_name)))
+
+def search_place(query: str, api_key: str, refresh: bool = False):
+    """First Places text-search result for query, or None."""
+    resp = cached_get(PLACES_SEARCH_URL, "places_search", params={"query": query, "key": api_key},
+                      validate=json_status_ok, refresh=refresh, timeout=10)
+    results = resp.json().get("results", [])
+    return results[0] if results else None
+
+class PlaceIdCache:
+    """
+    Persistent CMS CCN -> Google place_id mapping with the name-match score and the time
+    it was last verified. Known facilities can go straight to the Places details call,
+    and each successful details lookup re-verifies the mapping; mappings that expire
+    without one are re-resolved in the background.
+    """
+
+    def __init__(self, path: str = None, ttl: float = None):
+        self.path = path or settings.PLACE_ID_CACHE_PATH
+        self.ttl = settings.PLACE_ID_TTL if ttl is None else ttl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="place-id")
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, ccn: str):
+        """Mapping dict for a CCN (with an 'expired' flag), or None."""
+        if not ccn:
+            return None
+        row = self._conn().execute(
+            "SELECT place_id, place_name, score, verified_at FROM place_ids WHERE ccn = ?", (str(ccn),)
+        ).fetchone()
+        if row is None:
+            return None
+        place_id, place_name, score, verified_at = row
+        return {
+            "ccn": str(ccn), "place_id": place_id, "place_name": place_name, "score": score,
+            "verified_at": verified_at, "expired": time.time() - verified_at > self.ttl,
+        }
+
+    def usable(self, ccn: str):
+        """Mapping if it exists and its match score clears PLACE_ID_MIN_SCORE, else None."""
+        entry = self.get(ccn)
+        if entry and (entry["score"] or 0) >= settings.PLACE_ID_MIN_SCORE:
+            return entry
+        return None
+
+    def put(self, ccn: str, place_id: str, place_name: str = None, score: float = None):
+        if not ccn or not place_id:
+            return
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO place_ids VALUES (?, ?, ?, ?, ?)",
+                (str(ccn), place_id, place_name, score, time.time()),
+            )
+
+    def touch(self, ccn: str):
+        """Mark a mapping verified now (a details lookup for its place_id succeeded)."""
+        with self._conn() as conn:
+            conn.execute("UPDATE place_ids SET verified_at = ? WHERE ccn = ?", (time.time(), str(ccn)))
+
+    def forget(self, ccn: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM place_ids WHERE ccn = ?", (str(ccn),))
+
+    def resolve(self, ccn: str, cms_name: str, query: str, api_key: str, refresh: bool = False):
+        """Run a Places text search for query and store the result for ccn. Returns the mapping or None."""
+        place = search_place(query, api_key, refresh=refresh)
+        if not place or not place.get("place_id"):
+            return None
+        score = place_match_score(cms_name or query, place.get("name"))
+        self.put(ccn, place["place_id"], place.get("name"), score)
+        return self.get(ccn)
+
+    def refresh_later(self, ccn: str, cms_name: str, query: str, api_key: str):
+        """Re-resolve an expired mapping in a background thread (once per CCN at a time)."""
+        with self._lock:
+            if ccn in self._pending:
+                return
+            self._pending.add(ccn)
+
+        def job():
+            try:
+                self.resolve(ccn, cms_name, query, api_key, refresh=True)
+            except Exception as e:
+                logger.info(f"Place id refresh failed for {ccn}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(ccn)
+
+        self._pool.submit(job)
+
+@st.cache_resource
+def get_place_id_cache() -> PlaceIdCache:
+    """Single PlaceIdCache per process."""
+    return PlaceIdCache()
@@ -0,0 +1,377 @@
+import re
+import time
+import asyncio
+import inspect
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from aiolimiter import AsyncLimiter
+
+from config import settings
+from data_sources.google_utils import google_search_name, match_org_ranked, normalize_name
+from data_sources.org_matcher import matcher_for
+from data_sources.cms_utils import calculate_cms_score
+from data_sources.site_crawler import crawl_site
+from data_sources.news_utils import afetch_news, dedupe_items, get_news_store
+from data_sources.usnews import fetch_usnews_rankings
+from data_sources.usnews_index import get_usnews_index
+from data_sources.yelp_utils import afetch_yelp_reviews_paged, fetch_yelp_reviews_api
+from response_cache import get_response_cache, json_status_ok
+from place_id_cache import get_place_id_cache, place_match_score
+from orchestrator import Stage, run_stages
+from source_ledger import content_hash
+
+PLACES_SEARCH_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+PLACES_DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+PLACES_DETAILS_FIELDS = (
+    "name,reviews,formatted_address,rating,"
+    "user_ratings_total,formatted_phone_number,international_phone_number,"
+    "website,opening_hours,geometry,types,place_id"
+)
+
+# -------------------------
+# Google Places
+# -------------------------
+_google_limiter = None
+
+def get_google_limiter() -> AsyncLimiter:
+    """
+    Process-wide Places limiter, created on first use from a coroutine. Never hop to the
+    background loop here: callers already run on it, and blocking on it would deadlock.
+    """
+    global _google_limiter
+    if _google_limiter is None:
+        _google_limiter = AsyncLimiter(5, 1)
+    return _google_limiter
+
+async def limited_google_search(query, api_key):
+    async with get_google_limiter():
+        return await get_response_cache().aget_json(
+            PLACES_SEARCH_URL, "places_search", params={"query": query, "key": api_key}
+        )
+
+async def limited_google_details_response(place_id, api_key):
+    """Places details as a CachedResponse (from_cache tells a network fetch from a cache hit)."""
+    async with get_google_limiter():
+        params = {"place_id": place_id, "fields": PLACES_DETAILS_FIELDS, "key": api_key}
+        resp = await get_response_cache().aget(PLACES_DETAILS_URL, "places_details", params=params,
+                                               validate=json_status_ok)
+    resp.raise_for_status()
+    return resp
+
+async def limited_google_details(place_id, api_key):
+    return (await limited_google_details_response(place_id, api_key)).json()
+
+async def fetch_google_profile(org_name, api_key, ccn=None, cms_name=None):
+    """
+    Places details + reviews for an org. When the CMS CCN already has a verified place_id
+    the text search is skipped; expired mappings are re-resolved in the background.
+    """
+    place_ids = get_place_id_cache()
+    google_reviews = []
+    place_info = {}
+    if api_key:
+        details = None
+        known = place_ids.usable(ccn)
+        if known:
+            resp = await limited_google_details_response(known["place_id"], api_key)
+            details = resp.json()
+            if details.get("status") in ("NOT_FOUND", "INVALID_REQUEST"):
+                # Place was removed or merged: drop the mapping and search again
+                place_ids.forget(ccn)
+                details = None
+            elif details.get("status") == "OK" and not resp.from_cache:
+                # Only a live answer re-verifies the mapping; a cached one may be days old
+                place_ids.touch(ccn)
+            elif known["expired"]:
+                place_ids.refresh_later(ccn, cms_name, org_name, api_key)
+
+        if details is None:
+            search_data = await limited_google_search(org_name, api_key)
+            results = search_data.get("results", [])
+            if results:
+                place = results[0]
+                place_id = place.get("place_id")
+                if place_id:
+                    if ccn:
+                        score = place_match_score(cms_name or org_name, place.get("name"))
+                        place_ids.put(ccn, place_id, place.get("name"), score)
+                    details = await limited_google_details(place_id, api_key)
+
+        if details:
+            place_info = details.get("result", {})
+            for r in place_info.get("reviews", []):
+                google_reviews.append({
+                    "name": place_info.get("name"),
+                    "address": place_info.get("formatted_address"),
+                    "rating": r.get("rating"),
+                    "user_ratings_total": place_info.get("user_ratings_total"),
+                    "author_name": r.get("author_name"),
+                    "review_text": r.get("text"),
+                    "time": datetime.fromtimestamp(r.get("time"), tz=timezone.utc).isoformat() if r.get("time") else None
+                })
+    return google_reviews, place_info
+
+# -------------------------
+# Pipeline
+# -------------------------
+def extract_location(google_hits):
+    """Extract (city, state) from the first Google snippet that looks like 'City, ST'."""
+    for hit in google_hits or []:
+        snippet = hit.get("snippet","")
+        match_loc = re.search(r"\b([A-Za-z\s]+),\s([A-Z]{2})\b", snippet)
+        if match_loc:
+            return match_loc.group(1), match_loc.group(2)
+    return None, None
+
+def score_profile(match, place_info) -> dict:
+    """CMS score, Google rating and their 50/50 combination (whichever exist)."""
+    cms_score = calculate_cms_score(match) if match is not None else None
+    google_score = place_info.get("rating") if place_info else None
+    combined_score = None
+    if cms_score and google_score:
+        combined_score = round(0.5*float(google_score) + 0.5*float(cms_score),2)
+    elif cms_score:
+        combined_score = float(cms_score)
+    elif google_score:
+        combined_score = float(google_score)
+    return {"cms_score": cms_score, "google_score": google_score, "combined_score": combined_score}
+
+def cms_row_hash(match) -> str:
+    """Content hash of a CMS row (what the source ledger compares across snapshots)."""
+    return content_hash(to_jsonable(match.to_dict()))
+
+def fetched_ok(source: str, value) -> bool:
+    """
+    Whether a source returned real content. The fetchers swallow their errors and return
+    empty values ({}, [], ([], {}), {"error": ...}), which must not be reused as fresh.
+    """
+    if source == "places":
+        return bool(value and value[1])
+    if source == "site":
+        return bool(value and value.get("pages"))
+    if isinstance(value, dict) and value.get("error"):
+        return False
+    return bool(value)
+
+def _ledger_stage(ledger, profile_key, source, func, input_of, nothing_to_fetch=None, force=False):
+    """
+    Stage func that returns the ledger's stored value while it is fresh for the same inputs
+    (with force it always fetches). Only successful fetches are recorded, so a failed source
+    is retried on the next run; an empty value is recorded when nothing_to_fetch(deps) says
+    it is the real answer.
+    """
+    async def run(deps):
+        input_hash = content_hash(to_jsonable(input_of(deps)))
+        if not force:
+            fresh, value = ledger.reuse(profile_key, source, input_hash)
+            if fresh:
+                return value
+        value = await func(deps) if inspect.iscoroutinefunction(func) else await asyncio.to_thread(func, deps)
+        if fetched_ok(source, value) or (nothing_to_fetch is not None and nothing_to_fetch(deps)):
+            ledger.put(profile_key, source, to_jsonable(value), input_hash)
+        return value
+    return run
+
+def build_profile_stages(org_name, api_key, df_cms, city=None, state=None, yelp_url=None, yelp_api_key=None,
+                         ccn=None, ledger=None, profile_key=None, force=False):
+    """
+    Profile sources as orchestrator stages. News only needs the name, so it runs
+    alongside pre-validation -> CMS match -> Places -> website scrape. US News is read
+    from the local rankings index by CMS CCN (live search only while the index is empty).
+    A known city/state narrows the CMS match and skips pre-validation; a known CCN replaces
+    both with a direct row lookup. Yelp runs only with a URL or API key.
+    With a source ledger, sources still fresh for profile_key are reused instead of fetched
+    (unless force, which fetches every source and records the results).
+    """
+    timeouts = settings.STAGE_TIMEOUTS
+    matcher = matcher_for(df_cms)
+
+    def ccn_of(cms):
+        return cms["match"].get(matcher.ccn_col) if cms and cms.get("match") is not None and matcher.ccn_col else None
+
+    def prevalidate(_):
+        return google_search_name(org_name, limit=settings.GOOGLE_SEARCH_PREVALIDATION_RESULTS)
+
+    def cms_row(_):
+        match = matcher.row_for_ccn(ccn)
+        msg = f"CMS facility {ccn}" if match is not None else f"CCN {ccn} not in CMS data"
+        return {"match": match, "name_col": matcher.name_col, "msg": msg, "ranked": None,
+                "city": match.get(matcher.city_col) if match is not None and matcher.city_col else city,
+                "state": match.get(matcher.state_col) if match is not None and matcher.state_col else state}
+
+    def cms_match(deps):
+        hit_city, hit_state = extract_location(deps.get("prevalidate"))
+        match_city, match_state = (city, state) if state else (hit_city, hit_state)
+        match, name_col, msg, ranked = match_org_ranked(org_name, df_cms, state=match_state, city=match_city, top_k=5)
+        return {"match": match, "name_col": name_col, "msg": msg, "ranked": ranked, "city": match_city, "state": match_state}
+
+    async def places(deps):
+        cms = deps["cms_match"]
+        if cms["match"] is None:
+            return [], {}
+        cms_name = cms["match"].get(cms["name_col"]) or org_name
+        return await fetch_google_profile(normalize_name(cms_name), api_key, ccn=ccn_of(cms), cms_name=cms_name)
+
+    def about(deps):
+        # Title / meta description / h1 of the homepage the site stage already fetched and parsed
+        crawl = deps.get("site") or {}
+        home = (crawl.get("pages") or {}).get(crawl.get("url"))
+        if not home:
+            return {}
+        fields = ("title", "meta_description", "h1")
+        return dict({f: home.get(f, "") for f in fields}, url=website(deps))
+
+    async def site(deps):
+        website = deps["places"][1].get("website")
+        return await crawl_site(website) if website else {}
+
+    async def news(_):
+        items = dedupe_items(await afetch_news(org_name))
+        recorded = await asyncio.to_thread(get_news_store().record, items)  # SQLite write, off the loop
+        new_keys = {item["key"] for item in recorded.get(org_name, [])}
+        return [dict(item, new=item["key"] in new_keys) for item in items]
+
+    def usnews(deps):
+        index = get_usnews_index()
+        if not index.refreshed_at():
+            return fetch_usnews_rankings(org_name)
+        cms = deps["cms_match"] or {}
+        entry = index.lookup(ccn=ccn_of(cms), name=org_name, state=cms.get("state"))
+        return entry or {"ranking": "N/A", "specialties": [], "source": "index"}
+
+    async def yelp(deps):
+        if yelp_url:
+            return await afetch_yelp_reviews_paged(yelp_url, settings.BATCH_YELP_LIMIT)
+        if yelp_api_key:
+            cms = deps["cms_match"] or {}
+            # requests + sleep-based throttling: keep it off the shared loop
+            return await asyncio.to_thread(fetch_yelp_reviews_api, org_name, cms.get("city"), yelp_api_key)
+        return []
+
+    def score(deps):
+        cms = deps["cms_match"] or {}
+        return score_profile(cms.get("match"), (deps["places"] or ([], {}))[1])
+
+    def cms_identity(deps):
+        match = (deps["cms_match"] or {}).get("match")
+        cols = (matcher.ccn_col, matcher.name_col, matcher.city_col, matcher.state_col)
+        return [match.get(c) for c in cols if c] if match is not None else None
+
+    def website(deps):
+        return (deps["places"] or ([], {}))[1].get("website")
+
+    # What each reusable source was fetched for; a stored value is only reused for the same inputs
+    source_inputs = {
+        "prevalidate": lambda deps: org_name,
+        "places": lambda deps: [cms_identity(deps), bool(api_key)],
+        "about": website,
+        "site": website,
+        "news": lambda deps: org_name,
+        "usnews": lambda deps: [ccn_of(deps["cms_match"]), org_name, get_usnews_index().refreshed_at()],
+        "yelp": lambda deps: [yelp_url, bool(yelp_api_key), org_name],
+    }
+
+    # Sources with nothing to fetch for these inputs, where an empty value is not a failure
+    nothing_to_fetch = {
+        "places": lambda deps: not api_key or (deps["cms_match"] or {}).get("match") is None,
+        "about": lambda deps: not website(deps),
+        "site": lambda deps: not website(deps),
+        "yelp": lambda deps: not yelp_url and not yelp_api_key,
+    }
+
+    if ccn:
+        identify = [Stage("cms_match", cms_row, timeout=timeouts["cms_match"])]
+    elif state:
+        # A known state makes the Google snippets redundant for matching: skip the search
+        identify = [Stage("cms_match", cms_match, timeout=timeouts["cms_match"])]
+    else:
+        identify = [
+            Stage("prevalidate", prevalidate, timeout=timeouts["prevalidate"]),
+            Stage("cms_match", cms_match, soft_depends_on=["prevalidate"], timeout=timeouts["cms_match"]),
+        ]
+    stages = identify + [
+        Stage("places", places, depends_on=["cms_match"], timeout=timeouts["places"]),
+        Stage("site", site, depends_on=["places"], timeout=timeouts["site"]),
+        Stage("about", about, depends_on=["places"], soft_depends_on=["site"], timeout=timeouts["about"]),
+        Stage("news", news, timeout=timeouts["news"]),
+        Stage("usnews", usnews, soft_depends_on=["cms_match"], timeout=timeouts["usnews"]),
+        Stage("yelp", yelp, soft_depends_on=["cms_match"], timeout=timeouts["yelp"]),
+        Stage("score", score, soft_depends_on=["cms_match", "places"], timeout=timeouts["score"]),
+    ]
+    if ledger is not None and profile_key:
+        for stage in stages:
+            if stage.name in source_inputs:
+                stage.func = _ledger_stage(ledger, profile_key, stage.name, stage.func, source_inputs[stage.name],
+                                           nothing_to_fetch.get(stage.name), force)
+    return stages
+
+async def profile_org(org_name, api_key, df_cms, budget=None, ledger=None, profile_key=None, **kwargs) -> dict:
+    """
+    Run every profile stage for one org; returns the orchestrator run dict. With a source
+    ledger the CMS row hash is recorded too, and run["sources"] holds per-source
+    fetch times and content hashes.
+    """
+    stages = build_profile_stages(org_name, api_key, df_cms, ledger=ledger, profile_key=profile_key, **kwargs)
+    run = await run_stages(stages, budget=budget or settings.PROFILE_BUDGET)
+    if ledger is not None and profile_key:
+        match = (run["results"].get("cms_match") or {}).get("match")
+        if match is not None:
+            ledger.put(profile_key, "cms", to_jsonable(match.to_dict()), store_value=False)
+        run["sources"] = ledger.summary(profile_key)
+    return run
+
+# -------------------------
+# Serialization
+# -------------------------
+def to_jsonable(value):
+    """Plain JSON types for pandas/numpy values (NA -> None)."""
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is pd.NA or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+def profile_record(org_name, run: dict, df_cms) -> dict:
+    """One self-contained, JSON-serializable record of a profile run (for batch output)."""
+    results = run["results"]
+    matcher = matcher_for(df_cms)
+    cms = results.get("cms_match") or {}
+    match = cms.get("match")
+    ranked = cms.get("ranked")
+    google_reviews, place_info = results.get("places") or ([], {})
+    site = results.get("site") or {}
+    record = {
+        "org_name": org_name,
+        "ccn": match.get(matcher.ccn_col) if match is not None and matcher.ccn_col else None,
+        "cms_name": match.get(cms.get("name_col")) if match is not None else None,
+        "city": cms.get("city"),
+        "state": cms.get("state"),
+        "match_score": (
+            float(ranked["match_score"].iloc[0]) if ranked is not None and not ranked.empty
+            else 1.0 if match is not None else None  # direct CCN lookup
+        ),
+        "cms": match.to_dict() if match is not None else None,
+        "place": {k: place_info.get(k) for k in (
+            "place_id", "name", "formatted_address", "rating", "user_ratings_total",
+            "formatted_phone_number", "website", "types",
+        )} if place_info else None,
+        "google_reviews": google_reviews,
+        "about": results.get("about") or None,
+        "site": {k: site.get(k) for k in ("organization", "addresses", "by_kind")} if site else None,
+        "news": [{k: item.get(k) for k in ("title", "link", "date", "source")} for item in results.get("news") or []],
+        "usnews": results.get("usnews"),
+        "yelp_reviews": results.get("yelp") or [],
+        **(results.get("score") or score_profile(None, place_info)),
+        "sources": run.get("sources"),
+        "status": run["status"],
+        "errors": run["errors"],
+        "elapsed_s": round(run["total"], 3),
+        "profiled_at": time.time(),
+    }
+    return to_jsonable(record)
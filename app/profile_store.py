@@ -0,0 +1,371 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import pandas as pd
+import streamlit as st
+
+from config import settings
+from data_sources.org_matcher import NAME_COLUMNS, CITY_COLUMNS, STATE_COLUMNS
+
+logger = logging.getLogger("profile_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS facilities (
+    ccn TEXT PRIMARY KEY,
+    place_id TEXT,
+    name TEXT,
+    address TEXT,
+    city TEXT COLLATE NOCASE,
+    state TEXT COLLATE NOCASE,
+    hospital_type TEXT COLLATE NOCASE,
+    ownership TEXT,
+    overall_rating REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_facilities_state_city ON facilities(state, city);
+CREATE INDEX IF NOT EXISTS idx_facilities_city ON facilities(city);
+CREATE INDEX IF NOT EXISTS idx_facilities_type ON facilities(hospital_type);
+CREATE INDEX IF NOT EXISTS idx_facilities_place ON facilities(place_id);
+
+CREATE TABLE IF NOT EXISTS profiles (
+    profile_key TEXT PRIMARY KEY,
+    ccn TEXT,
+    place_id TEXT,
+    org_name TEXT NOT NULL,
+    cms_name TEXT,
+    city TEXT,
+    state TEXT,
+    match_score REAL,
+    status TEXT,
+    errors TEXT,
+    sources TEXT,
+    record TEXT NOT NULL,
+    profiled_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_profiles_ccn ON profiles(ccn);
+CREATE INDEX IF NOT EXISTS idx_profiles_place ON profiles(place_id);
+CREATE INDEX IF NOT EXISTS idx_profiles_profiled_at ON profiles(profiled_at);
+
+CREATE TABLE IF NOT EXISTS scores (
+    profile_key TEXT PRIMARY KEY,
+    ccn TEXT,
+    cms_score REAL,
+    google_score REAL,
+    combined_score REAL,
+    scored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scores_combined ON scores(combined_score);
+CREATE INDEX IF NOT EXISTS idx_scores_ccn ON scores(ccn);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    review_key TEXT PRIMARY KEY,
+    profile_key TEXT NOT NULL,
+    ccn TEXT,
+    place_id TEXT,
+    source TEXT NOT NULL,
+    author TEXT,
+    rating REAL,
+    text TEXT,
+    review_time TEXT,
+    first_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reviews_profile ON reviews(profile_key, source);
+CREATE INDEX IF NOT EXISTS idx_reviews_ccn ON reviews(ccn);
+
+CREATE TABLE IF NOT EXISTS about (
+    profile_key TEXT PRIMARY KEY,
+    ccn TEXT,
+    website TEXT,
+    title TEXT,
+    description TEXT,
+    about TEXT,
+    site TEXT,
+    fetched_at REAL NOT NULL
+);
+"""
+
+# CMS columns copied onto facilities (first present candidate wins)
+FACILITY_COLUMNS = {
+    "name": NAME_COLUMNS,
+    "address": ["Address"],
+    "city": CITY_COLUMNS,
+    "state": STATE_COLUMNS,
+    "hospital_type": ["Hospital Type"],
+    "ownership": ["Hospital Ownership"],
+    "overall_rating": ["Hospital overall rating"],
+}
+CCN_COLUMNS = ["Facility ID", "CCN", "Provider ID"]
+
+# query() result columns -> SQL expressions (qualified: profiles and facilities share names)
+QUERY_COLUMNS = {
+    "profile_key": "p.profile_key",
+    "ccn": "p.ccn",
+    "place_id": "COALESCE(p.place_id, f.place_id)",
+    "name": "COALESCE(f.name, p.cms_name, p.org_name)",
+    "city": "COALESCE(f.city, p.city)",
+    "state": "COALESCE(f.state, p.state)",
+    "hospital_type": "f.hospital_type",
+    "overall_rating": "f.overall_rating",
+    "cms_score": "s.cms_score",
+    "google_score": "s.google_score",
+    "combined_score": "s.combined_score",
+    "profiled_at": "p.profiled_at",
+}
+
+def review_facility(ccn=None, place_id=None, profile_key=None):
+    """
+    Facility identity a review is hashed under: the CCN when known, else the Google
+    place_id, else the profile key. The UI, batch runs and bulk merge agree on it
+    whatever profile key they use.
+    """
+    return str(ccn) if ccn else place_id or profile_key
+
+def review_hash(facility: str, source: str, author, text) -> str:
+    """
+    Identity of a review: the same author + text from one source about one facility
+    (see review_facility) is one review. Identical short reviews of different facilities stay apart.
+    """
+    key = f"{facility}|{source}|{(author or '').strip().lower()}|{' '.join((text or '').split())}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def normalize_reviews(record: dict) -> list[dict]:
+    """Google and Yelp reviews of a profile record as {"source", "author", "rating", "text", "time"}."""
+    reviews = []
+    for r in record.get("google_reviews") or []:
+        reviews.append({"source": "google", "author": r.get("author_name"), "rating": r.get("rating"),
+                        "text": r.get("review_text"), "time": r.get("time")})
+    for r in record.get("yelp_reviews") or []:
+        reviews.append({"source": "yelp", "author": r.get("user"), "rating": r.get("rating"),
+                        "text": r.get("text"), "time": r.get("date")})
+    return [r for r in reviews if r["text"]]
+
+def _first(values: dict, candidates):
+    for c in candidates:
+        if values.get(c) is not None:
+            return values[c]
+    return None
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _loads(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+class ProfileStore:
+    """
+    Queryable SQLite store of profile results: CMS facilities (keyed by CCN, with their
+    Google place_id), the latest profile per org, its scores, reviews and about data.
+    Facilities are indexed on state, city and hospital type, scores on combined score.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.PROFILE_STORE_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            # Stores created before the match score was renamed
+            if "match_confidence" in {row[1] for row in conn.execute("PRAGMA table_info(profiles)")}:
+                conn.execute("ALTER TABLE profiles RENAME COLUMN match_confidence TO match_score")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # -------------------------
+    # Writes
+    # -------------------------
+    @staticmethod
+    def _facility_row(values: dict, ccn, place_id=None, now: float = None):
+        return (
+            str(ccn), place_id, _first(values, FACILITY_COLUMNS["name"]), _first(values, FACILITY_COLUMNS["address"]),
+            _first(values, FACILITY_COLUMNS["city"]), _first(values, FACILITY_COLUMNS["state"]),
+            _first(values, FACILITY_COLUMNS["hospital_type"]), _first(values, FACILITY_COLUMNS["ownership"]),
+            _float(_first(values, FACILITY_COLUMNS["overall_rating"])), now or time.time(),
+        )
+
+    def load_facilities(self, df_cms: pd.DataFrame) -> int:
+        """Upsert every CMS facility (keeps place_ids already resolved). Returns the row count."""
+        ccn_col = next((c for c in CCN_COLUMNS if c in df_cms.columns), None)
+        if ccn_col is None:
+            return 0
+        df = df_cms.astype(object).where(df_cms.notna(), None)
+        now = time.time()
+        rows = [self._facility_row(values, values[ccn_col], now=now)
+                for values in df.to_dict("records") if values[ccn_col] is not None]
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO facilities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(ccn) DO UPDATE SET "
+                "name=excluded.name, address=excluded.address, city=excluded.city, state=excluded.state, "
+                "hospital_type=excluded.hospital_type, ownership=excluded.ownership, "
+                "overall_rating=excluded.overall_rating, updated_at=excluded.updated_at",
+                rows,
+            )
+        return len(rows)
+
+    def save_record(self, record: dict, profile_key: str = None):
+        """
+        Store one profile record (profile_engine.profile_record output or a batch/bulk row).
+        Matched records are keyed by their CCN, so the UI, batch runs and bulk merge share one
+        row per facility; profile_key is only used for records without a CCN.
+        """
+        self.save_records([record], [profile_key])
+
+    def save_records(self, records: list[dict], profile_keys: list = None):
+        """Store many profile records in one transaction; nested fields may be dicts or JSON strings."""
+        now = time.time()
+        profile_keys = profile_keys or [None] * len(records)
+        with self._conn() as conn:
+            for record, key in zip(records, profile_keys):
+                record = {k: _loads(v) if k in ("cms", "place", "about", "site", "status", "errors", "sources",
+                                                "google_reviews", "yelp_reviews") else v
+                          for k, v in record.items()}
+                ccn = record.get("ccn")
+                key = str(ccn) if ccn else key or f"org:{record['org_name']}|{record.get('state') or ''}"
+                place = record.get("place") or {}
+                place_id = place.get("place_id")
+                profiled_at = record.get("profiled_at") or now
+
+                if ccn and record.get("cms"):
+                    conn.execute(
+                        "INSERT INTO facilities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(ccn) DO UPDATE SET "
+                        "place_id=COALESCE(excluded.place_id, facilities.place_id), name=excluded.name, "
+                        "address=excluded.address, city=excluded.city, state=excluded.state, "
+                        "hospital_type=excluded.hospital_type, ownership=excluded.ownership, "
+                        "overall_rating=excluded.overall_rating, updated_at=excluded.updated_at",
+                        self._facility_row(record["cms"], ccn, place_id, now),
+                    )
+                elif ccn and place_id:
+                    conn.execute("UPDATE facilities SET place_id = ? WHERE ccn = ?", (place_id, str(ccn)))
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, ccn, place_id, record["org_name"], record.get("cms_name"), record.get("city"),
+                     record.get("state"), record.get("match_score"), json.dumps(record.get("status")),
+                     json.dumps(record.get("errors")), json.dumps(record.get("sources")),
+                     json.dumps(record, default=str), profiled_at),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, ccn, _float(record.get("cms_score")), _float(record.get("google_score")),
+                     _float(record.get("combined_score")), profiled_at),
+                )
+                about, site = record.get("about") or {}, record.get("site") or {}
+                if about or site:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO about VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, ccn, place.get("website") or about.get("url"), about.get("title"),
+                         about.get("description"), json.dumps(about), json.dumps(site), profiled_at),
+                    )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(review_hash(review_facility(ccn, place_id, key), r["source"], r["author"], r["text"]),
+                      key, ccn, place_id, r["source"],
+                      r["author"], _float(r["rating"]), r["text"], r["time"], now)
+                     for r in normalize_reviews(record)],
+                )
+
+    def load_parquet(self, path: str, batch_size: int = 500) -> int:
+        """Load a batch/bulk Parquet dataset (file or directory of parts) into the store."""
+        import pyarrow.dataset as ds
+        count = 0
+        for batch in ds.dataset(path, format="parquet").to_batches(batch_size=batch_size):
+            records = batch.to_pylist()
+            self.save_records(records, [r.get("ccn") or None for r in records])
+            count += len(records)
+        return count
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def query(self, state: str = None, city: str = None, hospital_type: str = None,
+              min_score: float = None, max_score: float = None, profiled_within_days: float = None,
+              ccn: str = None, place_id: str = None, order_by: str = "combined_score", limit: int = None) -> pd.DataFrame:
+        """
+        Stored profiles with their facility and scores. Filters are ANDed; text filters are
+        case-insensitive exact matches. E.g. CA acute care hospitals scoring under 3 that
+        were profiled this week:
+            store.query(state="CA", hospital_type="Acute Care Hospitals", max_score=3, profiled_within_days=7)
+        """
+        where, params = [], []
+        for column, value in (("f.state", state), ("f.city", city), ("f.hospital_type", hospital_type),
+                              ("p.place_id", place_id)):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if ccn:
+            where.append("p.ccn = ?")
+            params.append(str(ccn))
+        if min_score is not None:
+            where.append("s.combined_score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            where.append("s.combined_score < ?")
+            params.append(max_score)
+        if profiled_within_days is not None:
+            where.append("p.profiled_at >= ?")
+            params.append(time.time() - profiled_within_days * 86400)
+        join = "JOIN" if state or city or hospital_type else "LEFT JOIN"
+        if order_by not in QUERY_COLUMNS:
+            raise ValueError(f"Cannot order by {order_by!r}")
+        order = QUERY_COLUMNS[order_by]
+        sql = (
+            "SELECT " + ", ".join(f"{expr} AS {name}" for name, expr in QUERY_COLUMNS.items())
+            + f" FROM profiles p JOIN scores s ON s.profile_key = p.profile_key {join} facilities f ON f.ccn = p.ccn"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + f" ORDER BY {order} IS NULL, {order}"
+            + (" LIMIT ?" if limit else "")
+        )
+        rows = self._conn().execute(sql, params + ([limit] if limit else [])).fetchall()
+        df = pd.DataFrame(rows, columns=list(QUERY_COLUMNS))
+        df["profiled_at"] = pd.to_datetime(df["profiled_at"], unit="s", utc=True)
+        return df
+
+    def profile(self, profile_key: str):
+        """Full stored record for a profile key (CCN or org key), or None."""
+        row = self._conn().execute("SELECT record FROM profiles WHERE profile_key = ?", (profile_key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def reviews(self, profile_key: str = None, ccn: str = None, source: str = None) -> pd.DataFrame:
+        """Stored reviews for a profile (or every profile of a CCN), optionally one source."""
+        where, params = [], []
+        if profile_key:
+            where.append("profile_key = ?")
+            params.append(profile_key)
+        if ccn:
+            where.append("ccn = ?")
+            params.append(str(ccn))
+        if source:
+            where.append("source = ?")
+            params.append(source)
+        cols = ["source", "author", "rating", "text", "review_time", "first_seen"]
+        rows = self._conn().execute(
+            f"SELECT {', '.join(cols)} FROM reviews" + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY first_seen", params,
+        ).fetchall()
+        return pd.DataFrame(rows, columns=cols)
+
+    def hospital_types(self) -> list[str]:
+        return [r[0] for r in self._conn().execute(
+            "SELECT DISTINCT hospital_type FROM facilities WHERE hospital_type IS NOT NULL ORDER BY 1"
+        ).fetchall()]
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+@st.cache_resource
+def get_profile_store() -> ProfileStore:
+    """Single ProfileStore per process."""
+    return ProfileStore()
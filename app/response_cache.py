@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+import streamlit as st
+
+from config import settings
+from http_client import get_http_client
+from single_flight import SingleFlight
+
+logger = logging.getLogger("response_cache")
+
+# Query parameters that never change the response (and must not be stored)
+SECRET_PARAMS = {"key", "api_key", "apikey", "access_token"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT,
+    body BLOB,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_source ON responses(source);
+"""
+
+# -------------------------
+# Request normalization
+# -------------------------
+def normalize_request(url: str, params: dict = None, method: str = "GET") -> str:
+    """Method + URL with lowercased host, sorted query and secrets removed."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += list((params or {}).items())
+    query = sorted((k, str(v)) for k, v in query if k.lower() not in SECRET_PARAMS)
+    clean = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(query), ""))
+    return f"{method.upper()} {clean}"
+
+def cache_key(normalized: str, max_bytes: int = None, until=(), stop=None) -> str:
+    """
+    Key for a normalized request. A prefix read (max_bytes / until markers / stop
+    condition, keyed by its str()) is its own entry, so a truncated body is never served
+    to a caller that wants the whole page.
+    """
+    if max_bytes or until:
+        markers = ",".join(sorted(m.decode(errors="replace") if isinstance(m, bytes) else str(m) for m in until))
+        normalized = f"{normalized} prefix={max_bytes or ''} until={markers}"
+    if stop is not None:
+        normalized = f"{normalized} stop={stop}"
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def json_status_ok(resp) -> bool:
+    """Google APIs return HTTP 200 with status=OVER_QUERY_LIMIT etc.; only cache real answers."""
+    try:
+        return resp.json().get("status", "OK") in ("OK", "ZERO_RESULTS")
+    except Exception:
+        return False
+
+# -------------------------
+# Response object
+# -------------------------
+class CachedResponse:
+    """Subset of requests.Response used by the data sources, backed by a cache row or a live fetch."""
+
+    def __init__(self, url, status_code, headers, content, from_cache=False, stale=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.content = content or b""
+        self.from_cache = from_cache
+        self.stale = stale
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self):
+        charset = "utf-8"
+        ctype = self.headers.get("Content-Type", "")
+        if "charset=" in ctype:
+            charset = ctype.split("charset=")[-1].split(";")[0].strip() or charset
+        return self.content.decode(charset, errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}")
+
+# -------------------------
+# Cache
+# -------------------------
+class ResponseCache:
+    """
+    SQLite-backed HTTP response cache.
+    - fresh hit (age < source TTL): served locally
+    - stale hit (within CACHE_MAX_STALE): served locally, revalidated in the background
+      with If-None-Match / If-Modified-Since (stale-while-revalidate)
+    - miss / too stale: fetched, stored if cacheable
+    - fetch error with any cached copy: the cached copy is served (stale-if-error)
+    - offline mode: only cached responses are served, misses return 504
+    Live fetches are coalesced process-wide by normalized request (single-flight), so
+    identical concurrent requests from different sessions hit the origin once.
+    """
+
+    def __init__(self, path: str = None, offline: bool = None):
+        self.path = path or settings.RESPONSE_CACHE_PATH
+        self.offline = settings.OFFLINE_MODE if offline is None else offline
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="revalidate")
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @staticmethod
+    def ttl_for(source: str) -> float:
+        return settings.CACHE_TTLS.get(source, settings.CACHE_TTLS["default"])
+
+    def lookup(self, key: str):
+        row = self._conn().execute(
+            "SELECT url, status, headers, body, etag, last_modified, fetched_at, expires_at "
+            "FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, etag, last_modified, fetched_at, expires_at = row
+        return {
+            "url": url, "status": status, "headers": json.loads(headers or "{}"), "body": body,
+            "etag": etag, "last_modified": last_modified, "fetched_at": fetched_at, "expires_at": expires_at,
+        }
+
+    def store(self, key: str, source: str, normalized: str, resp, ttl: float):
+        now = time.time()
+        headers = {k: v for k, v in resp.headers.items() if k.lower() in ("content-type", "etag", "last-modified")}
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, source, normalized, resp.status_code, json.dumps(headers), resp.content,
+                 resp.headers.get("ETag"), resp.headers.get("Last-Modified"), now, now + ttl),
+            )
+
+    def touch(self, key: str, ttl: float):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("UPDATE responses SET fetched_at = ?, expires_at = ? WHERE key = ?", (now, now + ttl, key))
+
+    def invalidate(self, source: str = None):
+        """Drop cached responses, optionally for one source only."""
+        with self._conn() as conn:
+            if source:
+                conn.execute("DELETE FROM responses WHERE source = ?", (source,))
+            else:
+                conn.execute("DELETE FROM responses")
+
+    def _fetch(self, key, source, normalized, url, params, headers, ttl, validate, cached=None,
+               max_bytes=None, until=(), stop=None, **kwargs):
+        """
+        Live (optionally conditional) fetch; stores and returns a CachedResponse.
+        With max_bytes only a streamed prefix of the body is read (see HttpClient.get_prefix).
+        """
+        req_headers = dict(headers or {})
+        if cached:
+            if cached["etag"]:
+                req_headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                req_headers["If-Modified-Since"] = cached["last_modified"]
+
+        client = get_http_client()
+        if max_bytes:
+            resp = client.get_prefix(url, max_bytes, until=until, stop=stop, params=params, headers=req_headers,
+                                     **kwargs)
+        else:
+            resp = client.get(url, params=params, headers=req_headers, **kwargs)
+        if resp.status_code == 304 and cached:
+            self.touch(key, ttl)
+            return self._from_row(cached, from_cache=True)
+        if resp.status_code == 200 and (validate is None or validate(resp)):
+            self.store(key, source, normalized, resp, ttl)
+        return CachedResponse(resp.url, resp.status_code, resp.headers, resp.content)
+
+    def _revalidate_later(self, key, *args, **kwargs):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def job():
+            try:
+                self._fetch(key, *args, **kwargs)
+            except Exception as e:
+                logger.info(f"Background revalidation failed: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        self._pool.submit(job)
+
+    @staticmethod
+    def _from_row(row, from_cache=True, stale=False):
+        # The url column holds the normalized request ("GET <url>"); expose just the URL
+        url = row["url"].split(" ", 1)[-1]
+        return CachedResponse(url, row["status"], row["headers"], row["body"], from_cache=from_cache, stale=stale)
+
+    def get(self, url: str, source: str = "default", params: dict = None, headers: dict = None,
+            ttl: float = None, validate=None, refresh: bool = False, **kwargs) -> CachedResponse:
+        """
+        Cached drop-in for http_get(url, params=..., headers=...).
+        refresh=True skips fresh/stale hits and revalidates against the origin.
+        max_bytes / until (passed through to the fetch) cache only a streamed body prefix.
+        """
+        ttl = self.ttl_for(source) if ttl is None else ttl
+        normalized = normalize_request(url, params)
+        key = cache_key(normalized, kwargs.get("max_bytes"), kwargs.get("until", ()))
+        cached = self.lookup(key)
+        now = time.time()
+
+        if cached and (self.offline or (now < cached["expires_at"] and not refresh)):
+            self._count("hits")
+            return self._from_row(cached)
+        if self.offline:
+            return CachedResponse(url, 504, {}, b"", from_cache=False)
+
+        args = (source, normalized, url, params, headers, ttl, validate)
+        if cached and not refresh and now < cached["expires_at"] + settings.CACHE_MAX_STALE:
+            self._count("stale_hits")
+            self._revalidate_later(key, *args, cached=cached, **kwargs)
+            return self._from_row(cached, stale=True)
+
+        self._count("misses")
+        try:
+            return self._flight.do(key, lambda: self._fetch(key, *args, cached=cached, **kwargs))
+        except Exception:
+            if cached:
+                return self._from_row(cached, stale=True)
+            raise
+
+    async def aget(self, url: str, source: str = "default", params: dict = None, headers: dict = None,
+                   ttl: float = None, validate=None, max_bytes: int = None, stop=None) -> CachedResponse:
+        """
+        Async variant of get() that fetches misses on the shared aiohttp session.
+        stop (with max_bytes) ends the streamed read early; see HttpClient.fetch.
+        """
+        ttl = self.ttl_for(source) if ttl is None else ttl
+        normalized = normalize_request(url, params)
+        key = cache_key(normalized, max_bytes, stop=stop)
+        cached = self.lookup(key)
+        now = time.time()
+
+        if cached and (self.offline or now < cached["expires_at"]):
+            self._count("hits")
+            return self._from_row(cached)
+        if self.offline:
+            return CachedResponse(url, 504, {}, b"", from_cache=False)
+        if cached and now < cached["expires_at"] + settings.CACHE_MAX_STALE:
+            self._count("stale_hits")
+            self._revalidate_later(key, source, normalized, url, params, headers, ttl, validate,
+                                   cached=cached, max_bytes=max_bytes, stop=stop)
+            return self._from_row(cached, stale=True)
+
+        async def fetch():
+            status, resp_headers, body, final_url = await get_http_client().fetch(
+                url, params=params, headers=headers, max_bytes=max_bytes, stop=stop
+            )
+            resp = CachedResponse(final_url, status, resp_headers, body)
+            if resp.status_code == 200 and (validate is None or validate(resp)):
+                self.store(key, source, normalized, resp, ttl)
+            return resp
+
+        self._count("misses")
+        try:
+            return await self._flight.ado(key, fetch)
+        except Exception:
+            if cached:
+                return self._from_row(cached, stale=True)
+            raise
+
+    async def aget_json(self, url: str, source: str = "default", params: dict = None, headers: dict = None,
+                        ttl: float = None, validate=json_status_ok):
+        """Async JSON shortcut for aget(); raises on HTTP errors (and offline misses)."""
+        resp = await self.aget(url, source, params=params, headers=headers, ttl=ttl, validate=validate)
+        resp.raise_for_status()
+        return resp.json()
+
+    def counters(self) -> dict:
+        """Process-wide hit / miss / coalesced-fetch counters since start."""
+        flight = self._flight.stats()
+        return {
+            "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+            "fetches": flight["executed"], "coalesced": flight["coalesced"], "in_flight": flight["in_flight"],
+        }
+
+    def stats(self) -> dict:
+        rows = self._conn().execute(
+            "SELECT source, COUNT(*), SUM(LENGTH(body)), SUM(expires_at > ?) FROM responses GROUP BY source",
+            (time.time(),),
+        ).fetchall()
+        return {src: {"entries": n, "bytes": size or 0, "fresh": fresh or 0} for src, n, size, fresh in rows}
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """Single ResponseCache per process."""
+    return ResponseCache()
+
+def cached_get(url: str, source: str = "default", **kwargs) -> CachedResponse:
+    """Shortcut for get_response_cache().get(...)."""
+    return get_response_cache().get(url, source=source, **kwargs)
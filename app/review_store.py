@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import defaultdict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import streamlit as st
+
+from config import settings
+from profile_store import review_facility, review_hash, normalize_reviews
+
+logger = logging.getLogger("review_store")
+
+# Columns stored in each part file; source and month are hive partition directories
+FILE_SCHEMA = pa.schema([
+    ("review_key", pa.string()),
+    ("profile_key", pa.string()),
+    ("ccn", pa.string()),
+    ("place_id", pa.string()),
+    ("author", pa.string()),
+    ("rating", pa.float64()),
+    ("text", pa.string()),
+    ("review_time", pa.string()),
+    ("review_date", pa.timestamp("us", tz="UTC")),
+    ("first_seen", pa.timestamp("us", tz="UTC")),
+])
+PARTITIONING = ds.partitioning(pa.schema([("source", pa.string()), ("month", pa.string())]), flavor="hive")
+UNKNOWN_MONTH = "unknown"
+
+def _write_part(table: pa.Table, directory: str, name: str):
+    """
+    Write a part file atomically. The temp file is "."-prefixed, which pyarrow datasets
+    skip, so concurrent readers never open a half-written file.
+    """
+    tmp = os.path.join(directory, f".{name}.tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, os.path.join(directory, name))
+
+def _utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+def _review_dates(values: list) -> list:
+    """Parsed UTC review dates (None where missing or unparseable), in one vectorized pass."""
+    dates = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors="coerce", format="mixed")
+    return [None if pd.isna(d) else d for d in dates]
+
+class ReviewStore:
+    """
+    Append-only review history as Parquet under source=<source>/month=<YYYY-MM>/ (month
+    of the review date). Reviews are keyed by a hash of facility + source + author + text, so
+    re-appending a facility's reviews only writes the ones not stored yet. Appends are
+    buffered and written one part file per partition, rows sorted by CCN so a
+    facility filter can skip row groups.
+    """
+
+    def __init__(self, root: str = None, flush_rows: int = None):
+        self.root = root or settings.REVIEW_STORE_DIR
+        self.flush_rows = flush_rows or settings.REVIEW_FLUSH_ROWS
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._keys = {}                      # (source, month) -> stored review keys
+        self._pending = defaultdict(list)    # (source, month) -> rows not yet written
+
+    def _partition_dir(self, source: str, month: str) -> str:
+        return os.path.join(self.root, f"source={source}", f"month={month}")
+
+    def _stored_keys(self, source: str, month: str) -> set:
+        """Review keys already in a partition (read once per process, key column only)."""
+        part = (source, month)
+        if part not in self._keys:
+            directory = self._partition_dir(source, month)
+            keys = set()
+            if os.path.isdir(directory):
+                keys.update(ds.dataset(directory, format="parquet").to_table(columns=["review_key"])
+                            .column("review_key").to_pylist())
+            self._keys[part] = keys
+        return self._keys[part]
+
+    # -------------------------
+    # Writes
+    # -------------------------
+    def append(self, reviews: list[dict], ccn: str = None, place_id: str = None, profile_key: str = None,
+               flush: bool = False) -> int:
+        """
+        Queue reviews ({"source", "author", "rating", "text", "time"}) for one facility.
+        Returns how many were new; they are written once flush_rows are pending (or now with flush).
+        """
+        now = pd.Timestamp.now(tz="UTC")
+        profile_key = profile_key or (str(ccn) if ccn else None)
+        facility = review_facility(ccn, place_id, profile_key)
+        reviews = [r for r in reviews if r.get("text")]
+        dates = _review_dates([r.get("time") for r in reviews])
+        added = 0
+        with self._lock:
+            for r, date in zip(reviews, dates):
+                key = review_hash(facility, r["source"], r.get("author"), r["text"])
+                month = date.strftime("%Y-%m") if date is not None else UNKNOWN_MONTH
+                stored = self._stored_keys(r["source"], month)
+                if key in stored:
+                    continue
+                stored.add(key)
+                self._pending[(r["source"], month)].append({
+                    "review_key": key,
+                    "profile_key": profile_key,
+                    "ccn": str(ccn) if ccn else None,
+                    "place_id": place_id,
+                    "author": r.get("author"),
+                    "rating": float(r["rating"]) if r.get("rating") is not None else None,
+                    "text": r["text"],
+                    "review_time": str(r["time"]) if r.get("time") is not None else None,
+                    "review_date": date,
+                    "first_seen": now,
+                })
+                added += 1
+            pending = sum(len(rows) for rows in self._pending.values())
+        if flush or pending >= self.flush_rows:
+            self.flush()
+        return added
+
+    def append_record(self, record: dict, profile_key: str = None, flush: bool = False) -> int:
+        """Queue the Google and Yelp reviews of a profile record (nested fields may be JSON strings)."""
+        record = {k: json.loads(v) if k in ("place", "google_reviews", "yelp_reviews") and isinstance(v, str) else v
+                  for k, v in record.items()}
+        place = record.get("place") or {}
+        return self.append(normalize_reviews(record), ccn=record.get("ccn"), place_id=place.get("place_id"),
+                           profile_key=profile_key, flush=flush)
+
+    def load_parquet(self, path: str, batch_size: int = 500) -> int:
+        """Append the reviews in a batch/bulk Parquet dataset; returns how many were new."""
+        columns = ["ccn", "place", "google_reviews", "yelp_reviews"]
+        added = 0
+        for batch in ds.dataset(path, format="parquet").to_batches(columns=columns, batch_size=batch_size):
+            for record in batch.to_pylist():
+                added += self.append_record(record)
+        self.flush()
+        return added
+
+    def flush(self) -> int:
+        """
+        Write pending reviews, one new part file per partition. Returns rows written.
+        A partition reaching REVIEW_COMPACT_FILES part files is compacted right away, so
+        small per-search flushes (the app) do not pile up between bulk merges.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+        written = 0
+        for (source, month), rows in pending.items():
+            directory = self._partition_dir(source, month)
+            os.makedirs(directory, exist_ok=True)
+            table = pa.Table.from_pylist(rows, schema=FILE_SCHEMA)
+            table = table.sort_by([("ccn", "ascending"), ("review_date", "ascending")])
+            _write_part(table, directory, f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet")
+            written += len(rows)
+            self._compact_partition(directory, settings.REVIEW_COMPACT_FILES)
+        return written
+
+    @staticmethod
+    def _compact_partition(directory: str, min_files: int) -> bool:
+        """Rewrite a partition's part files as one CCN-sorted file once it holds min_files."""
+        parts = sorted(f for f in os.listdir(directory) if f.endswith(".parquet"))
+        if len(parts) < min_files:
+            return False
+        table = ds.dataset([os.path.join(directory, f) for f in parts], format="parquet",
+                           schema=FILE_SCHEMA).to_table()
+        df = table.to_pandas().drop_duplicates("review_key", keep="first")
+        table = pa.Table.from_pandas(df, schema=FILE_SCHEMA, preserve_index=False)
+        table = table.sort_by([("ccn", "ascending"), ("review_date", "ascending")])
+        _write_part(table, directory, f"part-{time.time_ns()}-compacted.parquet")
+        for f in parts:
+            os.remove(os.path.join(directory, f))
+        return True
+
+    def compact(self, min_files: int = None) -> int:
+        """
+        Rewrite partitions holding at least min_files part files as a single CCN-sorted file
+        (also dropping duplicate keys written concurrently by separate processes).
+        Returns the number of partitions compacted.
+        """
+        min_files = min_files or settings.REVIEW_COMPACT_FILES
+        self.flush()
+        compacted = 0
+        for source_dir in sorted(os.listdir(self.root)):
+            for month_dir in sorted(os.listdir(os.path.join(self.root, source_dir))):
+                compacted += self._compact_partition(os.path.join(self.root, source_dir, month_dir), min_files)
+        return compacted
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def dataset(self) -> ds.Dataset:
+        return ds.dataset(self.root, format="parquet", partitioning=PARTITIONING,
+                          schema=FILE_SCHEMA.append(pa.field("source", pa.string())).append(pa.field("month", pa.string())))
+
+    @staticmethod
+    def _filter(ccn=None, source=None, since=None, until=None):
+        """Dataset filter: source/month prune partitions, ccn/date use Parquet row-group stats."""
+        expr = None
+        def both(a, b):
+            return b if a is None else a & b
+        if ccn is not None:
+            ccns = [str(c) for c in ccn] if isinstance(ccn, (list, tuple, set)) else [str(ccn)]
+            expr = both(expr, ds.field("ccn").isin(ccns))
+        if source:
+            expr = both(expr, ds.field("source") == source)
+        if since is not None:
+            since = _utc(since)
+            expr = both(expr, (ds.field("month") >= since.strftime("%Y-%m")) & (ds.field("month") != UNKNOWN_MONTH))
+            expr = both(expr, ds.field("review_date") >= pa.scalar(since.to_pydatetime(), pa.timestamp("us", tz="UTC")))
+        if until is not None:
+            until = _utc(until)
+            expr = both(expr, ds.field("month") <= until.strftime("%Y-%m"))
+            expr = both(expr, ds.field("review_date") < pa.scalar(until.to_pydatetime(), pa.timestamp("us", tz="UTC")))
+        return expr
+
+    def scan(self, ccn=None, source: str = None, since=None, until=None, columns: list = None) -> pa.Table:
+        """Stored reviews matching the filters as an Arrow table (only the requested columns are read)."""
+        if not os.listdir(self.root):
+            return FILE_SCHEMA.empty_table()
+        return self.dataset().to_table(columns=columns, filter=self._filter(ccn, source, since, until))
+
+    def history(self, ccn, source: str = None, since=None, until=None) -> pd.DataFrame:
+        """One facility's reviews, oldest first."""
+        table = self.scan(ccn, source, since, until,
+                          columns=["source", "month", "review_date", "author", "rating", "text", "first_seen"])
+        return table.to_pandas().sort_values(["review_date", "first_seen"], na_position="first", ignore_index=True)
+
+    def rating_trends(self, ccn=None, source: str = None, since=None, until=None) -> pd.DataFrame:
+        """Review count and mean rating per facility, source and month, aggregated in Arrow."""
+        table = self.scan(ccn, source, since, until, columns=["ccn", "source", "month", "rating"])
+        if table.num_rows == 0:
+            return pd.DataFrame(columns=["ccn", "source", "month", "reviews", "mean_rating"])
+        table = table.filter(pc.is_valid(table["rating"]))
+        trends = table.group_by(["ccn", "source", "month"]).aggregate([("rating", "count"), ("rating", "mean")])
+        df = trends.to_pandas().rename(columns={"rating_count": "reviews", "rating_mean": "mean_rating"})
+        return df[["ccn", "source", "month", "reviews", "mean_rating"]].sort_values(["ccn", "source", "month"],
+                                                                                   ignore_index=True)
+
+@st.cache_resource
+def get_review_store() -> ReviewStore:
+    """Single ReviewStore per process."""
+    return ReviewStore()
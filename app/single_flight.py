@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger("single_flight")
+
+class SingleFlight:
+    """
+    Process-wide request coalescing: while a call for a key is in flight, identical
+    calls (from any thread, session or event loop) wait for it and share its result
+    or exception instead of running again.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """(future, is_leader) for key."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, False
+            fut = self._inflight[key] = Future()
+            self.executed += 1
+            return fut, True
+
+    def _finish(self, key, fut, result=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def do(self, key, fn):
+        """Run fn() once per key at a time; concurrent callers block on the leader's result."""
+        fut, leader = self._join(key)
+        if not leader:
+            return fut.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, fut, error=e)
+            raise
+        self._finish(key, fut, result)
+        return result
+
+    async def ado(self, key, coro_fn):
+        """
+        Async variant: await coro_fn() once per key at a time.
+        Followers are shielded, so cancelling one never cancels the shared call.
+        If the leader itself is cancelled, a follower retries and becomes the new leader.
+        """
+        while True:
+            fut, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return await asyncio.shield(asyncio.wrap_future(fut))
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.cancel()
+            raise
+        except BaseException as e:
+            self._finish(key, fut, error=e)
+            raise
+        self._finish(key, fut, result)
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": self.in_flight()}
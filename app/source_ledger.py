@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import streamlit as st
+
+from config import settings
+
+logger = logging.getLogger("source_ledger")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile_sources (
+    profile_key TEXT NOT NULL,
+    source TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    changed_at REAL NOT NULL,
+    content_hash TEXT NOT NULL,
+    input_hash TEXT,
+    value TEXT,
+    PRIMARY KEY (profile_key, source)
+);
+"""
+
+def content_hash(value) -> str:
+    """Stable hash of a JSON-serializable value (key order does not matter)."""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+class SourceLedger:
+    """
+    Per-profile, per-source record of when each source was last fetched, the hash of
+    what it returned (and when that last changed), and the hash of the inputs it was
+    fetched for. Incremental runs reuse a stored value while it is within its TTL and
+    its inputs (CMS row, website URL, ...) are unchanged.
+    """
+
+    def __init__(self, path: str = None, ttls: dict = None, auxiliary=None):
+        self.path = path or settings.SOURCE_LEDGER_PATH
+        self.ttls = settings.SOURCE_TTLS if ttls is None else ttls
+        self.auxiliary = set(settings.SOURCE_AUXILIARY if auxiliary is None else auxiliary)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {"reused": 0, "fetched": 0, "changed": 0}
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def get(self, profile_key: str, source: str):
+        row = self._conn().execute(
+            "SELECT fetched_at, changed_at, content_hash, input_hash, value FROM profile_sources "
+            "WHERE profile_key = ? AND source = ?", (profile_key, source),
+        ).fetchone()
+        if row is None:
+            return None
+        fetched_at, changed_at, digest, input_hash, value = row
+        return {"fetched_at": fetched_at, "changed_at": changed_at, "hash": digest,
+                "input_hash": input_hash, "value": json.loads(value) if value is not None else None}
+
+    def is_fresh(self, entry, source: str, input_hash: str = None, now: float = None) -> bool:
+        """Stored entry is within the source's TTL and was fetched for the same inputs."""
+        if entry is None:
+            return False
+        if input_hash is not None and entry["input_hash"] != input_hash:
+            return False
+        return (now or time.time()) - entry["fetched_at"] < self.ttls.get(source, 0)
+
+    def reuse(self, profile_key: str, source: str, input_hash: str = None):
+        """(True, stored value) if the source can be reused, else (False, None)."""
+        entry = self.get(profile_key, source)
+        if self.is_fresh(entry, source, input_hash):
+            self._count("reused")
+            return True, entry["value"]
+        return False, None
+
+    def put(self, profile_key: str, source: str, value, input_hash: str = None, store_value: bool = True) -> bool:
+        """Record a fetch; returns True when the content differs from the previous fetch."""
+        now = time.time()
+        digest = content_hash(value)
+        conn = self._conn()
+        with conn:
+            row = conn.execute(
+                "SELECT content_hash, changed_at FROM profile_sources WHERE profile_key = ? AND source = ?",
+                (profile_key, source),
+            ).fetchone()
+            changed = row is None or row[0] != digest
+            conn.execute(
+                "INSERT OR REPLACE INTO profile_sources VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (profile_key, source, now, now if changed else row[1], digest, input_hash,
+                 json.dumps(value, default=str) if store_value else None),
+            )
+        self._count("fetched")
+        if changed:
+            self._count("changed")
+        return changed
+
+    def summary(self, profile_key: str) -> dict:
+        """{source: {"fetched_at", "changed_at", "hash"}} for one profile."""
+        rows = self._conn().execute(
+            "SELECT source, fetched_at, changed_at, content_hash FROM profile_sources WHERE profile_key = ?",
+            (profile_key,),
+        ).fetchall()
+        return {s: {"fetched_at": f, "changed_at": c, "hash": h} for s, f, c, h in rows}
+
+    def due(self, profile_key: str, cms_hash: str = None, sources=None, now: float = None) -> list[str]:
+        """
+        Sources due for this profile now: recorded ones past their TTL, plus "cms" when
+        cms_hash differs from the recorded CMS row (the run then re-fetches only the sources
+        whose inputs that change touches). [] means the stored profile is current.
+        Auxiliary sources never make a profile due, and neither do sources with no record
+        (not used for this profile, or failed, in which case its row is retried as partial).
+        """
+        now = now or time.time()
+        sources = [s for s in (sources or self.ttls) if s not in self.auxiliary]
+        known = {
+            s: (f, h) for s, f, h in self._conn().execute(
+                "SELECT source, fetched_at, content_hash FROM profile_sources WHERE profile_key = ?", (profile_key,),
+            ).fetchall()
+        }
+        due = [s for s in sources if s in known and now - known[s][0] >= self.ttls.get(s, 0)]
+        if cms_hash is not None and known.get("cms", (None, None))[1] != cms_hash:
+            due.insert(0, "cms")
+        return due
+
+@st.cache_resource
+def get_source_ledger() -> SourceLedger:
+    """Single SourceLedger per process."""
+    return SourceLedger()
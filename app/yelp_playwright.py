@@ -1,62 +1,78 @@
-from playwright.sync_api import sync_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeout
+import asyncio
 import logging
-import time
+
+from async_runtime import run_async
+from browser_pool import get_browser_pool
+from data_sources.yelp_json import extract_yelp_reviews_json
 
 logging.basicConfig(level=logging.INFO)
 
-def fetch_yelp_reviews_scroll(url: str, limit: int = 20) -> list[dict]:
+REVIEW_SELECTOR = "div.review__09f24__oHr9V"
+
+# Runs once in the page over all review nodes (no per-node round trips)
+EXTRACT_REVIEWS_JS = """
+(divs, limit) => divs.slice(0, limit).map(div => {
+    const text = div.querySelector("span.raw__09f24__T4Ezm");
+    const user = div.querySelector("span.fs-block.css-m6anxm");
+    const stars = div.querySelector("div.i-stars__09f24__foihJ, div[role='img'][aria-label*='star rating']");
+    const rating = stars ? parseFloat((stars.getAttribute("aria-label") || "").split(" ")[0]) : NaN;
+    return {
+        user: user ? user.innerText.trim() : "Anonymous",
+        rating: isNaN(rating) ? null : rating,
+        text: text ? text.innerText.trim() : "",
+    };
+})
+"""
+
+async def afetch_yelp_reviews_scroll(url: str, limit: int = 20, timeout: float = 30) -> list[dict]:
     """
-    Scrape Yelp reviews from a business page using Playwright with scrolling.
-    Returns list of dicts: {"user", "rating", "text"}.
+    Scrape Yelp reviews from a business page in a pooled browser. The page's embedded
+    review JSON is used when it already holds limit reviews; otherwise it scrolls until
+    limit reviews are on the page or no more load, waiting for new review nodes to
+    appear rather than sleeping. Returns list of dicts: {"user", "rating", "text"} (+ "id",
+    "date" when decoded from JSON).
     """
-    reviews = []
-
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.goto(url, timeout=60000)
-            
-            # Scroll down to load more reviews
-            previous_height = None
-            while len(reviews) < limit:
-                page.evaluate("window.scrollBy(0, document.body.scrollHeight)")
-                time.sleep(2)  # wait for new reviews to load
-                current_height = page.evaluate("document.body.scrollHeight")
-                if current_height == previous_height:
-                    break  # no more content
-                previous_height = current_height
-
-                review_divs = page.query_selector_all("div.review__09f24__oHr9V")
-                for div in review_divs[len(reviews):]:  # only new reviews
-                    text_tag = div.query_selector("span.raw__09f24__T4Ezm")
-                    text = text_tag.inner_text().strip() if text_tag else ""
-
-                    user_tag = div.query_selector("span.fs-block.css-m6anxm")
-                    user = user_tag.inner_text().strip() if user_tag else "Anonymous"
+        async with get_browser_pool().page() as page:
+            await page.goto(url, wait_until="domcontentloaded", timeout=timeout * 1000)
+            embedded = extract_yelp_reviews_json(await page.content(), limit)
+            if len(embedded) >= limit:
+                return embedded
+            await page.wait_for_selector(REVIEW_SELECTOR, timeout=10000)
 
-                    rating_tag = div.query_selector("div.i-stars__09f24__foihJ")
-                    rating = None
-                    if rating_tag:
-                        aria_label = rating_tag.get_attribute("aria-label")
-                        if aria_label:
-                            try:
-                                rating = float(aria_label.split(" ")[0])
-                            except:
-                                pass
-
-                    reviews.append({"user": user, "rating": rating, "text": text})
-                    if len(reviews) >= limit:
-                        break
-
-            browser.close()
+            while True:
+                count = await page.locator(REVIEW_SELECTOR).count()
+                if count >= limit:
+                    break
+                await page.evaluate("window.scrollBy(0, document.body.scrollHeight)")
+                try:
+                    await page.wait_for_function(
+                        "([sel, n]) => document.querySelectorAll(sel).length > n",
+                        arg=[REVIEW_SELECTOR, count], timeout=5000,
+                    )
+                except PlaywrightTimeout:
+                    break  # no more content
 
-        return reviews[:limit]
+            return await page.eval_on_selector_all(REVIEW_SELECTOR, EXTRACT_REVIEWS_JS, limit)
 
     except Exception as e:
         logging.warning(f"[Playwright Yelp Scroll Error] {e}")
         return []
 
+async def afetch_yelp_reviews_scroll_many(urls: list[str], limit: int = 20) -> dict:
+    """Scroll-scrape several business pages in parallel (bounded by the pool's page slots)."""
+    results = await asyncio.gather(*(afetch_yelp_reviews_scroll(url, limit) for url in urls))
+    return dict(zip(urls, results))
+
+def fetch_yelp_reviews_scroll(url: str, limit: int = 20) -> list[dict]:
+    """Blocking wrapper: runs the scrape on the shared background loop."""
+    return run_async(afetch_yelp_reviews_scroll(url, limit))
+
+def fetch_yelp_reviews_scroll_many(urls: list[str], limit: int = 20) -> dict:
+    """Blocking wrapper for afetch_yelp_reviews_scroll_many: {url: reviews}."""
+    return run_async(afetch_yelp_reviews_scroll_many(urls, limit))
+
 # Example usage
 if __name__ == "__main__":
     url = "https://www.yelp.com/biz/nyu-langone-medical-center-new-york-3#reviews"